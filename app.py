@@ -17,7 +17,9 @@ async def on_startup(dp):
     from loguru import logger
     import time
     from utils.watchdog import Watchdog
+    from database.migrations import run_migrations
 
+    run_migrations()
     middlewares.setup(dp)
     await set_commands(dp)
     handlers.setup(dp)
@@ -29,14 +31,45 @@ async def on_startup(dp):
         compression="zip",
     )
 
-    daemon = Watchdog()
-    daemon.run()
+    # parse server config and seed peer address pools before first request
+    from loader import vpn_config
+
+    await vpn_config.get_registry()
+    vpn_config.key_pool.start()
+
+    from utils.broadcast import broadcasts
+
+    await broadcasts.resume()
+
+    # kept on dispatcher, so on_shutdown can stop it
+    dp["watchdog"] = Watchdog()
+    dp["watchdog"].run()
     logger.success("[+] Bot started successfully")
 
 
+async def on_shutdown(dp):
+    import database
+    from database import aio
+    from loader import vpn_config
+    from utils.qr_code import qr_render_pool
+    from utils.broadcast import broadcasts
+
+    if "watchdog" in dp.data:
+        await dp["watchdog"].stop()
+    await broadcasts.shutdown()
+    qr_render_pool.shutdown()
+    await vpn_config.key_pool.stop()
+    await vpn_config.changes.flush()
+    await vpn_config.writer.close()
+    await aio.close_pool()
+    database.close_pool()
+
+
 if __name__ == "__main__":
     # Launch
     from aiogram import executor
     from handlers import dp
 
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    executor.start_polling(
+        dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown
+    )
@@ -61,59 +61,18 @@ def check_database_connection():
         print_error(f"Database connection failed: {e}")
         return False
 
-def create_database_migrations():
-    """Create database migration script"""
-    migration_sql = """
--- Migration: Add bot blocking protection tables
--- This is safe to run multiple times
-
--- Create banned_users table if it doesn't exist
-CREATE TABLE IF NOT EXISTS banned_users (
-    user_id BIGINT PRIMARY KEY,
-    banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    reason TEXT DEFAULT 'Bot blocked by user'
-);
-
--- Create index for faster lookups
-CREATE INDEX IF NOT EXISTS idx_banned_users_user_id ON banned_users(user_id);
-
--- Add comment
-COMMENT ON TABLE banned_users IS 'Users who are permanently banned from the bot';
-
--- Show current state
-SELECT 'Migration completed successfully' as status;
-"""
-    
-    with open('database_migration.sql', 'w') as f:
-        f.write(migration_sql)
-    
-    print_status("Database migration script created: database_migration.sql")
-
 def apply_database_migration():
-    """Apply database migration"""
-    print_status("Applying database migration...")
+    """Apply pending versioned migrations from database/migrations.py"""
+    print_status("Applying database migrations...")
     
     try:
-        import psycopg2
-        from data.config import Config
+        from database.migrations import run_migrations
         
-        config = Config()
-        db_params = config.db_connection_parameters
-        
-        conn = psycopg2.connect(**db_params)
-        cursor = conn.cursor()
-        
-        # Read and execute migration
-        with open('database_migration.sql', 'r') as f:
-            migration_sql = f.read()
-        
-        cursor.execute(migration_sql)
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
-        
-        print_status("Database migration applied successfully")
+        applied = run_migrations()
+        if applied:
+            print_status(f"Applied migrations: {', '.join(map(str, applied))}")
+        else:
+            print_status("Database schema is already up to date")
         return True
         
     except Exception as e:
@@ -226,15 +185,12 @@ def main():
     # Step 3: Backup original files
     backup_original_files()
     
-    # Step 4: Create database migration
-    create_database_migrations()
-    
-    # Step 5: Apply database migration
+    # Step 4: Apply database migrations
     if not apply_database_migration():
         print_error("Database migration failed")
         sys.exit(1)
     
-    # Step 6: Apply code updates
+    # Step 5: Apply code updates
     updates_applied = update_files()
     
     print()
@@ -21,7 +21,24 @@ class Config:
             self._get_base_subscription_monthly_price_rubles()
         )
         self._db_connection_parameters = self._get_db_connection_parameters()
+        self._db_pool_parameters = self._get_db_pool_parameters()
+        self._user_cache_parameters = self._get_user_cache_parameters()
         self._peer_dns = self._get_peer_dns()
+        self._wg_address_pools = self._get_wg_address_pools()
+        self._wg_apply_parameters = self._get_wg_apply_parameters()
+        self._key_pool_parameters = self._get_key_pool_parameters()
+        self._wg_config_backups = int(os.getenv("WG_CONFIG_BACKUPS", 3))
+        self._wg_compact_after_days = int(os.getenv("WG_COMPACT_AFTER_DAYS", 30))
+        self._reconcile_parameters = self._get_reconcile_parameters()
+        self._qr_cache_parameters = self._get_qr_cache_parameters()
+        self._qr_render_parameters = {
+            "workers": int(os.getenv("QR_RENDER_WORKERS", 2)),
+            "max_queue": int(os.getenv("QR_RENDER_MAX_QUEUE", 32)),
+        }
+        self._telegram_rate_parameters = self._get_telegram_rate_parameters()
+        self._broadcast_workers = int(os.getenv("BROADCAST_WORKERS", 8))
+        self._watchdog_concurrency = int(os.getenv("WATCHDOG_CONCURRENCY", 16))
+        self._watchdog_sweep_minutes = int(os.getenv("WATCHDOG_SWEEP_MINUTES", 5))
 
     @property
     def bot_token(self) -> str:
@@ -47,10 +64,66 @@ class Config:
     def db_connection_parameters(self) -> dict:
         return self._db_connection_parameters
 
+    @property
+    def db_pool_parameters(self) -> dict:
+        return self._db_pool_parameters
+
+    @property
+    def user_cache_parameters(self) -> dict:
+        return self._user_cache_parameters
+
     @property
     def peer_dns(self) -> str:
         return self._peer_dns
 
+    @property
+    def wg_address_pools(self) -> list[str]:
+        return self._wg_address_pools
+
+    @property
+    def wg_apply_parameters(self) -> dict:
+        return self._wg_apply_parameters
+
+    @property
+    def key_pool_parameters(self) -> dict:
+        return self._key_pool_parameters
+
+    @property
+    def wg_config_backups(self) -> int:
+        return self._wg_config_backups
+
+    @property
+    def wg_compact_after_days(self) -> int:
+        return self._wg_compact_after_days
+
+    @property
+    def reconcile_parameters(self) -> dict:
+        return self._reconcile_parameters
+
+    @property
+    def qr_cache_parameters(self) -> dict:
+        return self._qr_cache_parameters
+
+    @property
+    def qr_render_parameters(self) -> dict:
+        return self._qr_render_parameters
+
+    @property
+    def telegram_rate_parameters(self) -> dict:
+        return self._telegram_rate_parameters
+
+    @property
+    def broadcast_workers(self) -> int:
+        return self._broadcast_workers
+
+    @property
+    def watchdog_concurrency(self) -> int:
+        return self._watchdog_concurrency
+
+    @property
+    def watchdog_sweep_minutes(self) -> int:
+        return self._watchdog_sweep_minutes
+
     def _get_bot_token(self) -> str:
         bot_token = os.getenv("WG_BOT_TOKEN")
         if not bot_token:
@@ -92,6 +165,24 @@ class Config:
                 )
         return db_connection_parameters
 
+    def _get_db_pool_parameters(self) -> dict:
+        """pool settings are optional, defaults fit a single small bot instance"""
+        return {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),
+            "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+            "leak_timeout": float(os.getenv("DB_POOL_LEAK_TIMEOUT", 60)),
+            "acquire_timeout": float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10)),
+        }
+
+    def _get_user_cache_parameters(self) -> dict:
+        """USER_CACHE_MAX_SIZE=0 disables the cache"""
+        return {
+            "max_size": int(os.getenv("USER_CACHE_MAX_SIZE", 10000)),
+            "ttl": float(os.getenv("USER_CACHE_TTL", 300)),
+        }
+
     def _get_base_subscription_monthly_price_rubles(self) -> int:
         base_subscription_monthly_price_rubles = os.getenv(
             "BASE_SUBSCRIPTION_MONTHLY_PRICE_RUBLES"
@@ -105,3 +196,62 @@ class Config:
         if not peer_dns:
             raise EnvVariableNotFound("PEER_DNS")
         return peer_dns
+
+    def _get_wg_address_pools(self) -> list[str]:
+        """optional, if empty the subnet of [Interface] Address from wg0.conf is used"""
+        pools = os.getenv("WG_ADDRESS_POOLS", "")
+        return [pool.strip() for pool in pools.split(",") if pool.strip()]
+
+    def _get_wg_apply_parameters(self) -> dict:
+        """how peer changes reach the running interface (WG_BACKEND):
+        wg-quick - restart wg-quick service (drops all connected peers)
+        live - update only changed peers with `wg set`, restart is a fallback
+        fake - in-memory interface for tests and benchmarks, no root needed"""
+        backend = os.getenv("WG_BACKEND", "wg-quick").lower()
+        if backend not in ("wg-quick", "live", "fake"):
+            raise ValueError(f"WG_BACKEND must be 'wg-quick', 'live' or 'fake', got '{backend}'")
+        return {
+            "backend": backend,
+            "interface": os.getenv("WG_INTERFACE", "wg0"),
+            "binary": os.getenv("WG_BINARY", "wg"),
+            "sudo": os.getenv("WG_USE_SUDO", "true").lower() in ("1", "true", "yes"),
+            "timeout": float(os.getenv("WG_COMMAND_TIMEOUT", 10)),
+            "concurrency": int(os.getenv("WG_COMMAND_CONCURRENCY", 4)),
+            "debounce": float(os.getenv("WG_APPLY_DEBOUNCE_MS", 200)) / 1000,
+        }
+
+    def _get_key_pool_parameters(self) -> dict:
+        """KEY_POOL_SIZE=0 disables pre-generation, keys are generated on demand"""
+        return {
+            "size": int(os.getenv("KEY_POOL_SIZE", 32)),
+            "low_watermark": int(os.getenv("KEY_POOL_LOW_WATERMARK", 8)),
+            "with_preshared": os.getenv("KEY_POOL_PRESHARED_KEYS", "false").lower()
+            in ("1", "true", "yes"),
+        }
+
+    def _get_reconcile_parameters(self) -> dict:
+        """scheduled reconcile of database, wg0.conf and interface, interval 0 disables it"""
+        return {
+            "interval_minutes": int(os.getenv("WG_RECONCILE_INTERVAL_MINUTES", 60)),
+            "apply": os.getenv("WG_RECONCILE_APPLY", "false").lower() in ("1", "true", "yes"),
+            "disable_orphans": os.getenv("WG_RECONCILE_DISABLE_ORPHANS", "false").lower()
+            in ("1", "true", "yes"),
+        }
+
+    def _get_qr_cache_parameters(self) -> dict:
+        """QR_CACHE_DIR is optional, without it images are cached in memory only"""
+        return {
+            "max_bytes": int(os.getenv("QR_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+            "directory": os.getenv("QR_CACHE_DIR") or None,
+            "disk_max_bytes": int(os.getenv("QR_CACHE_DIR_MAX_BYTES", 256 * 1024 * 1024)),
+            "disk_max_files": int(os.getenv("QR_CACHE_DIR_MAX_FILES", 20000)),
+        }
+
+    def _get_telegram_rate_parameters(self) -> dict:
+        """Telegram allows about 30 messages per second to different chats and
+        one message per second to the same chat"""
+        return {
+            "rate": float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", 25)),
+            "chat_interval": int(os.getenv("TELEGRAM_CHAT_INTERVAL_MS", 1000)) / 1000,
+            "retries": int(os.getenv("TELEGRAM_SEND_RETRIES", 3)),
+        }
@@ -1,3 +1,6 @@
 from .insert import *
 from .selector import *
 from .update import *
+from .pool import close_pool, pool_stats
+from .models import StoredPeer, UserSnapshot
+from .cache import cache_stats
@@ -0,0 +1,11 @@
+"""Awaitable variant of the database package API backed by asyncpg
+
+Function names and return values match the synchronous modules,
+use it from handlers so queries don't block the event loop.
+"""
+
+from . import insert, selector, update
+from .insert import *
+from .selector import *
+from .update import *
+from .pool import close_pool, pool_stats
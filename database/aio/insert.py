@@ -0,0 +1,193 @@
+import asyncpg
+from loguru import logger
+from aiogram.types import Message
+from datetime import datetime
+from database.aio.pool import get_pool
+from database.cache import user_cache
+from database.models import StoredPeer
+
+
+async def insert_new_user(message: Message) -> None:
+    """Insert new user in table users if he is not in database"""
+    try:
+        pool = await get_pool()
+        await pool.execute(
+            """--sql
+            INSERT INTO users(user_id, username)
+            VALUES ($1, $2)
+            ON CONFLICT (user_id) DO NOTHING
+            """,
+            message.from_user.id,
+            message.from_user.username,
+        )
+        logger.success(f"[+] User {message.from_user.username} added to database")
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+    finally:
+        user_cache.invalidate_user(message.from_user.id)
+
+
+async def insert_new_payment(message: Message) -> None:
+    """Insert new payment in table payment"""
+    try:
+        pool = await get_pool()
+        await pool.execute(
+            """--sql
+            INSERT INTO payment(user_id, date, amount)
+            VALUES ($1, $2, $3)
+            """,
+            message.from_user.id,
+            datetime.now(),
+            message.successful_payment.total_amount,
+        )
+        logger.success(
+            f"[+] Payment {message.successful_payment.invoice_payload} added to database"
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+
+
+async def insert_new_config(user_id: int, peer: StoredPeer) -> None:
+    """Insert per-peer fields of new config in table vpn_config"""
+    try:
+        pool = await get_pool()
+        await pool.execute(
+            """--sql
+            INSERT INTO vpn_config(user_id, config_name, device, private_key,
+                public_key, address, preshared_key)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            """,
+            user_id,
+            peer.config_name,
+            peer.device,
+            peer.private_key,
+            peer.public_key,
+            peer.address,
+            peer.preshared_key,
+        )
+        logger.success(f"[+] Config {peer.config_name} added to database")
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def archive_peers(peers: list[tuple]) -> bool:
+    """Insert peers compacted out of server config in table archived_peers
+
+    Args:
+        peers (list[tuple]): (name, user_id, username, public_key, address, block)
+
+    Returns:
+        bool: True if all peers were archived, nothing is archived otherwise
+    """
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn, conn.transaction():
+            await conn.executemany(
+                """--sql
+                INSERT INTO archived_peers(name, user_id, username, public_key, address, block)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (name) DO UPDATE SET
+                    user_id = EXCLUDED.user_id,
+                    username = EXCLUDED.username,
+                    public_key = EXCLUDED.public_key,
+                    address = EXCLUDED.address,
+                    block = EXCLUDED.block,
+                    archived_at = now()
+                """,
+                peers,
+            )
+        return True
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def save_telegram_file_id(content_hash: str, kind: str, file_id: str) -> None:
+    """Remember file_id of uploaded document or photo"""
+    try:
+        pool = await get_pool()
+        await pool.execute(
+            """--sql
+            INSERT INTO telegram_files(content_hash, kind, file_id)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (content_hash, kind) DO UPDATE SET
+                file_id = EXCLUDED.file_id, created_at = now()
+            """,
+            content_hash,
+            kind,
+            file_id,
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+
+
+# recipients of broadcast, banned users are never included
+BROADCAST_AUDIENCES = {
+    "all": "TRUE",
+    "active": "subscription_end_date >= now()",
+    "expired": "subscription_end_date < now()",
+}
+
+
+async def create_broadcast(text: str, audience: str, created_by: int) -> int | None:
+    """Create broadcast with a pending row for every recipient
+
+    Returns:
+        int | None: id of broadcast, None if it could not be created
+    """
+    try:
+        condition = BROADCAST_AUDIENCES[audience]
+        pool = await get_pool()
+        async with pool.acquire() as conn, conn.transaction():
+            broadcast_id = await conn.fetchval(
+                """--sql
+                INSERT INTO broadcasts(text, audience, created_by)
+                VALUES ($1, $2, $3) RETURNING id
+                """,
+                text,
+                audience,
+                created_by,
+            )
+            await conn.execute(
+                f"""--sql
+                INSERT INTO broadcast_recipients(broadcast_id, user_id)
+                SELECT $1, user_id FROM users
+                WHERE user_id IS NOT NULL AND is_banned IS NOT TRUE AND {condition}
+                """,
+                broadcast_id,
+            )
+        return broadcast_id
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+
+
+async def claim_notifications(
+    notifications: list[tuple[int, int, datetime]]
+) -> set[tuple[int, int]] | None:
+    """Record (user_id, bucket, end_date) in notification ledger before sending,
+    so concurrent jobs never send the same notification twice
+
+    Returns:
+        set[tuple[int, int]] | None: (user_id, bucket) that were not recorded yet
+        and should be sent, None if ledger is unavailable
+    """
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            INSERT INTO subscription_notifications(user_id, bucket, end_date)
+            SELECT * FROM unnest($1::bigint[], $2::smallint[], $3::timestamp[])
+            ON CONFLICT DO NOTHING
+            RETURNING user_id, bucket
+            """,
+            [user_id for user_id, _, _ in notifications],
+            [bucket for _, bucket, _ in notifications],
+            [end_date for _, _, end_date in notifications],
+        )
+        return {(record["user_id"], record["bucket"]) for record in records}
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
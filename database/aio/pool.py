@@ -0,0 +1,74 @@
+"""asyncpg connection pool for the awaitable database API"""
+
+import asyncio
+
+import asyncpg
+from loguru import logger
+from data import configuration
+
+_pool: asyncpg.Pool | None = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool() -> asyncpg.Pool:
+    """Returns process-wide asyncpg pool, it is created on first use"""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                parameters = dict(configuration.db_connection_parameters)
+                parameters["port"] = int(parameters["port"])
+                pool_parameters = configuration.db_pool_parameters
+                _pool = await asyncpg.create_pool(
+                    **parameters,
+                    min_size=pool_parameters["min_size"],
+                    max_size=pool_parameters["max_size"],
+                    # asyncpg has no limit on total connection lifetime, only on idle time
+                    max_inactive_connection_lifetime=pool_parameters["max_idle"],
+                )
+                logger.info(
+                    f"[+] Async database pool created: "
+                    f"min_size={pool_parameters['min_size']}, max_size={pool_parameters['max_size']}"
+                )
+    return _pool
+
+
+def acquire():
+    """Acquire a connection for several statements in one transaction
+
+    Usage:
+        async with acquire() as conn, conn.transaction(): ...
+    """
+    return _Acquire()
+
+
+class _Acquire:
+    async def __aenter__(self) -> asyncpg.Connection:
+        pool = await get_pool()
+        self._pool = pool
+        self._conn = await pool.acquire(
+            timeout=configuration.db_pool_parameters["acquire_timeout"]
+        )
+        return self._conn
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._pool.release(self._conn)
+
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {}
+    return {
+        "min_size": _pool.get_min_size(),
+        "max_size": _pool.get_max_size(),
+        "size": _pool.get_size(),
+        "idle": _pool.get_idle_size(),
+        "in_use": _pool.get_size() - _pool.get_idle_size(),
+    }
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
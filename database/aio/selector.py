@@ -0,0 +1,569 @@
+import asyncpg
+from loguru import logger
+from datetime import datetime, timedelta
+from database.aio.pool import get_pool
+from database.models import StoredPeer, UserSnapshot
+from database.cache import user_cache, MISSING
+
+
+async def is_exist_user(user_id: int) -> bool:
+    """Check if user is exist in database"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "is_exist_user")
+    if cached is not MISSING:
+        return cached
+    try:
+        pool = await get_pool()
+        is_exist = await pool.fetchval(
+            """--sql
+            SELECT EXISTS(SELECT 1 FROM users WHERE user_id = $1)
+            """,
+            user_id,
+        )
+        return user_cache.set(user_id, "is_exist_user", is_exist, generation)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def is_user_have_config(user_id: int) -> bool:
+    """Check if user have config in database"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "is_user_have_config")
+    if cached is not MISSING:
+        return cached
+    try:
+        pool = await get_pool()
+        have_config = await pool.fetchval(
+            """--sql
+            SELECT EXISTS(SELECT 1 FROM vpn_config WHERE user_id = $1)
+            """,
+            user_id,
+        )
+        return user_cache.set(user_id, "is_user_have_config", have_config, generation)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def all_user_configs(user_id: int) -> list[str] | bool:
+    """Get all user configs"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "all_user_configs")
+    if cached is not MISSING:
+        return cached
+    try:
+        pool = await get_pool()
+        configs = await pool.fetch(
+            """--sql
+            SELECT config_name FROM vpn_config WHERE user_id = $1
+            """,
+            user_id,
+        )
+        return user_cache.set(user_id, "all_user_configs", configs, generation)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def _get_subscription_end_datetime(user_id: int) -> datetime:
+    """Get cached raw subscription end date, raises if user not found"""
+    generation = user_cache.generation(user_id)
+    date = user_cache.get(user_id, "subscription_end_date")
+    if date is not MISSING:
+        return date
+    pool = await get_pool()
+    date = await pool.fetchval(
+        """--sql
+        SELECT subscription_end_date FROM users WHERE user_id = $1
+        """,
+        user_id,
+    )
+    if date is None:
+        raise LookupError(f"subscription end date not found for user {user_id}")
+    return user_cache.set(user_id, "subscription_end_date", date, generation)
+
+
+async def is_subscription_end(user_id: int) -> bool:
+    """Check if user subscription is end"""
+    try:
+        return await _get_subscription_end_datetime(user_id) < datetime.now()
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_subscription_end_date(user_id: int) -> datetime | bool:
+    """Get user subscription end date"""
+    try:
+        date = await _get_subscription_end_datetime(user_id)
+        # return date in format: day-month-year
+        return date.strftime("%d-%m-%Y")
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_user_peer(user_id: int, config_name: str) -> StoredPeer | None:
+    """Get stored fields of user config, render it with vpn_config.render_config()"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, f"get_user_peer:{config_name}")
+    if cached is not MISSING:
+        return cached
+    try:
+        pool = await get_pool()
+        row = await pool.fetchrow(
+            """--sql
+            SELECT config_name, device, private_key, public_key, address,
+                preshared_key, config
+            FROM vpn_config WHERE user_id = $1 AND config_name = $2
+            """,
+            user_id,
+            config_name,
+        )
+        if row is None:
+            raise LookupError(f"config {config_name} not found for user {user_id}")
+        return user_cache.set(user_id, f"get_user_peer:{config_name}", StoredPeer(*row), generation)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+
+
+async def get_all_usernames_and_enddate() -> list | bool:
+    """Get all usernames and subscription end date"""
+    try:
+        pool = await get_pool()
+        return await pool.fetch(
+            """--sql
+            SELECT username, subscription_end_date FROM users
+            """
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_user_ids_and_enddate() -> list | bool:
+    """Get all user_ids and subscription end date"""
+    try:
+        pool = await get_pool()
+        return await pool.fetch(
+            """--sql
+            SELECT user_id, subscription_end_date FROM users
+            """
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_user_id(username: str) -> int:
+    """Get user id"""
+    try:
+        pool = await get_pool()
+        user_id = await pool.fetchval(
+            """--sql
+            SELECT user_id FROM users WHERE username = $1
+            """,
+            username,
+        )
+        return user_id if user_id is not None else False
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_all_user_ids() -> list[int] | bool:
+    """Get all user ids"""
+    try:
+        pool = await get_pool()
+        return await pool.fetch(
+            """--sql
+            SELECT user_id FROM users
+            """
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_user_ids_enddate_n_days(days: int) -> list[int] | bool:
+    """Get user ids where subscription ends in N days
+    don't watch at hours, minutes, seconds, milliseconds
+    """
+    match days:
+        case 0:
+            shift = timedelta(days=1)
+        case -1:
+            shift = timedelta(days=2)
+        case _:
+            shift = timedelta(days=0)
+
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            SELECT user_id FROM users WHERE subscription_end_date BETWEEN $1 AND $2
+            """,
+            datetime.now() - shift,
+            datetime.now() + timedelta(days=days),
+        )
+        return [record[0] for record in records]
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_username_by_id(user_id: int) -> str | bool:
+    """Get username by user id"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "get_username_by_id")
+    if cached is not MISSING:
+        return cached
+    try:
+        pool = await get_pool()
+        username = await pool.fetchval(
+            """--sql
+            SELECT username FROM users WHERE user_id = $1
+            """,
+            user_id,
+        )
+        return user_cache.set(
+            user_id, "get_username_by_id", username if username is not None else False, generation
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_user_end_dates_between(start: datetime, end: datetime) -> list[tuple[int, datetime]]:
+    """Get (user_id, subscription_end_date) of not banned users whose
+    subscription ends after start and not later than end"""
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            SELECT user_id, subscription_end_date FROM users
+            WHERE subscription_end_date > $1 AND subscription_end_date <= $2
+                AND is_banned IS NOT TRUE
+            """,
+            start,
+            end,
+        )
+        return [(record["user_id"], record["subscription_end_date"]) for record in records]
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return []
+
+
+async def get_due_notifications(
+    buckets: dict[int, timedelta], expired_within: timedelta
+) -> list[tuple[int, int, datetime]]:
+    """Get (user_id, bucket, subscription_end_date) of users to notify, in one query
+
+    Args:
+        buckets (dict[int, timedelta]): bucket -> how long before the end it starts,
+            user gets the bucket with the shortest interval that still covers the end
+        expired_within (timedelta): users expired this long ago get bucket -1
+
+    Users already recorded in subscription_notifications for the bucket and
+    the same end date are skipped, banned users are never returned.
+    """
+    ordered = sorted(buckets.items(), key=lambda item: item[1])
+    # $1 - now, $2 - expired_within, then bucket and interval pairs
+    cases = "".join(
+        f" WHEN subscription_end_date <= $1 + ${3 + i * 2}::interval THEN ${4 + i * 2}::smallint"
+        for i in range(len(ordered))
+    )
+    params = [value for bucket, before in ordered for value in (before, bucket)]
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            f"""--sql
+            SELECT users.user_id, due.bucket, users.subscription_end_date FROM users
+            CROSS JOIN LATERAL (SELECT CASE
+                WHEN subscription_end_date <= $1::timestamp THEN -1::smallint{cases} END AS bucket) AS due
+            WHERE subscription_end_date > $1 - $2::interval
+                AND subscription_end_date <= $1 + ${3 + (len(ordered) - 1) * 2}::interval
+                AND is_banned IS NOT TRUE
+                AND NOT EXISTS (
+                    SELECT 1 FROM subscription_notifications AS sent
+                    WHERE sent.user_id = users.user_id AND sent.bucket = due.bucket
+                        AND sent.end_date = users.subscription_end_date)
+            """,
+            datetime.now(),
+            expired_within,
+            *params,
+        )
+        return [
+            (record["user_id"], record["bucket"], record["subscription_end_date"])
+            for record in records
+        ]
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return []
+
+
+async def get_usernames_by_ids(user_ids: list[int]) -> dict[int, str]:
+    """Get usernames of many users in one query, unknown user ids are skipped"""
+    usernames = {}
+    missing = []
+    generations = {}
+    for user_id in set(user_ids):
+        generations[user_id] = user_cache.generation(user_id)
+        cached = user_cache.get(user_id, "get_username_by_id")
+        if cached is MISSING:
+            missing.append(user_id)
+        elif cached:
+            usernames[user_id] = cached
+    if not missing:
+        return usernames
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            SELECT user_id, username FROM users WHERE user_id = ANY($1::bigint[])
+            """,
+            missing,
+        )
+        for record in records:
+            user_id = record["user_id"]
+            usernames[user_id] = user_cache.set(
+                user_id, "get_username_by_id", record["username"], generations[user_id]
+            )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+    return usernames
+
+
+async def is_subscription_expired(user_id: int) -> bool:
+    """Check if user subscription is expired"""
+    return await is_subscription_end(user_id)
+
+
+async def is_user_banned(user_id: int) -> bool:
+    """Check if user is banned"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "is_user_banned")
+    if cached is not MISSING:
+        return cached
+    try:
+        pool = await get_pool()
+        is_banned = await pool.fetchval(
+            """--sql
+            SELECT is_banned FROM users WHERE user_id = $1
+            """,
+            user_id,
+        )
+        return user_cache.set(user_id, "is_user_banned", bool(is_banned), generation)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def get_user_snapshot(user_id: int) -> UserSnapshot:
+    """Get user state and config names in one query
+
+    Returns:
+        UserSnapshot: with exists=False if user is not in database or query failed
+    """
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "get_user_snapshot")
+    if cached is not MISSING:
+        return cached
+    try:
+        pool = await get_pool()
+        row = await pool.fetchrow(
+            """--sql
+            SELECT username, is_banned, subscription_end_date,
+                ARRAY(SELECT config_name FROM vpn_config
+                      WHERE vpn_config.user_id = users.user_id ORDER BY id)
+                AS config_names
+            FROM users WHERE user_id = $1
+            """,
+            user_id,
+        )
+        if row is None:
+            return user_cache.set(
+                user_id, "get_user_snapshot", UserSnapshot(user_id=user_id), generation
+            )
+        snapshot = UserSnapshot(
+            user_id=user_id,
+            exists=True,
+            username=row["username"],
+            is_banned=bool(row["is_banned"]),
+            subscription_end_date=row["subscription_end_date"],
+            config_names=tuple(row["config_names"]),
+        )
+        return user_cache.set(user_id, "get_user_snapshot", snapshot, generation)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return UserSnapshot(user_id=user_id)
+
+
+async def get_user_snapshots(user_ids: list[int]) -> dict[int, UserSnapshot]:
+    """Get snapshots of many users in one query, unknown user ids are skipped"""
+    snapshots = {}
+    missing = []
+    generations = {}
+    for user_id in set(user_ids):
+        generations[user_id] = user_cache.generation(user_id)
+        cached = user_cache.get(user_id, "get_user_snapshot")
+        if cached is MISSING:
+            missing.append(user_id)
+        elif cached.exists:
+            snapshots[user_id] = cached
+    if not missing:
+        return snapshots
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            SELECT user_id, username, is_banned, subscription_end_date,
+                ARRAY(SELECT config_name FROM vpn_config
+                      WHERE vpn_config.user_id = users.user_id ORDER BY id)
+                AS config_names
+            FROM users WHERE user_id = ANY($1::bigint[])
+            """,
+            missing,
+        )
+        for record in records:
+            user_id = record["user_id"]
+            snapshots[user_id] = user_cache.set(
+                user_id,
+                "get_user_snapshot",
+                UserSnapshot(
+                    user_id=user_id,
+                    exists=True,
+                    username=record["username"],
+                    is_banned=bool(record["is_banned"]),
+                    subscription_end_date=record["subscription_end_date"],
+                    config_names=tuple(record["config_names"]),
+                ),
+                generations[user_id],
+            )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+    return snapshots
+
+
+async def get_usernames_expired_before(days: int) -> dict[int, str]:
+    """Get users whose subscription ended more than N days ago"""
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            SELECT user_id, username FROM users
+            WHERE subscription_end_date < $1
+            """,
+            datetime.now() - timedelta(days=days),
+        )
+        return {record["user_id"]: record["username"] for record in records}
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return {}
+
+
+async def get_archived_peers(usernames: list[str] | None = None) -> list:
+    """Get peers compacted out of server config, all of them if usernames is None"""
+    try:
+        pool = await get_pool()
+        if usernames is None:
+            return await pool.fetch(
+                """--sql
+                SELECT name, user_id, username, public_key, address, block FROM archived_peers
+                """
+            )
+        return await pool.fetch(
+            """--sql
+            SELECT name, user_id, username, public_key, address, block FROM archived_peers
+            WHERE username = ANY($1::varchar[])
+            """,
+            usernames,
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return []
+
+
+async def get_config_owners(config_names: list[str] | None = None) -> list | None:
+    """Get config names (all by default) with state of their owners, None if query failed"""
+    try:
+        pool = await get_pool()
+        return await pool.fetch(
+            """--sql
+            SELECT vpn_config.config_name, users.user_id, users.username,
+                users.is_banned, users.subscription_end_date < $1 AS is_expired
+            FROM vpn_config JOIN users ON users.user_id = vpn_config.user_id
+            WHERE $2::text[] IS NULL OR vpn_config.config_name = ANY($2::text[])
+            """,
+            datetime.now(),
+            config_names,
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+
+
+async def get_telegram_file_id(content_hash: str, kind: str) -> str | None:
+    """Get file_id of already uploaded document or photo"""
+    try:
+        pool = await get_pool()
+        return await pool.fetchval(
+            """--sql
+            SELECT file_id FROM telegram_files WHERE content_hash = $1 AND kind = $2
+            """,
+            content_hash,
+            kind,
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+
+
+async def get_unfinished_broadcasts() -> list:
+    """Get broadcasts interrupted by restart"""
+    try:
+        pool = await get_pool()
+        return await pool.fetch(
+            """--sql
+            SELECT id, text FROM broadcasts WHERE status = 'running' ORDER BY id
+            """
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return []
+
+
+async def get_broadcast_pending_user_ids(broadcast_id: int) -> list[int] | None:
+    """Get recipients of broadcast that were not reached yet, None on database error"""
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            SELECT user_id FROM broadcast_recipients
+            WHERE broadcast_id = $1 AND status = 'pending'
+            """,
+            broadcast_id,
+        )
+        return [record["user_id"] for record in records]
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+
+
+async def get_broadcast_counts(broadcast_id: int) -> dict[str, int] | None:
+    """Count recipients of broadcast by status: pending, sent, failed, None on database error"""
+    try:
+        pool = await get_pool()
+        records = await pool.fetch(
+            """--sql
+            SELECT status, count(*) FROM broadcast_recipients
+            WHERE broadcast_id = $1 GROUP BY status
+            """,
+            broadcast_id,
+        )
+        return {record["status"]: record["count"] for record in records}
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
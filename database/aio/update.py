@@ -0,0 +1,271 @@
+import asyncpg
+from loguru import logger
+from datetime import datetime, timedelta
+from database.aio.pool import get_pool
+from database.cache import user_cache
+from database.events import end_date_changed
+
+
+async def update_user_payment(user_id: int) -> None:
+    """
+    Update user payment end date in table users
+    add 30 days to current date if user don't have subscription at the moment
+    and add 30 days to date in subscription_end_date if user have not expired subscription now
+    """
+    try:
+        pool = await get_pool()
+        row = await pool.fetchrow(
+            """--sql
+            UPDATE users SET subscription_end_date = CASE
+            WHEN subscription_end_date < $1::timestamp THEN $1::timestamp + $2::interval
+            ELSE subscription_end_date + $2::interval END
+            WHERE user_id = $3
+            RETURNING username, subscription_end_date
+            """,
+            datetime.now(),
+            timedelta(days=30),
+            user_id,
+        )
+        username = row["username"] if row else None
+        logger.info(f"[+] user {user_id}::{username} payment updated; added: 30 days")
+        if row:
+            end_date_changed(user_id, row["subscription_end_date"])
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def update_user_config_count(user_id: int) -> None:
+    """Update user config count in table users
+    add 1 to current config count"""
+    try:
+        pool = await get_pool()
+        config_count = await pool.fetchval(
+            """--sql
+            UPDATE users SET config_count = config_count + 1 WHERE user_id = $1
+            RETURNING config_count
+            """,
+            user_id,
+        )
+        logger.info(f"[+] user {user_id} config count updated to {config_count}")
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def update_given_subscription_time(user_id: int, days: int) -> None:
+    """Update user payment end date in table users
+    add given days to date in table if user have not expired subscription now
+    else add given days to current date"""
+    try:
+        pool = await get_pool()
+        row = await pool.fetchrow(
+            """--sql
+            UPDATE users SET subscription_end_date = CASE
+            WHEN subscription_end_date < $1::timestamp THEN $1::timestamp + $2::interval
+            ELSE subscription_end_date + $2::interval END
+            WHERE user_id = $3
+            RETURNING username, subscription_end_date
+            """,
+            datetime.now(),
+            timedelta(days=days),
+            user_id,
+        )
+        username = row["username"] if row else None
+        logger.info(
+            f"[+] user {user_id}::{username} payment updated [BY ADMIN]; added: {days} days"
+        )
+        if row:
+            end_date_changed(user_id, row["subscription_end_date"])
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def set_user_enddate_to_n(user_id: int, days: int) -> None:
+    """Update user payment end date in table users
+    set date to datetime.now() + N days"""
+    end_date = datetime.now() + timedelta(days=days)
+    try:
+        pool = await get_pool()
+        row = await pool.fetchrow(
+            """--sql
+            UPDATE users SET subscription_end_date = $1 WHERE user_id = $2
+            RETURNING username
+            """,
+            end_date,
+            user_id,
+        )
+        username = row["username"] if row else None
+        logger.info(
+            f"[+] user {user_id}::{username} payment updated [BY ADMIN]; set to: {end_date}"
+        )
+        if row:
+            end_date_changed(user_id, end_date)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return None
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def ban_user(user_id: int) -> None:
+    """Ban user permanently by setting is_banned to True and subscription_end_date to far past"""
+    try:
+        pool = await get_pool()
+        banned_until = datetime.now() - timedelta(days=9999)
+        username = await pool.fetchval(
+            """--sql
+            UPDATE users SET
+                is_banned = TRUE,
+                subscription_end_date = $1
+            WHERE user_id = $2
+            RETURNING username
+            """,
+            banned_until,
+            user_id,
+        )
+        logger.warning(
+            f"[!] User {user_id}::{username or 'unknown'} has been BANNED (bot blocked)"
+        )
+        end_date_changed(user_id, banned_until)
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] Error banning user {user_id}: {error}")
+        return None
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def unban_user(user_id: int) -> None:
+    """Unban user by setting is_banned to False"""
+    try:
+        pool = await get_pool()
+        username = await pool.fetchval(
+            """--sql
+            UPDATE users SET is_banned = FALSE WHERE user_id = $1
+            RETURNING username
+            """,
+            user_id,
+        )
+        logger.info(f"[+] User {user_id}::{username or 'unknown'} has been UNBANNED")
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] Error unbanning user {user_id}: {error}")
+        return None
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def delete_user_configs(user_id: int) -> int:
+    """Delete all user configs from table vpn_config
+
+    Returns:
+        int: count of deleted configs
+    """
+    try:
+        pool = await get_pool()
+        status = await pool.execute(
+            """--sql
+            DELETE FROM vpn_config WHERE user_id = $1
+            """,
+            user_id,
+        )
+        # asyncpg returns command tag, e.g. "DELETE 2"
+        return int(status.split()[-1])
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] Error removing configs from database for user {user_id}: {error}")
+        return 0
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+async def delete_archived_peers(names: list[str]) -> int:
+    """Delete peers from table archived_peers
+
+    Returns:
+        int: count of deleted peers
+    """
+    try:
+        pool = await get_pool()
+        status = await pool.execute(
+            """--sql
+            DELETE FROM archived_peers WHERE name = ANY($1::varchar[])
+            """,
+            names,
+        )
+        return int(status.split()[-1])
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return 0
+
+
+async def delete_telegram_file_id(content_hash: str, kind: str) -> None:
+    """Forget file_id rejected by Telegram"""
+    try:
+        pool = await get_pool()
+        await pool.execute(
+            """--sql
+            DELETE FROM telegram_files WHERE content_hash = $1 AND kind = $2
+            """,
+            content_hash,
+            kind,
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+
+
+async def save_broadcast_results(broadcast_id: int, results: list[tuple[int, str]]) -> bool:
+    """Set status of broadcast recipients
+
+    Args:
+        results (list[tuple[int, str]]): (user_id, status), status is sent or failed
+    """
+    try:
+        pool = await get_pool()
+        await pool.executemany(
+            """--sql
+            UPDATE broadcast_recipients SET status = $3, sent_at = now()
+            WHERE broadcast_id = $1 AND user_id = $2
+            """,
+            [(broadcast_id, user_id, status) for user_id, status in results],
+        )
+        return True
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+        return False
+
+
+async def set_broadcast_status(broadcast_id: int, status: str) -> None:
+    """Mark broadcast as done or cancelled"""
+    try:
+        pool = await get_pool()
+        await pool.execute(
+            """--sql
+            UPDATE broadcasts SET status = $2, finished_at = now() WHERE id = $1
+            """,
+            broadcast_id,
+            status,
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
+
+
+async def release_notifications(notifications: list[tuple[int, int, datetime]]) -> None:
+    """Delete (user_id, bucket, end_date) from notification ledger, so
+    notifications that were not delivered are sent again"""
+    try:
+        pool = await get_pool()
+        await pool.executemany(
+            """--sql
+            DELETE FROM subscription_notifications
+            WHERE user_id = $1 AND bucket = $2 AND end_date = $3
+            """,
+            notifications,
+        )
+    except (Exception, asyncpg.PostgresError) as error:
+        logger.error(f"[-] {error}")
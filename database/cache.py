@@ -0,0 +1,129 @@
+"""In-process read-through cache for per-user state
+
+Selectors look values up here before querying the database, writers in
+database.update / database.insert drop every cached value of the user they touch.
+
+Every invalidation bumps the generation of the user. Selectors take the
+generation before they query and pass it to set(), so a row read before a
+write was committed is never cached after that write invalidated the user.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from data import configuration
+
+# sentinel for cache miss, False and None are valid cached values
+MISSING = object()
+
+
+class UserStateCache:
+    """LRU cache with per-entry TTL, keyed by (user_id, value name)"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[int, str], tuple[float, Any]] = OrderedDict()
+        self._names_by_user: dict[int, set[str]] = {}
+        self._generations: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+
+    def generation(self, user_id: int) -> int:
+        """take it before querying the database, pass it to set()"""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id: int, name: str) -> Any:
+        """Returns cached value or MISSING"""
+        if self.max_size <= 0:
+            return MISSING
+        key = (user_id, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, user_id: int, name: str, value: Any, generation: int) -> Any:
+        """Stores value and returns it, so it can be used in return statement,
+        value is not stored if user was invalidated after generation was taken"""
+        if self.max_size <= 0:
+            return value
+        key = (user_id, name)
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                self.stale_sets += 1
+                return value
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._names_by_user.setdefault(user_id, set()).add(name)
+            while len(self._entries) > self.max_size:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return value
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drops all cached values of the user"""
+        with self._lock:
+            for name in self._names_by_user.pop(user_id, ()):
+                self._entries.pop((user_id, name), None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._names_by_user.clear()
+            # generations are kept, a reader in flight must not fill the cleared cache
+
+    def _remove(self, key: tuple[int, str]) -> None:
+        """must be called with self._lock held"""
+        self._entries.pop(key, None)
+        user_id, name = key
+        names = self._names_by_user.get(user_id)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del self._names_by_user[user_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "users": len(self._names_by_user),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_sets": self.stale_sets,
+            }
+
+
+user_cache = UserStateCache(**configuration.user_cache_parameters)
+
+
+def cache_stats() -> dict:
+    return user_cache.stats()
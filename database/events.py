@@ -0,0 +1,33 @@
+"""Listeners of data changes the rest of the bot has to react to
+
+Writers in database.update and database.aio.update call end_date_changed
+after a new subscription_end_date of a user is committed. Listeners are
+called synchronously in the thread of the writer, so they must only
+schedule work, not do it.
+"""
+
+from datetime import datetime
+from typing import Callable
+
+from loguru import logger
+
+EndDateListener = Callable[[int, datetime], None]
+
+_end_date_listeners: list[EndDateListener] = []
+
+
+def add_end_date_listener(listener: EndDateListener) -> None:
+    _end_date_listeners.append(listener)
+
+
+def remove_end_date_listener(listener: EndDateListener) -> None:
+    if listener in _end_date_listeners:
+        _end_date_listeners.remove(listener)
+
+
+def end_date_changed(user_id: int, end_date: datetime) -> None:
+    for listener in list(_end_date_listeners):
+        try:
+            listener(user_id, end_date)
+        except Exception as e:
+            logger.error(f"[-] end date listener failed for user {user_id}: {e}")
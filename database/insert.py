@@ -1,6 +1,8 @@
 import psycopg2 as pg
 from loguru import logger
-from data import configuration
+from database.pool import connection
+from database.cache import user_cache
+from database.models import StoredPeer
 from aiogram.types import Message
 from datetime import datetime
 
@@ -8,8 +10,7 @@ from datetime import datetime
 def insert_new_user(message: Message) -> None:
     """Insert new user in table users if he is not in database"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 INSERT INTO users(user_id, username)
@@ -22,13 +23,14 @@ def insert_new_user(message: Message) -> None:
             logger.success(f"[+] User {message.from_user.username} added to database")
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
+    finally:
+        user_cache.invalidate_user(message.from_user.id)
 
 
 def insert_new_payment(message: Message) -> None:
     """Insert new payment in table payment"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 INSERT INTO payment(user_id, date, amount)
@@ -48,19 +50,29 @@ def insert_new_payment(message: Message) -> None:
         logger.error(f"[-] {error}")
 
 
-def insert_new_config(user_id: int, username: str, device: str, config: str) -> None:
-    """Insert new config in table vpn_config"""
+def insert_new_config(user_id: int, peer: StoredPeer) -> None:
+    """Insert per-peer fields of new config in table vpn_config"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
-                INSERT INTO vpn_config(user_id, config_name, config)
-                VALUES (%s, %s, %s)
+                INSERT INTO vpn_config(user_id, config_name, device, private_key,
+                    public_key, address, preshared_key)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """,
-                (user_id, f"{username}_{device}", config),
+                (
+                    user_id,
+                    peer.config_name,
+                    peer.device,
+                    peer.private_key,
+                    peer.public_key,
+                    peer.address,
+                    peer.preshared_key,
+                ),
             )
             conn.commit()
-            logger.success(f"[+] Config {username}_{device} added to database")
+            logger.success(f"[+] Config {peer.config_name} added to database")
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
+    finally:
+        user_cache.invalidate_user(user_id)
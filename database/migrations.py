@@ -0,0 +1,360 @@
+"""Versioned database migrations
+
+Every migration runs once, applied versions are recorded in table schema_migrations.
+Run it with `python -m database.migrations`, the bot also applies pending
+migrations on startup. Append new migrations to the end of MIGRATIONS,
+never edit or renumber one that has already been released.
+"""
+
+import re
+from typing import NamedTuple
+
+import psycopg2 as pg
+from loguru import logger
+from database.pool import connection
+
+# key for pg_advisory_lock, so two processes never migrate at the same time
+MIGRATIONS_LOCK_ID = 7_441_912
+CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: tuple[str, ...]
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    transactional: bool = True
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(
+        1,
+        "create table users",
+        (
+            # Default value for subscription_end_date is 999 days ago
+            """--sql
+            CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT UNIQUE,
+            username VARCHAR(255) UNIQUE,
+            is_admin BOOLEAN DEFAULT FALSE,
+            is_banned BOOLEAN DEFAULT FALSE,
+            subscription_end_date TIMESTAMP DEFAULT now() - interval '999 days',
+            config_count INT DEFAULT 0)
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "create table vpn_config",
+        (
+            """--sql
+            CREATE TABLE IF NOT EXISTS vpn_config (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            config_name VARCHAR(255),
+            config TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id))
+            """,
+        ),
+    ),
+    Migration(
+        3,
+        "add users.is_banned for databases created before bot blocking protection",
+        (
+            """--sql
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS is_banned BOOLEAN DEFAULT FALSE
+            """,
+        ),
+    ),
+    Migration(
+        4,
+        "create table payment",
+        (
+            """--sql
+            CREATE TABLE IF NOT EXISTS payment (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users (user_id),
+            date TIMESTAMP DEFAULT now(),
+            amount INT)
+            """,
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_payment_user_id ON payment (user_id)
+            """,
+        ),
+    ),
+    Migration(
+        5,
+        "create table banned_users",
+        (
+            """--sql
+            CREATE TABLE IF NOT EXISTS banned_users (
+            user_id BIGINT PRIMARY KEY,
+            banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            reason TEXT DEFAULT 'Bot blocked by user')
+            """,
+            """--sql
+            COMMENT ON TABLE banned_users IS 'Users who are permanently banned from the bot'
+            """,
+        ),
+    ),
+    Migration(
+        6,
+        "index users.subscription_end_date for expiry range scans",
+        (
+            """--sql
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_subscription_end_date
+            ON users (subscription_end_date)
+            """,
+        ),
+        transactional=False,
+    ),
+    Migration(
+        7,
+        "index vpn_config (user_id, config_name) for per-user config lookups",
+        (
+            """--sql
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vpn_config_user_id_config_name
+            ON vpn_config (user_id, config_name)
+            """,
+        ),
+        transactional=False,
+    ),
+    Migration(
+        8,
+        "create table archived_peers for peers compacted out of wg0.conf",
+        (
+            """--sql
+            CREATE TABLE IF NOT EXISTS archived_peers (
+            name VARCHAR(255) PRIMARY KEY,
+            user_id BIGINT,
+            username VARCHAR(255),
+            public_key TEXT,
+            address VARCHAR(64),
+            block TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT now())
+            """,
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_archived_peers_username ON archived_peers (username)
+            """,
+        ),
+    ),
+    Migration(
+        9,
+        "store per-peer fields in vpn_config instead of rendered config",
+        (
+            """--sql
+            ALTER TABLE vpn_config
+                ADD COLUMN IF NOT EXISTS device VARCHAR(16),
+                ADD COLUMN IF NOT EXISTS private_key TEXT,
+                ADD COLUMN IF NOT EXISTS public_key TEXT,
+                ADD COLUMN IF NOT EXISTS address VARCHAR(64),
+                ADD COLUMN IF NOT EXISTS preshared_key TEXT
+            """,
+            # existing rows were rendered with the server preshared key, so it is not copied
+            r"""--sql
+            UPDATE vpn_config SET
+                device = substring(config_name from '_([^_]+)$'),
+                private_key = substring(config from 'PrivateKey\s*=\s*(\S+)'),
+                address = substring(config from 'Address\s*=\s*([^\s/,]+)')
+            WHERE config IS NOT NULL AND private_key IS NULL
+            """,
+            # rendered text is kept only for rows the fields could not be parsed from
+            """--sql
+            UPDATE vpn_config SET config = NULL
+            WHERE private_key IS NOT NULL AND address IS NOT NULL
+            """,
+        ),
+    ),
+    Migration(
+        10,
+        "create table telegram_files for reusing uploaded file_id",
+        (
+            """--sql
+            CREATE TABLE IF NOT EXISTS telegram_files (
+            content_hash CHAR(64),
+            kind VARCHAR(16),
+            file_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT now(),
+            PRIMARY KEY (content_hash, kind))
+            """,
+        ),
+    ),
+    Migration(
+        11,
+        "create tables broadcasts and broadcast_recipients",
+        (
+            """--sql
+            CREATE TABLE IF NOT EXISTS broadcasts (
+            id SERIAL PRIMARY KEY,
+            text TEXT NOT NULL,
+            audience VARCHAR(16) NOT NULL,
+            created_by BIGINT,
+            status VARCHAR(16) DEFAULT 'running',
+            created_at TIMESTAMP DEFAULT now(),
+            finished_at TIMESTAMP)
+            """,
+            # one row per recipient, so a broadcast interrupted by restart resumes
+            # with the users that were not reached yet
+            """--sql
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INT REFERENCES broadcasts (id) ON DELETE CASCADE,
+            user_id BIGINT,
+            status VARCHAR(16) DEFAULT 'pending',
+            sent_at TIMESTAMP,
+            PRIMARY KEY (broadcast_id, user_id))
+            """,
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_pending
+            ON broadcast_recipients (broadcast_id) WHERE status = 'pending'
+            """,
+        ),
+    ),
+    Migration(
+        12,
+        "create table subscription_notifications, ledger of sent end date notifications",
+        (
+            # keyed by end date, so a renewed subscription gets its reminders again
+            """--sql
+            CREATE TABLE IF NOT EXISTS subscription_notifications (
+            user_id BIGINT,
+            bucket SMALLINT,
+            end_date TIMESTAMP,
+            sent_at TIMESTAMP DEFAULT now(),
+            PRIMARY KEY (user_id, bucket, end_date))
+            """,
+        ),
+    ),
+)
+
+
+def _create_migrations_table(cursor) -> None:
+    cursor.execute(
+        """--sql
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT now())
+        """
+    )
+
+
+def _record(cursor, migration: Migration) -> None:
+    cursor.execute(
+        """--sql
+        INSERT INTO schema_migrations(version, name) VALUES (%s, %s)
+        """,
+        (migration.version, migration.name),
+    )
+
+
+def _apply(cursor, migration: Migration) -> None:
+    if migration.transactional:
+        cursor.execute("BEGIN")
+        try:
+            for statement in migration.statements:
+                cursor.execute(statement)
+            _record(cursor, migration)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    else:
+        # statements must be idempotent (IF NOT EXISTS), a failed run is simply repeated
+        for statement in migration.statements:
+            index = CONCURRENT_INDEX.search(statement)
+            if index is None:
+                cursor.execute(statement)
+                continue
+            _drop_invalid_index(cursor, index.group(1))
+            try:
+                cursor.execute(statement)
+            except Exception:
+                try:
+                    _drop_invalid_index(cursor, index.group(1))
+                except Exception as error:
+                    logger.error(f"[-] {error}")
+                raise
+        _record(cursor, migration)
+
+
+def _drop_invalid_index(cursor, index_name: str) -> None:
+    """Failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, and
+    IF NOT EXISTS would skip it on the next run, so it is dropped first"""
+    cursor.execute(
+        """--sql
+        SELECT NOT pg_index.indisvalid FROM pg_index
+        JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        WHERE pg_class.relname = %s AND pg_class.relnamespace = current_schema()::regnamespace
+        """,
+        (index_name,),
+    )
+    row = cursor.fetchone()
+    if row is not None and row[0]:
+        logger.warning(f"[!] dropping invalid index {index_name} left by a failed migration")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+
+def applied_migrations() -> list[int]:
+    """Get versions of applied migrations"""
+    try:
+        with connection() as conn, conn.cursor() as cursor:
+            _create_migrations_table(cursor)
+            conn.commit()
+            cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+            return [row[0] for row in cursor.fetchall()]
+    except (Exception, pg.DatabaseError) as error:
+        logger.error(f"[-] {error}")
+        return []
+
+
+def run_migrations(target_version: int | None = None) -> list[int]:
+    """Apply pending migrations up to target_version (all by default)
+
+    Returns:
+        list[int]: versions applied by this call
+
+    Raises:
+        psycopg2.DatabaseError: if a migration failed, later ones are not applied
+    """
+    applied_now = []
+    with connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID,))
+                try:
+                    _create_migrations_table(cursor)
+                    cursor.execute("SELECT version FROM schema_migrations")
+                    done = {row[0] for row in cursor.fetchall()}
+
+                    for migration in MIGRATIONS:
+                        if migration.version in done:
+                            continue
+                        if target_version is not None and migration.version > target_version:
+                            break
+                        try:
+                            _apply(cursor, migration)
+                        except (Exception, pg.DatabaseError) as error:
+                            logger.error(
+                                f"[-] Migration {migration.version} '{migration.name}' failed: {error}"
+                            )
+                            raise
+                        applied_now.append(migration.version)
+                        logger.success(
+                            f"[+] Migration {migration.version} '{migration.name}' applied"
+                        )
+                finally:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_ID,))
+        finally:
+            conn.autocommit = False
+
+    if not applied_now:
+        logger.info("[+] Database schema is up to date")
+    return applied_now
+
+
+if __name__ == "__main__":
+    run_migrations()
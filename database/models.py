@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import NamedTuple
+
+
+class UserSnapshot(NamedTuple):
+    """Immutable view of everything handlers need to know about a user,
+    loaded with a single query by get_user_snapshot()"""
+
+    user_id: int
+    exists: bool = False
+    username: str | None = None
+    is_banned: bool = False
+    subscription_end_date: datetime | None = None
+    config_names: tuple[str, ...] = ()
+
+    @property
+    def is_expired(self) -> bool:
+        """same semantics as selector.is_subscription_end, evaluated at access time"""
+        if self.subscription_end_date is None:
+            return False
+        return self.subscription_end_date < datetime.now()
+
+    @property
+    def end_date(self) -> str | None:
+        """subscription end date in format: day-month-year"""
+        if self.subscription_end_date is None:
+            return None
+        return self.subscription_end_date.strftime("%d-%m-%Y")
+
+    @property
+    def config_count(self) -> int:
+        return len(self.config_names)
+
+    @property
+    def devices(self) -> list[str]:
+        """devices of existing configs, e.g. ['PC', 'PHONE']"""
+        return [config_name.split("_")[-1] for config_name in self.config_names]
+
+
+class StoredPeer(NamedTuple):
+    """Per-peer fields of a vpn_config row, client config is rendered from them
+    together with current server settings"""
+
+    config_name: str
+    device: str | None = None
+    private_key: str | None = None
+    public_key: str | None = None
+    address: str | None = None
+    # None means the server preshared key (WG_SERVER_PRESHARED_KEY)
+    preshared_key: str | None = None
+    # fully rendered config of rows that could not be migrated to fields
+    config: str | None = None
@@ -0,0 +1,310 @@
+"""Process-wide PostgreSQL connection pool shared by the whole database package"""
+
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2 as pg
+from psycopg2 import extensions
+from loguru import logger
+from data import configuration
+
+
+class PoolExhausted(Exception):
+    def __init__(self, max_size: int, timeout: float) -> None:
+        super().__init__(
+            f"No free database connection after {timeout}s (pool max_size={max_size})"
+        )
+
+
+class _PooledConnection:
+    """connection with the bookkeeping the pool needs for lifetime and leak checks"""
+
+    __slots__ = ("conn", "created_at", "last_used_at", "checked_out_at", "stack", "leak_reported")
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.checked_out_at = 0.0
+        self.stack = None
+        self.leak_reported = False
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections
+
+    Connections are health checked on checkout, recycled after max_lifetime seconds,
+    closed after max_idle seconds unused while the pool is above min_size and reported
+    as leaked when held longer than leak_timeout seconds.
+    """
+
+    # idle connections older than this are pinged with SELECT 1 before reuse
+    HEALTH_CHECK_IDLE_SECONDS = 30
+
+    def __init__(
+        self,
+        connection_parameters: dict,
+        min_size: int = 1,
+        max_size: int = 10,
+        max_lifetime: float = 3600,
+        max_idle: float = 300,
+        leak_timeout: float = 60,
+        acquire_timeout: float = 10,
+    ) -> None:
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+
+        self._connection_parameters = connection_parameters
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.leak_timeout = leak_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: deque[_PooledConnection] = deque()
+        self._in_use: dict[int, _PooledConnection] = {}
+        self._opening = 0
+        self._closed = False
+        self._lock = threading.Condition()
+
+        self._counters = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "recycled_by_lifetime": 0,
+            "closed_by_idle": 0,
+            "leaks_detected": 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+    def _open(self) -> _PooledConnection:
+        pooled = _PooledConnection(pg.connect(**self._connection_parameters))
+        self._counters["connections_opened"] += 1
+        return pooled
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception as error:
+            logger.debug(f"[-] Error closing pooled connection: {error}")
+        self._counters["connections_closed"] += 1
+
+    def _is_expired(self, pooled: _PooledConnection, now: float) -> bool:
+        return self.max_lifetime > 0 and now - pooled.created_at > self.max_lifetime
+
+    def _is_healthy(self, pooled: _PooledConnection, now: float) -> bool:
+        conn = pooled.conn
+        if conn.closed:
+            return False
+        if now - pooled.last_used_at < self.HEALTH_CHECK_IDLE_SECONDS:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (Exception, pg.DatabaseError):
+            return False
+
+    def _close_idle(self, now: float) -> None:
+        """must be called with self._lock held, least recently used connections are
+        at the left end of the idle deque"""
+        if self.max_idle <= 0:
+            return
+        while (
+            self._idle
+            and len(self._idle) + len(self._in_use) > self.min_size
+            and now - self._idle[0].last_used_at > self.max_idle
+        ):
+            self._counters["closed_by_idle"] += 1
+            self._discard(self._idle.popleft())
+
+    def _check_leaks(self, now: float) -> None:
+        """must be called with self._lock held"""
+        if self.leak_timeout <= 0:
+            return
+        for pooled in self._in_use.values():
+            held_for = now - pooled.checked_out_at
+            if held_for > self.leak_timeout and not pooled.leak_reported:
+                pooled.leak_reported = True
+                self._counters["leaks_detected"] += 1
+                logger.warning(
+                    f"[!] Database connection held for {held_for:.0f}s, possible leak. "
+                    f"Checked out at:\n{''.join(pooled.stack or [])}"
+                )
+
+    def getconn(self):
+        """Take a connection from the pool, opening a new one if there is room
+
+        Raises:
+            PoolExhausted: if no connection became free within acquire_timeout
+        """
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        waited = False
+
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise pg.InterfaceError("connection pool is closed")
+
+                now = time.monotonic()
+                self._check_leaks(now)
+                self._close_idle(now)
+
+                if self._idle:
+                    pooled = self._idle.pop()
+                    if self._is_expired(pooled, now):
+                        self._counters["recycled_by_lifetime"] += 1
+                        self._discard(pooled)
+                        continue
+                    if not self._is_healthy(pooled, now):
+                        self._counters["health_check_failures"] += 1
+                        self._discard(pooled)
+                        continue
+                    break
+
+                if len(self._in_use) + self._opening < self.max_size:
+                    # open outside of the lock so other threads are not blocked by the handshake
+                    self._opening += 1
+                    self._lock.release()
+                    try:
+                        pooled = self._open()
+                    finally:
+                        self._lock.acquire()
+                        self._opening -= 1
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolExhausted(self.max_size, self.acquire_timeout)
+                waited = True
+                self._lock.wait(remaining)
+
+            now = time.monotonic()
+            pooled.checked_out_at = now
+            pooled.leak_reported = False
+            pooled.stack = traceback.format_stack(limit=8)[:-1]
+            self._in_use[id(pooled.conn)] = pooled
+            self._counters["checkouts"] += 1
+            if waited:
+                wait_time = now - started
+                self._counters["waits"] += 1
+                self._counters["wait_time_total"] += wait_time
+                self._counters["wait_time_max"] = max(
+                    self._counters["wait_time_max"], wait_time
+                )
+            return pooled.conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """Return a connection to the pool, rolling back any unfinished transaction"""
+        with self._lock:
+            pooled = self._in_use.pop(id(conn), None)
+            if pooled is None:
+                logger.warning("[!] Returned connection does not belong to the pool")
+                return
+
+            now = time.monotonic()
+            pooled.last_used_at = now
+            if not discard and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except (Exception, pg.DatabaseError):
+                    discard = True
+
+            if discard or conn.closed or self._closed:
+                self._discard(pooled)
+            elif self._is_expired(pooled, now):
+                self._counters["recycled_by_lifetime"] += 1
+                self._discard(pooled)
+            else:
+                self._idle.append(pooled)
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (pg.OperationalError, pg.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def stats(self) -> dict:
+        """Current pool size and counters, use it to tune DB_POOL_* settings"""
+        with self._lock:
+            self._check_leaks(time.monotonic())
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "size": len(self._idle) + len(self._in_use),
+                **self._counters,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            if self._in_use:
+                logger.warning(
+                    f"[!] Closing pool with {len(self._in_use)} connection(s) still in use"
+                )
+            self._lock.notify_all()
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns process-wide pool, it is created on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    configuration.db_connection_parameters,
+                    **configuration.db_pool_parameters,
+                )
+                logger.info(f"[+] Database connection pool created: {_pool.stats()}")
+    return _pool
+
+
+def connection():
+    """Shortcut for get_pool().connection()"""
+    return get_pool().connection()
+
+
+def pool_stats() -> dict:
+    """empty if nothing used the pool yet, stats must not open connections"""
+    if _pool is None:
+        return {}
+    return _pool.stats()
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -1,21 +1,26 @@
 import psycopg2 as pg
 from loguru import logger
-from data import configuration
+from database.pool import connection
 from datetime import datetime, timedelta
+from database.models import StoredPeer, UserSnapshot
+from database.cache import user_cache, MISSING
 
 
 def is_exist_user(user_id: int) -> bool:
     """Check if user is exist in database"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "is_exist_user")
+    if cached is not MISSING:
+        return cached
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT EXISTS(SELECT 1 FROM users WHERE user_id = %s)
                 """,
                 (user_id,),
             )
-            return cursor.fetchone()[0]
+            return user_cache.set(user_id, "is_exist_user", cursor.fetchone()[0], generation)
 
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
@@ -24,16 +29,19 @@ def is_exist_user(user_id: int) -> bool:
 
 def is_user_have_config(user_id: int) -> bool:
     """Check if user have config in database"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "is_user_have_config")
+    if cached is not MISSING:
+        return cached
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT EXISTS(SELECT 1 FROM vpn_config WHERE user_id = %s)
                 """,
                 (user_id,),
             )
-            return cursor.fetchone()[0]
+            return user_cache.set(user_id, "is_user_have_config", cursor.fetchone()[0], generation)
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return False
@@ -41,34 +49,45 @@ def is_user_have_config(user_id: int) -> bool:
 
 def all_user_configs(user_id: int) -> list[str] | bool:
     """Get all user configs"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "all_user_configs")
+    if cached is not MISSING:
+        return cached
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT config_name FROM vpn_config WHERE user_id = %s
                 """,
                 (user_id,),
             )
-            return cursor.fetchall()
+            return user_cache.set(user_id, "all_user_configs", cursor.fetchall(), generation)
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return False
 
 
+def _get_subscription_end_datetime(user_id: int) -> datetime:
+    """Get cached raw subscription end date, raises if user not found"""
+    generation = user_cache.generation(user_id)
+    date = user_cache.get(user_id, "subscription_end_date")
+    if date is not MISSING:
+        return date
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """--sql
+            SELECT subscription_end_date FROM users WHERE user_id = %s
+            """,
+            (user_id,),
+        )
+        date = cursor.fetchone()[0]
+        return user_cache.set(user_id, "subscription_end_date", date, generation)
+
+
 def is_subscription_end(user_id: int) -> bool:
     """Check if user subscription is end"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """--sql
-                SELECT subscription_end_date FROM users WHERE user_id = %s
-                """,
-                (user_id,),
-            )
-            date = cursor.fetchone()[0]
-            return date < datetime.now()
+        return _get_subscription_end_datetime(user_id) < datetime.now()
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return False
@@ -77,43 +96,44 @@ def is_subscription_end(user_id: int) -> bool:
 def get_subscription_end_date(user_id: int) -> datetime | bool:
     """Get user subscription end date"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """--sql
-                SELECT subscription_end_date FROM users WHERE user_id = %s
-                """,
-                (user_id,),
-            )
-            # return date in format: day-month-year
-            return cursor.fetchone()[0].strftime("%d-%m-%Y")
+        # return date in format: day-month-year
+        return _get_subscription_end_datetime(user_id).strftime("%d-%m-%Y")
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return False
 
 
-def get_user_config(user_id: int, config_name: str) -> str | bool:
-    """Get user config"""
+def get_user_peer(user_id: int, config_name: str) -> StoredPeer | None:
+    """Get stored fields of user config, render it with vpn_config.render_config()"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, f"get_user_peer:{config_name}")
+    if cached is not MISSING:
+        return cached
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
-                SELECT config FROM vpn_config WHERE user_id = %s AND config_name = %s
+                SELECT config_name, device, private_key, public_key, address,
+                    preshared_key, config
+                FROM vpn_config WHERE user_id = %s AND config_name = %s
                 """,
                 (user_id, config_name),
             )
-            return cursor.fetchone()[0]
+            row = cursor.fetchone()
+            if row is None:
+                raise LookupError(f"config {config_name} not found for user {user_id}")
+            return user_cache.set(
+                user_id, f"get_user_peer:{config_name}", StoredPeer(*row), generation
+            )
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
-        return False
+        return None
 
 
 def get_all_usernames_and_enddate() -> list | bool:
     """Get all usernames and subscription end date"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT username, subscription_end_date FROM users
@@ -128,8 +148,7 @@ def get_all_usernames_and_enddate() -> list | bool:
 def get_user_ids_and_enddate() -> list | bool:
     """Get all user_ids and subscription end date"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT user_id, subscription_end_date FROM users
@@ -144,8 +163,7 @@ def get_user_ids_and_enddate() -> list | bool:
 def get_user_id(username: str) -> int:
     """Get user id"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT user_id FROM users WHERE username = %s
@@ -161,8 +179,7 @@ def get_user_id(username: str) -> int:
 def get_all_user_ids() -> list[int] | bool:
     """Get all user ids"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT user_id FROM users
@@ -187,8 +204,7 @@ def get_user_ids_enddate_n_days(days: int) -> list[int] | bool:
             shift = timedelta(days=0)
 
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT user_id FROM users WHERE subscription_end_date BETWEEN %s AND %s
@@ -203,44 +219,68 @@ def get_user_ids_enddate_n_days(days: int) -> list[int] | bool:
 
 def get_username_by_id(user_id: int) -> str | bool:
     """Get username by user id"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "get_username_by_id")
+    if cached is not MISSING:
+        return cached
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT username FROM users WHERE user_id = %s
                 """,
                 (user_id,),
             )
-            return cursor.fetchone()[0]
+            return user_cache.set(user_id, "get_username_by_id", cursor.fetchone()[0], generation)
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return False
 
 
-def is_subscription_expired(user_id: int) -> bool:
-    """Check if user subscription is expired"""
+def get_usernames_by_ids(user_ids: list[int]) -> dict[int, str]:
+    """Get usernames of many users in one query, unknown user ids are skipped"""
+    usernames = {}
+    missing = []
+    generations = {}
+    for user_id in set(user_ids):
+        generations[user_id] = user_cache.generation(user_id)
+        cached = user_cache.get(user_id, "get_username_by_id")
+        if cached is MISSING:
+            missing.append(user_id)
+        elif cached:
+            usernames[user_id] = cached
+    if not missing:
+        return usernames
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
-                SELECT subscription_end_date FROM users WHERE user_id = %s
+                SELECT user_id, username FROM users WHERE user_id = ANY(%s)
                 """,
-                (user_id,),
+                (missing,),
             )
-            date = cursor.fetchone()[0]
-            return date < datetime.now()
+            for user_id, username in cursor.fetchall():
+                usernames[user_id] = user_cache.set(
+                    user_id, "get_username_by_id", username, generations[user_id]
+                )
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
-        return False
+    return usernames
+
+
+def is_subscription_expired(user_id: int) -> bool:
+    """Check if user subscription is expired"""
+    return is_subscription_end(user_id)
 
 
 def is_user_banned(user_id: int) -> bool:
     """Check if user is banned"""
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "is_user_banned")
+    if cached is not MISSING:
+        return cached
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 SELECT is_banned FROM users WHERE user_id = %s
@@ -248,7 +288,94 @@ def is_user_banned(user_id: int) -> bool:
                 (user_id,),
             )
             result = cursor.fetchone()
-            return result[0] if result else False
+            return user_cache.set(
+                user_id, "is_user_banned", result[0] if result else False, generation
+            )
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return False
+
+
+def get_user_snapshot(user_id: int) -> UserSnapshot:
+    """Get user state and config names in one query
+
+    Returns:
+        UserSnapshot: with exists=False if user is not in database or query failed
+    """
+    generation = user_cache.generation(user_id)
+    cached = user_cache.get(user_id, "get_user_snapshot")
+    if cached is not MISSING:
+        return cached
+    try:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """--sql
+                SELECT username, is_banned, subscription_end_date,
+                    ARRAY(SELECT config_name FROM vpn_config
+                          WHERE vpn_config.user_id = users.user_id ORDER BY id)
+                FROM users WHERE user_id = %s
+                """,
+                (user_id,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return user_cache.set(
+                    user_id, "get_user_snapshot", UserSnapshot(user_id=user_id), generation
+                )
+            username, is_banned, subscription_end_date, config_names = row
+            snapshot = UserSnapshot(
+                user_id=user_id,
+                exists=True,
+                username=username,
+                is_banned=bool(is_banned),
+                subscription_end_date=subscription_end_date,
+                config_names=tuple(config_names),
+            )
+            return user_cache.set(user_id, "get_user_snapshot", snapshot, generation)
+    except (Exception, pg.DatabaseError) as error:
+        logger.error(f"[-] {error}")
+        return UserSnapshot(user_id=user_id)
+
+
+def get_user_snapshots(user_ids: list[int]) -> dict[int, UserSnapshot]:
+    """Get snapshots of many users in one query, unknown user ids are skipped"""
+    snapshots = {}
+    missing = []
+    generations = {}
+    for user_id in set(user_ids):
+        generations[user_id] = user_cache.generation(user_id)
+        cached = user_cache.get(user_id, "get_user_snapshot")
+        if cached is MISSING:
+            missing.append(user_id)
+        elif cached.exists:
+            snapshots[user_id] = cached
+    if not missing:
+        return snapshots
+    try:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """--sql
+                SELECT user_id, username, is_banned, subscription_end_date,
+                    ARRAY(SELECT config_name FROM vpn_config
+                          WHERE vpn_config.user_id = users.user_id ORDER BY id)
+                FROM users WHERE user_id = ANY(%s)
+                """,
+                (missing,),
+            )
+            for user_id, username, is_banned, subscription_end_date, config_names in cursor:
+                snapshots[user_id] = user_cache.set(
+                    user_id,
+                    "get_user_snapshot",
+                    UserSnapshot(
+                        user_id=user_id,
+                        exists=True,
+                        username=username,
+                        is_banned=bool(is_banned),
+                        subscription_end_date=subscription_end_date,
+                        config_names=tuple(config_names),
+                    ),
+                    generations[user_id],
+                )
+    except (Exception, pg.DatabaseError) as error:
+        logger.error(f"[-] {error}")
+    return snapshots
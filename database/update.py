@@ -1,6 +1,8 @@
 import psycopg2 as pg
 from loguru import logger
-from data import configuration
+from database.pool import connection
+from database.cache import user_cache
+from database.events import end_date_changed
 from datetime import datetime, timedelta
 
 
@@ -11,8 +13,7 @@ def update_user_payment(user_id: int) -> None:
     and add 30 days to date in subscription_end_date if user have not expired subscription now
     """
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 UPDATE users SET subscription_end_date = CASE
@@ -34,26 +35,28 @@ def update_user_payment(user_id: int) -> None:
             # get username for log
             cursor.execute(
                 """--sql
-                SELECT username FROM users WHERE user_id = %s
+                SELECT username, subscription_end_date FROM users WHERE user_id = %s
                 """,
                 (user_id,),
             )
-            username = cursor.fetchone()[0]
+            username, end_date = cursor.fetchone()
 
             logger.info(
                 f"[+] user {user_id}::{username} payment updated; added: 30 days"
             )
+            end_date_changed(user_id, end_date)
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return None
+    finally:
+        user_cache.invalidate_user(user_id)
 
 
 def update_user_config_count(user_id: int) -> None:
     """Update user config count in table users
     add 1 to current config count"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 UPDATE users SET config_count = config_count + 1 WHERE user_id = %s
@@ -66,6 +69,8 @@ def update_user_config_count(user_id: int) -> None:
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return None
+    finally:
+        user_cache.invalidate_user(user_id)
 
 
 def update_given_subscription_time(user_id: int, days: int) -> None:
@@ -73,8 +78,7 @@ def update_given_subscription_time(user_id: int, days: int) -> None:
     add given days to date in table if user have not expired subscription now
     else add given days to current date"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 UPDATE users SET subscription_end_date = CASE
@@ -96,31 +100,34 @@ def update_given_subscription_time(user_id: int, days: int) -> None:
             # get username for log
             cursor.execute(
                 """--sql
-                SELECT username FROM users WHERE user_id = %s
+                SELECT username, subscription_end_date FROM users WHERE user_id = %s
                 """,
                 (user_id,),
             )
-            username = cursor.fetchone()[0]
+            username, end_date = cursor.fetchone()
 
             logger.info(
                 f"[+] user {user_id}::{username} payment updated [BY ADMIN]; added: {days} days"
             )
+            end_date_changed(user_id, end_date)
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return None
+    finally:
+        user_cache.invalidate_user(user_id)
 
 
 def set_user_enddate_to_n(user_id: int, days: int) -> None:
     """Update user payment end date in table users
     set date to datetime.now() + N days"""
+    end_date = datetime.now() + timedelta(days=days)
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             cursor.execute(
                 """--sql
                 UPDATE users SET subscription_end_date = %s WHERE user_id = %s
                 """,
-                (datetime.now() + timedelta(days=days), user_id),
+                (end_date, user_id),
             )
 
             conn.commit()
@@ -136,18 +143,21 @@ def set_user_enddate_to_n(user_id: int, days: int) -> None:
 
             logger.info(
                 f"""[+] user {user_id}::{username} payment updated [BY ADMIN]; set to:
-                {datetime.now() + timedelta(days=days)}"""
+                {end_date}"""
             )
+            end_date_changed(user_id, end_date)
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] {error}")
         return None
+    finally:
+        user_cache.invalidate_user(user_id)
 
 
 def ban_user(user_id: int) -> None:
     """Ban user permanently by setting is_banned to True and subscription_end_date to far past"""
+    banned_until = datetime.now() - timedelta(days=9999)
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             # Get username for logging
             cursor.execute(
                 """--sql
@@ -166,22 +176,24 @@ def ban_user(user_id: int) -> None:
                     subscription_end_date = %s
                 WHERE user_id = %s
                 """,
-                (datetime.now() - timedelta(days=9999), user_id),
+                (banned_until, user_id),
             )
 
             conn.commit()
             logger.warning(f"[!] User {user_id}::{username} has been BANNED (bot blocked)")
+            end_date_changed(user_id, banned_until)
             
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] Error banning user {user_id}: {error}")
         return None
+    finally:
+        user_cache.invalidate_user(user_id)
 
 
 def unban_user(user_id: int) -> None:
     """Unban user by setting is_banned to False"""
     try:
-        conn = pg.connect(**configuration.db_connection_parameters)
-        with conn.cursor() as cursor:
+        with connection() as conn, conn.cursor() as cursor:
             # Get username for logging
             cursor.execute(
                 """--sql
@@ -206,3 +218,29 @@ def unban_user(user_id: int) -> None:
     except (Exception, pg.DatabaseError) as error:
         logger.error(f"[-] Error unbanning user {user_id}: {error}")
         return None
+    finally:
+        user_cache.invalidate_user(user_id)
+
+
+def delete_user_configs(user_id: int) -> int:
+    """Delete all user configs from table vpn_config
+
+    Returns:
+        int: count of deleted configs
+    """
+    try:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """--sql
+                DELETE FROM vpn_config WHERE user_id = %s
+                """,
+                (user_id,),
+            )
+            deleted_count = cursor.rowcount
+            conn.commit()
+            return deleted_count
+    except (Exception, pg.DatabaseError) as error:
+        logger.error(f"[-] Error removing configs from database for user {user_id}: {error}")
+        return 0
+    finally:
+        user_cache.invalidate_user(user_id)
@@ -86,6 +86,24 @@ def setup(dp: Dispatcher):
 
     dp.register_message_handler(give_subscription_time, commands=["give"], state=None)
 
+    dp.register_message_handler(cmd_pool_stats, commands=["poolstats"], state=None)
+
+    dp.register_message_handler(cmd_cache_stats, commands=["cachestats"], state=None)
+
+    dp.register_message_handler(cmd_wg_stats, commands=["wgstats"], state=None)
+
+    dp.register_message_handler(cmd_compact_config, commands=["compact"], state=None)
+
+    dp.register_message_handler(cmd_reconcile, commands=["reconcile"], state=None)
+
+    dp.register_message_handler(cmd_broadcast, commands=["broadcast"], state=None)
+
+    dp.register_message_handler(
+        cmd_broadcast_status, commands=["broadcaststatus"], state=None
+    )
+
+    dp.register_message_handler(cmd_broadcast_stop, commands=["broadcaststop"], state=None)
+
     dp.register_message_handler(
         restart_wg_service_admin, commands=["wgrestart"], state=None
     )
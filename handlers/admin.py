@@ -5,6 +5,13 @@ from loguru import logger
 
 from data import configuration
 import database
+from database import aio
+from database.cache import cache_stats
+from utils.reconciler import reconcile
+from utils.qr_code import qr_cache, qr_render_pool
+from utils.telegram_files import telegram_files
+from utils.broadcast import broadcasts, notify_admins
+from utils.telegram_limiter import telegram_limiter
 import keyboards as kb
 from middlewares import rate_limit
 
@@ -12,7 +19,6 @@ from pprint import pformat
 from datetime import datetime
 from aiogram.utils.markdown import hcode, hbold, hpre
 from io import BytesIO
-from database import selector
 
 
 def is_admin(func):
@@ -21,7 +27,7 @@ def is_admin(func):
             await func(message, state)
         else:
             admins_usernames = [
-                selector.get_username_by_id(ADMIN) for ADMIN in configuration.admins
+                await aio.selector.get_username_by_id(ADMIN) for ADMIN in configuration.admins
             ]
             if not admins_usernames:
                 await message.answer("You don't have permission to use this command.")
@@ -55,7 +61,7 @@ async def cmd_info(message: types.Message, state: FSMContext) -> types.Message |
 @is_admin
 async def statistic_endtime(message: types.Message, state: FSMContext):
     args = message.text.split()[1:]
-    users = database.selector.get_all_usernames_and_enddate()
+    users = await aio.selector.get_all_usernames_and_enddate()
     if not users:
         await message.answer(
             f"{hbold('Error: database is empty ')}", parse_mode=types.ParseMode.HTML
@@ -122,17 +128,18 @@ async def give_subscription_time(
         days = message.text.split()[2]
     else:
         username, days = message.text.split()[1:]
-        user_id = database.selector.get_user_id(username)
+        user_id = await aio.selector.get_user_id(username)
 
     try:
-        database.update.update_given_subscription_time(user_id=user_id, days=int(days))
-        is_subscription_expired = database.selector.is_subscription_expired(user_id)
+        await aio.update.update_given_subscription_time(user_id=user_id, days=int(days))
+        user = await aio.selector.get_user_snapshot(user_id)
+        is_subscription_expired = user.is_expired
         if is_subscription_expired:
             await vpn_config.disconnect_peer(user_id)
             await bot.send_message(
                 user_id,
                 "Ваша подписка истекла.",
-                reply_markup=await kb.free_user_kb(user_id=user_id),
+                reply_markup=await kb.free_user_kb(user),
             )
     except Exception as e:
         await message.answer(f"Error: {e.__repr__()}")
@@ -144,22 +151,152 @@ async def give_subscription_time(
             f"Поздравляем! Администратор продлил вашу подписку на {hbold(days)} дней!",
             reply_markup=await kb.payed_user_kb()
             if not is_subscription_expired
-            else await kb.free_user_kb(user_id=user_id),
+            else await kb.free_user_kb(user),
             parse_mode=types.ParseMode.HTML,
         )
-        for admin in configuration.admins:
-            await bot.send_message(
-                chat_id=admin,
-                text=f"Пользователю {hcode(user_id)} продлена подписка на {hbold(days)} дней.\n"
-                f"Теперь она актуальна до: {hbold(database.selector.get_subscription_end_date(user_id))}",
-                parse_mode=types.ParseMode.HTML,
-            )
+        await notify_admins(
+            f"Пользователю {hcode(user_id)} продлена подписка на {hbold(days)} дней.\n"
+            f"Теперь она актуальна до: {hbold(user.end_date)}",
+            parse_mode=types.ParseMode.HTML,
+        )
+
+
+@rate_limit(limit=3)
+@is_admin
+async def cmd_pool_stats(message: types.Message, state: FSMContext):
+    """Show database connection pools and key pair pool statistics - /poolstats"""
+    stats = {
+        # asyncpg pool of handlers, psycopg2 pool of migrations and sync callers
+        "database_async": aio.pool_stats(),
+        "database_sync": database.pool_stats(),
+        "key_pairs": vpn_config.key_pool.stats(),
+        "qr_render": qr_render_pool.stats(),
+    }
+    await message.answer(f"{hpre(pformat(stats))}", parse_mode=types.ParseMode.HTML)
+
+
+@rate_limit(limit=3)
+@is_admin
+async def cmd_cache_stats(message: types.Message, state: FSMContext):
+    """Show user state, QR code and file_id cache hit/miss counters - /cachestats"""
+    stats = {
+        "users": cache_stats(),
+        "qr_codes": qr_cache.stats(),
+        "telegram_files": telegram_files.stats(),
+    }
+    await message.answer(f"{hpre(pformat(stats))}", parse_mode=types.ParseMode.HTML)
+
+
+@rate_limit(limit=3)
+@is_admin
+async def cmd_wg_stats(message: types.Message, state: FSMContext):
+    """Show wg/systemctl command latency and config write statistics - /wgstats"""
+    stats = {
+        "backend": vpn_config.backend.name,
+        "commands": vpn_config.process.stats(),
+        "changes": vpn_config.changes.stats(),
+        "writer": vpn_config.writer.stats(),
+    }
+    await message.answer(f"{hpre(pformat(stats))}", parse_mode=types.ParseMode.HTML)
+
+
+@rate_limit(limit=3)
+@is_admin
+async def cmd_compact_config(message: types.Message, state: FSMContext):
+    """Move disconnected peers of users expired N days ago out of wg0.conf - /compact [days]"""
+    args = message.text.split()[1:]
+    days = int(args[0]) if args and args[0].isdigit() else configuration.wg_compact_after_days
+    try:
+        report = await vpn_config.compact_disconnected_peers(days)
+    except Exception as e:
+        await message.answer(f"Ошибка: {e}")
+        return
+    await message.answer(f"{hpre(pformat(report))}", parse_mode=types.ParseMode.HTML)
+
+
+@rate_limit(limit=10)
+@is_admin
+async def cmd_reconcile(message: types.Message, state: FSMContext):
+    """Compare database, wg0.conf and interface - /reconcile [apply]"""
+    apply = message.text.split()[1:2] == ["apply"]
+    try:
+        drift = await reconcile(
+            vpn_config,
+            apply=apply,
+            disable_orphans=configuration.reconcile_parameters["disable_orphans"],
+        )
+    except Exception as e:
+        await message.answer(f"Ошибка: {e}")
+        return
+    title = "Исправлено" if apply else "Найдено (без изменений)"
+    await message.answer(
+        f"{title}: {drift.total}\n{hpre(pformat(drift.summary()))}",
+        parse_mode=types.ParseMode.HTML,
+    )
+
+
+@rate_limit(limit=10)
+@is_admin
+async def cmd_broadcast(message: types.Message, state: FSMContext):
+    """Send message to users - /broadcast [all|active|expired] text,
+    or reply /broadcast [all|active|expired] to the message that should be sent"""
+    args = message.html_text.split(maxsplit=1)[1:]
+    audience = "all"
+    if args and args[0].split(maxsplit=1)[0] in aio.BROADCAST_AUDIENCES:
+        audience, *args = args[0].split(maxsplit=1)
+    if message.reply_to_message is not None:
+        text = message.reply_to_message.html_text
+    else:
+        text = args[0] if args else ""
+    if not text:
+        await message.answer(
+            f"Использование: {hcode('/broadcast [all|active|expired] текст')}\n"
+            "или ответ командой на сообщение, которое нужно разослать",
+            parse_mode=types.ParseMode.HTML,
+        )
+        return
+    try:
+        broadcast = await broadcasts.start(text, audience, message.from_user.id)
+    except Exception as e:
+        await message.answer(f"Ошибка: {e}")
+        return
+    await message.answer(
+        f"Рассылка {hcode(broadcast.id)} ({audience}) запущена\n"
+        f"Статус: {hcode(f'/broadcaststatus {broadcast.id}')}\n"
+        f"Остановить: {hcode(f'/broadcaststop {broadcast.id}')}",
+        parse_mode=types.ParseMode.HTML,
+    )
+
+
+@rate_limit(limit=3)
+@is_admin
+async def cmd_broadcast_status(message: types.Message, state: FSMContext):
+    """Show progress, throughput and failures of broadcast - /broadcaststatus [id]"""
+    args = message.text.split()[1:]
+    broadcast = broadcasts.get(int(args[0]) if args and args[0].isdigit() else None)
+    if broadcast is None:
+        await message.answer("Рассылка не найдена")
+        return
+    stats = {"broadcast": broadcast.stats(), "limiter": telegram_limiter.stats()}
+    await message.answer(f"{hpre(pformat(stats))}", parse_mode=types.ParseMode.HTML)
+
+
+@rate_limit(limit=3)
+@is_admin
+async def cmd_broadcast_stop(message: types.Message, state: FSMContext):
+    """Cancel running broadcast - /broadcaststop [id]"""
+    args = message.text.split()[1:]
+    broadcast = broadcasts.get(int(args[0]) if args and args[0].isdigit() else None)
+    if broadcast is None or not broadcasts.cancel(broadcast.id):
+        await message.answer("Нет такой запущенной рассылки")
+        return
+    await message.answer(f"Рассылка {hcode(broadcast.id)} остановлена", parse_mode=types.ParseMode.HTML)
 
 
 @rate_limit(limit=3)
 @is_admin
 async def restart_wg_service_admin(message: types.Message, state: FSMContext):
-    vpn_config.restart_service()
+    await vpn_config.restart_service()
     await message.answer("Сервис WireGuard перезапущен")
 
 
@@ -175,14 +312,15 @@ async def cmd_ban_user(message: types.Message, state: FSMContext):
         
         user_id = int(args[1])
         
-        if not database.selector.is_exist_user(user_id):
+        user = await aio.selector.get_user_snapshot(user_id)
+        if not user.exists:
             await message.answer(f"Пользователь {user_id} не найден в базе данных")
             return
         
         # Completely ban user
         await vpn_config.ban_user_completely(user_id)
         
-        username = database.selector.get_username_by_id(user_id)
+        username = user.username
         await message.answer(
             f"✅ Пользователь {hcode(user_id)}::{hcode(username)} заблокирован навсегда.\n"
             f"Все конфигурации удалены из WireGuard и базы данных.",
@@ -190,13 +328,11 @@ async def cmd_ban_user(message: types.Message, state: FSMContext):
         )
         
         # Notify other admins
-        for admin in configuration.admins:
-            if admin != message.from_user.id:
-                await bot.send_message(
-                    chat_id=admin,
-                    text=f"Пользователь {hcode(user_id)}::{hcode(username)} заблокирован администратором {hcode(message.from_user.username)}",
-                    parse_mode=types.ParseMode.HTML,
-                )
+        await notify_admins(
+            f"Пользователь {hcode(user_id)}::{hcode(username)} заблокирован администратором {hcode(message.from_user.username)}",
+            exclude=message.from_user.id,
+            parse_mode=types.ParseMode.HTML,
+        )
                 
     except ValueError:
         await message.answer("Неверный формат user_id")
@@ -217,18 +353,19 @@ async def cmd_unban_user(message: types.Message, state: FSMContext):
         
         user_id = int(args[1])
         
-        if not database.selector.is_exist_user(user_id):
+        user = await aio.selector.get_user_snapshot(user_id)
+        if not user.exists:
             await message.answer(f"Пользователь {user_id} не найден в базе данных")
             return
         
-        if not database.selector.is_user_banned(user_id):
+        if not user.is_banned:
             await message.answer(f"Пользователь {user_id} не заблокирован")
             return
         
         # Unban user
-        database.update.unban_user(user_id)
+        await aio.update.unban_user(user_id)
         
-        username = database.selector.get_username_by_id(user_id)
+        username = user.username
         await message.answer(
             f"✅ Пользователь {hcode(user_id)}::{hcode(username)} разблокирован.\n"
             f"Теперь он может снова использовать бота.",
@@ -236,13 +373,11 @@ async def cmd_unban_user(message: types.Message, state: FSMContext):
         )
         
         # Notify other admins
-        for admin in configuration.admins:
-            if admin != message.from_user.id:
-                await bot.send_message(
-                    chat_id=admin,
-                    text=f"Пользователь {hcode(user_id)}::{hcode(username)} разблокирован администратором {hcode(message.from_user.username)}",
-                    parse_mode=types.ParseMode.HTML,
-                )
+        await notify_admins(
+            f"Пользователь {hcode(user_id)}::{hcode(username)} разблокирован администратором {hcode(message.from_user.username)}",
+            exclude=message.from_user.id,
+            parse_mode=types.ParseMode.HTML,
+        )
                 
     except ValueError:
         await message.answer("Неверный формат user_id")
@@ -263,24 +398,19 @@ async def cmd_check_user_status(message: types.Message, state: FSMContext):
         
         user_id = int(args[1])
         
-        if not database.selector.is_exist_user(user_id):
+        user = await aio.selector.get_user_snapshot(user_id)
+        if not user.exists:
             await message.answer(f"Пользователь {user_id} не найден в базе данных")
             return
         
-        username = database.selector.get_username_by_id(user_id)
-        is_banned = database.selector.is_user_banned(user_id)
-        subscription_end = database.selector.get_subscription_end_date(user_id)
-        is_expired = database.selector.is_subscription_end(user_id)
-        
-        status_text = f"👤 Пользователь {hcode(user_id)}::{hcode(username)}\n\n"
-        status_text += f"🚫 Заблокирован: {'Да' if is_banned else 'Нет'}\n"
-        status_text += f"📅 Подписка до: {subscription_end}\n"
-        status_text += f"⏰ Статус подписки: {'Истекла' if is_expired else 'Активна'}\n"
+        status_text = f"👤 Пользователь {hcode(user_id)}::{hcode(user.username)}\n\n"
+        status_text += f"🚫 Заблокирован: {'Да' if user.is_banned else 'Нет'}\n"
+        status_text += f"📅 Подписка до: {user.end_date}\n"
+        status_text += f"⏰ Статус подписки: {'Истекла' if user.is_expired else 'Активна'}\n"
         
         # Check configs
-        configs = database.selector.all_user_configs(user_id)
-        if configs:
-            status_text += f"📱 Конфигурации: {', '.join([config[0] for config in configs])}\n"
+        if user.config_names:
+            status_text += f"📱 Конфигурации: {', '.join(user.config_names)}\n"
         else:
             status_text += f"📱 Конфигурации: Нет\n"
         
@@ -8,21 +8,25 @@ from aiogram.utils.markdown import hcode, hlink
 from middlewares import rate_limit
 import keyboards as kb
 
-import database
+from database import aio
 from loader import bot
 from data import configuration
 from loader import vpn_config
-from database import selector
 
 from utils.fsm import NewConfig, NewPayment
-from utils.qr_code import create_qr_code_from_peer_data
+from utils.qr_code import get_qr_code, qr_cache, QRQueueFull
+from utils.telegram_files import telegram_files, content_hash, DOCUMENT, PHOTO
 from utils.bot_error_handler import check_user_access
+from utils.broadcast import notify_admins
+
+QR_BUSY_TEXT = "Сейчас создаётся много QR-кодов, запроси конфиг через минуту, чтобы получить QR-код"
 
 
 @rate_limit(limit=5)
 async def cmd_start(message: types.Message) -> types.Message:
+    user = await aio.selector.get_user_snapshot(message.from_user.id)
     # Check if user is banned
-    if database.selector.is_exist_user(message.from_user.id) and database.selector.is_user_banned(message.from_user.id):
+    if user.exists and user.is_banned:
         await message.answer(
             "❌ Ваш аккаунт заблокирован. Обратитесь к администратору.",
         )
@@ -35,22 +39,22 @@ async def cmd_start(message: types.Message) -> types.Message:
             parse_mode=types.ParseMode.HTML,
         )
         return
-    if database.selector.is_exist_user(message.from_user.id):
-        if database.selector.is_subscription_end(message.from_user.id):
+    if user.exists:
+        if user.is_expired:
             await message.answer(
                 f"Привет, {message.from_user.full_name or message.from_user.username}, твоя подписка закончилась, оплати её, чтобы продолжить пользоваться VPN",
-                reply_markup=await kb.free_user_kb(message.from_user.id),
+                reply_markup=await kb.free_user_kb(user),
             )
         else:
             await message.answer(
-                f"Привет, {message.from_user.full_name or message.from_user.username}, твоя подписка действительна до {database.selector.get_subscription_end_date(message.from_user.id)}",
+                f"Привет, {message.from_user.full_name or message.from_user.username}, твоя подписка действительна до {user.end_date}",
                 reply_markup=await kb.payed_user_kb(),
             )
         return
 
     await message.reply(
         f"Привет, {message.from_user.full_name or message.from_user.username}!\nЧтобы начать пользоваться VPN, оплати подписку",
-        reply_markup=await kb.free_user_kb(message.from_user.id),
+        reply_markup=await kb.free_user_kb(user),
     )
     await bot.send_message(
         message.from_user.id,
@@ -59,17 +63,15 @@ async def cmd_start(message: types.Message) -> types.Message:
         "оплачивая подписку, вы соглашаетесь с правилами использования бота и условиями возврата средств, указанными в статье выше.",
         parse_mode=types.ParseMode.HTML,
     )
-    database.insert_new_user(message)
+    await aio.insert_new_user(message)
 
     # notify admin about new user
-    for admin in configuration.admins:
-        # format: Новый пользователь: Имя (id: id), username, id like code format in markdown
-        await bot.send_message(
-            admin,
-            f"Новый пользователь: {hcode(message.from_user.full_name)}\n"
-            f"id: {hcode(message.from_user.id)}, username: {hcode(message.from_user.username)}",
-            parse_mode=types.ParseMode.HTML,
-        )
+    # format: Новый пользователь: Имя (id: id), username, id like code format in markdown
+    await notify_admins(
+        f"Новый пользователь: {hcode(message.from_user.full_name)}\n"
+        f"id: {hcode(message.from_user.id)}, username: {hcode(message.from_user.username)}",
+        parse_mode=types.ParseMode.HTML,
+    )
 
 
 @rate_limit(limit=5)
@@ -97,17 +99,15 @@ async def got_payment_screenshot(message: types.Message, state: FSMContext):
     await message.reply("Подождите, пока мы проверим вашу оплату.")
     await state.finish()
     # forwards screenshot to admin
-    for admin in configuration.admins:
-        await message.forward(admin)
-        give_help_command = f"/give {message.from_user.id} 30"
-        await bot.send_message(
-            admin,
-            f"Пользователь {message.from_user.full_name}\n"
-            f"id: {hcode(message.from_user.id)}, username: {hcode(message.from_user.username)} оплатил подписку на VPN.\n\n"
-            "Проверьте оплату и активируйте VPN для пользователя.\n"
-            f"{hcode(give_help_command)}",
-            parse_mode=types.ParseMode.HTML,
-        )
+    give_help_command = f"/give {message.from_user.id} 30"
+    await notify_admins(
+        f"Пользователь {message.from_user.full_name}\n"
+        f"id: {hcode(message.from_user.id)}, username: {hcode(message.from_user.username)} оплатил подписку на VPN.\n\n"
+        "Проверьте оплату и активируйте VPN для пользователя.\n"
+        f"{hcode(give_help_command)}",
+        forward=message,
+        parse_mode=types.ParseMode.HTML,
+    )
 
 
 async def cancel_payment(query: types.CallbackQuery, state: FSMContext):
@@ -117,38 +117,41 @@ async def cancel_payment(query: types.CallbackQuery, state: FSMContext):
 
 # successful payment
 async def successful_payment_handler(message: types.Message):
-    database.update_user_payment(message.from_user.id)
-    database.insert_new_payment(message)
-    if database.selector.is_user_have_config(message.from_user.id):
+    await aio.update_user_payment(message.from_user.id)
+    await aio.insert_new_payment(message)
+    user = await aio.selector.get_user_snapshot(message.from_user.id)
+    if user.config_names:
         try:
             await vpn_config.reconnect_payed_user(message.from_user.id)
         except Exception as e:
             logger.error(e)
 
     await message.answer(
-        f"{message.from_user.full_name or message.from_user.username}, твой доступ к VPN продлен до {database.selector.get_subscription_end_date(message.from_user.id)}",
+        f"{message.from_user.full_name or message.from_user.username}, твой доступ к VPN продлен до {user.end_date}",
         reply_markup=await kb.payed_user_kb(),
     )
 
 
 async def cmd_my_configs(message: types.Message):
-    if database.selector.all_user_configs(message.from_user.id):
+    user = await aio.selector.get_user_snapshot(message.from_user.id)
+    if user.config_names:
         await message.answer(
             "Отображаю твои конфиги на кнопках",
-            reply_markup=await kb.configs_kb(message.from_user.id),
+            reply_markup=await kb.configs_kb(user),
         )
     else:
         await message.answer(
             "У тебя нет конфигов",
-            reply_markup=await kb.configs_kb(message.from_user.id),
+            reply_markup=await kb.configs_kb(user),
         )
 
 
 async def cmd_menu(message: types.Message):
-    if database.selector.is_subscription_end(message.from_user.id):
+    user = await aio.selector.get_user_snapshot(message.from_user.id)
+    if user.is_expired:
         await message.answer(
             "Возвращаю тебя в основное меню",
-            reply_markup=await kb.free_user_kb(message.from_user.id),
+            reply_markup=await kb.free_user_kb(user),
         )
     else:
         await message.answer(
@@ -160,7 +163,9 @@ async def cmd_menu(message: types.Message):
 async def create_new_config(message: types.Message, state=FSMContext):
     await message.answer(
         "Для какого устройства ты хочешь создать конфиг?",
-        reply_markup=await kb.device_kb(message.from_user.id),
+        reply_markup=await kb.device_kb(
+            await aio.selector.get_user_snapshot(message.from_user.id)
+        ),
     )
     await NewConfig.device.set()
 
@@ -178,40 +183,37 @@ async def device_selected(call: types.CallbackQuery, state=FSMContext):
     await state.finish()
 
     # add +1 to user config count
-    database.update_user_config_count(call.from_user.id)
+    await aio.update_user_config_count(call.from_user.id)
 
     device = "PC" if call.data.startswith("pc") else "PHONE"
-    user_config = await vpn_config.update_server_config(
+    peer = await vpn_config.update_server_config(
         username=call.from_user.username, device=device
     )
 
-    database.insert_new_config(
-        user_id=call.from_user.id,
-        username=call.from_user.username,
-        device=device,
-        config=user_config,
-    )
+    await aio.insert_new_config(user_id=call.from_user.id, peer=peer)
+    user_config = vpn_config.render_config(peer)
 
-    io_config_file = BytesIO(user_config.encode("utf-8"))
     filename = f"{configuration.configs_prefix}_{call.from_user.username}_{device}.conf"
 
     # send config file
-    await call.message.answer_document(
-        types.InputFile(
-            io_config_file,
-            filename=filename,
+    await send_config_document(
+        call.message,
+        user_config,
+        filename,
+        reply_markup=await kb.configs_kb(
+            await aio.selector.get_user_snapshot(call.from_user.id)
         ),
-        reply_markup=await kb.configs_kb(call.from_user.id),
     )
 
     if device == "PHONE":
-        config_qr_code = create_qr_code_from_peer_data(user_config)
-        await call.message.answer_photo(
-            types.InputFile(
-                config_qr_code,
-                filename=f"{configuration.configs_prefix}_{call.from_user.username}.png",
-            ),
-        )
+        try:
+            await send_config_qr_code(
+                call.message,
+                user_config,
+                f"{configuration.configs_prefix}_{call.from_user.username}.png",
+            )
+        except QRQueueFull:
+            await call.message.answer(QR_BUSY_TEXT)
 
 
 async def cancel_config_creation(call: types.CallbackQuery, state=FSMContext):
@@ -226,45 +228,59 @@ async def cmd_show_config(message: types.Message, state=FSMContext):
     elif message.text.lower().endswith("смартфон"):
         device = "PHONE"
 
-    config = database.selector.get_user_config(
+    peer = await aio.selector.get_user_peer(
         user_id=message.from_user.id,
         config_name=f"{message.from_user.username}_{device}",
     )
+    if peer is None:
+        await message.answer("Конфиг не найден")
+        return
+    config = vpn_config.render_config(peer)
     filename = (
         f"{configuration.configs_prefix}_{message.from_user.username}_{device}.conf"
     )
-    io_config_file = BytesIO(config.encode("utf-8"))
-
-    if device == "PC":
-        # send config file
-        await message.answer_document(
-            types.InputFile(
-                io_config_file,
-                filename=filename,
-            ),
-        )
+
+    # send config file
+    await send_config_document(message, config, filename)
 
     if device == "PHONE":
-        # firstly create qr code image, then send it with config file
-        # this method is used for restrict delay between sending file and photo
         image_filename = (
             f"{configuration.configs_prefix}_{message.from_user.username}.png"
         )
-        config_qr_code = create_qr_code_from_peer_data(config)
+        try:
+            await send_config_qr_code(message, config, image_filename)
+        except QRQueueFull:
+            await message.answer(QR_BUSY_TEXT)
 
-        await message.answer_document(
-            types.InputFile(
-                io_config_file,
-                filename=filename,
-            ),
-        )
 
-        await message.answer_photo(
-            types.InputFile(
-                config_qr_code,
-                filename=image_filename,
-            ),
-        )
+async def send_config_document(
+    message: types.Message, config: str, filename: str, **kwargs
+) -> types.Message:
+    """sends config file, uploaded only if it was not sent before"""
+
+    async def make_file() -> types.InputFile:
+        return types.InputFile(BytesIO(config.encode("utf-8")), filename=filename)
+
+    return await telegram_files.send(
+        message, DOCUMENT, content_hash(filename, config), make_file, **kwargs
+    )
+
+
+async def send_config_qr_code(
+    message: types.Message, config: str, filename: str
+) -> types.Message:
+    """sends qr code of config, rendered and uploaded only if it was not sent before
+
+    Raises:
+        QRQueueFull: if qr code has to be rendered and render queue is full
+    """
+
+    async def make_file() -> types.InputFile:
+        return types.InputFile(await get_qr_code(config), filename=filename)
+
+    return await telegram_files.send(
+        message, PHOTO, content_hash(filename, qr_cache.key(config)), make_file
+    )
 
 
 @rate_limit(limit=5)
@@ -275,7 +291,7 @@ async def cmd_support(message: types.Message):
         parse_mode=types.ParseMode.HTML,
     )
 
-    admin_username = selector.get_username_by_id(configuration.admins[0])
+    admin_username = await aio.selector.get_username_by_id(configuration.admins[0])
     admin_telegram_link = f"t.me/{admin_username}"
     await message.answer(
         f"Если у тебя все еще остались вопросы, то ты можешь написать {hlink('мне',admin_telegram_link)} лично",
@@ -288,7 +304,7 @@ async def cmd_show_end_time(message: types.Message):
     # show user end time
     await message.answer(
         f"{message.from_user.full_name or message.from_user.username}, "
-        f"твой доступ к VPN закончится {database.selector.get_subscription_end_date(message.from_user.id)}"
+        f"твой доступ к VPN закончится {await aio.selector.get_subscription_end_date(message.from_user.id)}"
     )
 
 
@@ -304,5 +320,5 @@ async def cmd_show_subscription(message: types.Message):
 @rate_limit(limit=3600)
 async def cmd_reboot_wg_service(message: types.Message):
     await message.answer("Перезагрузка сервиса WireGuard...")
-    vpn_config.restart_service()
+    await vpn_config.restart_service()
     await message.answer("Сервис WireGuard перезагружен")
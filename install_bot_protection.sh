@@ -153,50 +153,13 @@ install_dependencies() {
 apply_database_migration() {
     print_step "Applying database migration..."
     
-    # Create migration SQL
-    cat > migration.sql << 'EOF'
--- Add bot blocking protection tables
-CREATE TABLE IF NOT EXISTS banned_users (
-    user_id BIGINT PRIMARY KEY,
-    banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    reason TEXT DEFAULT 'Bot blocked by user'
-);
-
-CREATE INDEX IF NOT EXISTS idx_banned_users_user_id ON banned_users(user_id);
-
-COMMENT ON TABLE banned_users IS 'Users who are permanently banned from the bot';
-EOF
-    
-    # Apply migration
-    if python3 -c "
-import sys
-sys.path.append('.')
-try:
-    from data.config import Config
-    import psycopg2
-    
-    config = Config()
-    conn = psycopg2.connect(**config.db_connection_parameters)
-    cursor = conn.cursor()
-    
-    with open('migration.sql', 'r') as f:
-        cursor.execute(f.read())
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print('Database migration successful')
-except Exception as e:
-    print(f'Database migration failed: {e}')
-    sys.exit(1)
-"; then
+    # Apply versioned migrations (database/migrations.py), already applied ones are skipped
+    if python3 -m database.migrations; then
         print_status "Database migration applied"
     else
         print_error "Database migration failed"
         exit 1
     fi
-    
-    rm migration.sql
 }
 
 # Apply code updates
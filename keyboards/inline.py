@@ -1,16 +1,14 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database import selector as select
+from database.models import UserSnapshot
 
 
-async def device_kb(user_id: int):
+async def device_kb(user: UserSnapshot):
     """returns inline keyboard with various options of cfg choosing"""
     kb = InlineKeyboardMarkup(
         row_width=2,
     )
 
-    existing_devices = [
-        item[0].split("_")[-1] for item in select.all_user_configs(user_id=user_id)
-    ]
+    existing_devices = user.devices
 
     if "PC" not in existing_devices:
         kb.insert(
@@ -1,5 +1,5 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-from database.selector import is_user_have_config, all_user_configs
+from database.models import UserSnapshot
 
 
 async def payed_user_kb():
@@ -11,31 +11,27 @@ async def payed_user_kb():
     return keyboard
 
 
-async def free_user_kb(user_id: int):
+async def free_user_kb(user: UserSnapshot):
     keyboard = ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
     keyboard.insert(
         KeyboardButton(
             "💵 Оплатить",
         )
     )
-    if is_user_have_config(user_id=user_id):
+    if user.config_names:
         keyboard.insert(KeyboardButton("📁 Мои конфиги"))
     return keyboard
 
 
-async def configs_kb(user_id: int):
+async def configs_kb(user: UserSnapshot):
     configs_kb = ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
-    configs = all_user_configs(user_id=user_id)
 
-    if configs:
-        for config in configs:
-            configs_kb.insert(
-                KeyboardButton(
-                    f"🔐 {'ПК' if config[0].split('_')[-1] == 'PC' else 'Смартфон'}"
-                )
-            )
+    for device in user.devices:
+        configs_kb.insert(
+            KeyboardButton(f"🔐 {'ПК' if device == 'PC' else 'Смартфон'}")
+        )
 
-    if not configs or len(configs) < 2:
+    if user.config_count < 2:
         configs_kb.insert(KeyboardButton("🆕 Создать конфиг"))
 
     configs_kb.insert(KeyboardButton("🔙 Назад"))
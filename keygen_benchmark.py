@@ -0,0 +1,61 @@
+"""Benchmark of in-process key generation (utils.keygen) against the wg tool
+
+Checks that public keys are identical to `wg pubkey` output.
+Run on the server: python keygen_benchmark.py [rounds]
+"""
+
+import shutil
+import subprocess
+import sys
+import timeit
+
+from loguru import logger
+
+from utils.keygen import generate_key_pair, get_public_key
+
+
+def subprocess_key_pair() -> tuple[str, str]:
+    """key pair generation with the wg tool, as it was done before"""
+    private_key = subprocess.check_output(["wg", "genkey"]).decode("utf-8").strip()
+    public_key = (
+        subprocess.check_output(["wg", "pubkey"], input=private_key.encode("utf-8"))
+        .decode("utf-8")
+        .strip()
+    )
+    return private_key, public_key
+
+
+def main(rounds: int) -> None:
+    seconds = timeit.timeit(generate_key_pair, number=rounds)
+    logger.info(f"[+] in-process: {seconds / rounds * 1e3:.3f} ms per key pair ({rounds} rounds)")
+
+    if shutil.which("wg") is None:
+        logger.warning("[!] wg tool not found, subprocess benchmark skipped")
+        return
+
+    subprocess_seconds = timeit.timeit(subprocess_key_pair, number=rounds)
+    logger.info(
+        f"[+] subprocess: {subprocess_seconds / rounds * 1e3:.3f} ms per key pair "
+        f"({subprocess_seconds / seconds:.0f}x slower)"
+    )
+
+    # output must be byte-identical to wg
+    for _ in range(rounds):
+        private_key, public_key = generate_key_pair()
+        wg_public_key = (
+            subprocess.check_output(["wg", "pubkey"], input=private_key.encode("utf-8"))
+            .decode("utf-8")
+            .strip()
+        )
+        if public_key != wg_public_key:
+            logger.error(f"[-] public key mismatch: {public_key} != {wg_public_key}")
+            sys.exit(1)
+        wg_private_key, wg_public_key = subprocess_key_pair()
+        if get_public_key(wg_private_key) != wg_public_key:
+            logger.error(f"[-] public key of wg private key mismatch: {wg_public_key}")
+            sys.exit(1)
+    logger.success(f"[+] checked {rounds * 2} key pairs against wg pubkey: identical")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
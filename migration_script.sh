@@ -162,6 +162,14 @@ fi
 
 print_status "Starting migration..."
 
+# Step 7: Apply versioned database migrations (database/migrations.py)
+if python3 -m database.migrations; then
+    print_status "Database migrations applied"
+else
+    print_error "Database migration failed, restore from $BACKUP_DIR if needed"
+    exit 1
+fi
+
 # Create rollback script
 cat > "$BACKUP_DIR/rollback.sh" << 'EOF'
 #!/bin/bash
@@ -0,0 +1,64 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# data.configuration is built on import and requires these variables
+for name, value in {
+    "WG_BOT_TOKEN": "0:test",
+    "ADMINS_IDS": "1",
+    "PAYMENT_CARD": "0000",
+    "CONFIGS_PREFIX": "test",
+    "BASE_SUBSCRIPTION_MONTHLY_PRICE_RUBLES": "100",
+    "PEER_DNS": "1.1.1.1",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_USER": "test",
+    "DB_USER_PASSWORD": "test",
+    "DATABASE": "test",
+    "WG_BACKEND": "fake",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SERVER_CONFIG = """[Interface]
+Address = 10.0.0.1/24
+ListenPort = 51820
+PrivateKey = c2VydmVyLXByaXZhdGUta2V5LXNlcnZlci1wcml2YXQ=
+PostUp = iptables -A FORWARD -i %i -j ACCEPT
+
+#alice_PC
+[Peer]
+PublicKey = YWxpY2UtcGMtcHVibGljLWtleS1hbGljZS1wYy1wdWI=
+PresharedKey = cHJlc2hhcmVkLWtleS1wcmVzaGFyZWQta2V5LXByZXM=
+AllowedIPs = 10.0.0.2/32
+
+#DISCONNECTED_bob_PHONE
+#[Peer]
+#PublicKey = Ym9iLXBob25lLXB1YmxpYy1rZXktYm9iLXBob25lLXA=
+#AllowedIPs = 10.0.0.3/32
+
+# hand-written note about the next peer
+#alice_PHONE
+[Peer]
+PublicKey = YWxpY2UtcGhvbmUtcHVibGljLWtleS1hbGljZS1waG8=
+AllowedIPs = 10.0.0.4/32
+Endpoint = 192.0.2.10:51820
+"""
+
+
+@pytest.fixture
+def wireguard(tmp_path, monkeypatch):
+    """WireguardConfig over a temporary wg0.conf with the fake backend"""
+    from utils.vpn_cfg_work import WireguardConfig
+
+    path = tmp_path / "wg0.conf"
+    path.write_text(SERVER_CONFIG)
+    monkeypatch.setenv("WG_CFG_PATH", str(path))
+    wireguard = WireguardConfig()
+    wireguard.config.close()
+    # compacted peers come from the database, there are none here
+    wireguard._archived_addresses = set()
+    return wireguard
@@ -0,0 +1,51 @@
+import asyncio
+
+from utils import broadcast
+
+
+def test_broadcast_keeps_running_when_recipients_are_not_loaded(monkeypatch):
+    statuses = []
+
+    async def get_broadcast_counts(broadcast_id):
+        return None
+
+    async def get_broadcast_pending_user_ids(broadcast_id):
+        return None
+
+    async def set_broadcast_status(broadcast_id, status):
+        statuses.append(status)
+
+    monkeypatch.setattr(broadcast.aio.selector, "get_broadcast_counts", get_broadcast_counts)
+    monkeypatch.setattr(
+        broadcast.aio.selector, "get_broadcast_pending_user_ids", get_broadcast_pending_user_ids
+    )
+    monkeypatch.setattr(broadcast.aio.update, "set_broadcast_status", set_broadcast_status)
+
+    item = broadcast.Broadcast(1, "hello", limiter=None, workers=1)
+    asyncio.run(item._run())
+    assert item.status == "failed"
+    # broadcast is not finished in database and is resumed on next start
+    assert statuses == []
+
+
+def test_notify_admins_does_not_ban_admin_that_blocked_bot(monkeypatch):
+    from aiogram.utils.exceptions import BotBlocked
+
+    from utils import bot_error_handler
+
+    banned = []
+
+    class BlockedBot:
+        async def send_message(self, user_id, text, **kwargs):
+            raise BotBlocked("Forbidden: bot was blocked by the user")
+
+    async def handle_bot_blocked_error(user_id, error):
+        banned.append(user_id)
+
+    monkeypatch.setattr(broadcast, "bot", BlockedBot())
+    monkeypatch.setattr(broadcast.configuration, "_admins", [1, 2])
+    monkeypatch.setattr(bot_error_handler, "handle_bot_blocked_error", handle_bot_blocked_error)
+    monkeypatch.setattr(broadcast.telegram_limiter, "acquire", lambda chat_id: asyncio.sleep(0))
+
+    assert asyncio.run(broadcast.notify_admins("hello")) == 0
+    assert banned == []
@@ -0,0 +1,67 @@
+from database.cache import MISSING, UserStateCache
+
+
+def test_set_and_get():
+    cache = UserStateCache(max_size=10, ttl=60)
+    generation = cache.generation(1)
+    assert cache.set(1, "name", "alice", generation) == "alice"
+    assert cache.get(1, "name") == "alice"
+
+
+def test_invalidate_drops_values():
+    cache = UserStateCache(max_size=10, ttl=60)
+    cache.set(1, "name", "alice", cache.generation(1))
+    cache.invalidate_user(1)
+    assert cache.get(1, "name") is MISSING
+
+
+def test_fill_read_before_invalidation_is_dropped():
+    cache = UserStateCache(max_size=10, ttl=60)
+    # reader takes generation and queries the database
+    generation = cache.generation(1)
+    # writer commits and invalidates before the reader stores its row
+    cache.invalidate_user(1)
+    assert cache.set(1, "name", "stale", generation) == "stale"
+    assert cache.get(1, "name") is MISSING
+    assert cache.stats()["stale_sets"] == 1
+    # next reader caches fresh value
+    cache.set(1, "name", "fresh", cache.generation(1))
+    assert cache.get(1, "name") == "fresh"
+
+
+def test_invalidation_of_other_user_keeps_fill():
+    cache = UserStateCache(max_size=10, ttl=60)
+    generation = cache.generation(1)
+    cache.invalidate_user(2)
+    cache.set(1, "name", "alice", generation)
+    assert cache.get(1, "name") == "alice"
+
+
+def test_snapshots_fill_drops_only_invalidated_user(monkeypatch):
+    import asyncio
+    from database import aio
+    from database.cache import user_cache
+
+    class FakePool:
+        async def fetch(self, query, user_ids):
+            # user 102 is updated while the rows are on their way
+            user_cache.invalidate_user(102)
+            return [
+                {"user_id": user_id, "username": f"user{user_id}", "is_banned": False,
+                 "subscription_end_date": None, "config_names": []}
+                for user_id in sorted(user_ids)
+            ]
+
+    async def get_pool():
+        return FakePool()
+
+    monkeypatch.setattr(aio.selector, "get_pool", get_pool)
+    # every user starts the fill at its own generation
+    for user_id in (101, 102, 102, 103, 103, 103):
+        user_cache.invalidate_user(user_id)
+    snapshots = asyncio.run(aio.selector.get_user_snapshots([101, 102, 103]))
+    assert sorted(snapshots) == [101, 102, 103]
+    assert user_cache.get(101, "get_user_snapshot").username == "user101"
+    assert user_cache.get(102, "get_user_snapshot") is MISSING
+    assert user_cache.get(103, "get_user_snapshot").username == "user103"
+    user_cache.clear()
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.expiry_scheduler import EXPIRED, HORIZON, ExpiryScheduler
+
+DAY = timedelta(days=1)
+
+
+async def handler(due):
+    pass
+
+
+@pytest.fixture
+def scheduler():
+    """scheduler as if it was reloaded just now, without database"""
+    scheduler = ExpiryScheduler(handler)
+    scheduler._loaded_until = datetime.now() + HORIZON
+    return scheduler
+
+
+def test_reschedule_skips_stale_events(scheduler):
+    now = datetime.now()
+    scheduler.schedule(1, now + 3 * DAY)
+    # payment moves the end two days later
+    scheduler.schedule(1, now + 5 * DAY)
+    # every event of the old end date is due, only the 2 days reminder of the new one
+    assert scheduler._pop_due(now + 3 * DAY + timedelta(hours=1)) == {1: 2}
+    assert scheduler.stats()["stale_skipped"] == 4
+    assert scheduler._end_dates[1] == now + 5 * DAY
+
+
+def test_end_date_after_loaded_horizon_waits_for_reload(scheduler):
+    now = datetime.now()
+    scheduler.schedule(1, now + 3 * DAY)
+    scheduler.schedule(1, now + 10 * DAY)
+    scheduler.schedule(2, now + 10 * DAY)
+    assert scheduler._end_dates == {}
+    assert scheduler._pop_due(now + 11 * DAY) == {}
+
+    # the reload that reaches the end date schedules it
+    scheduler._loaded_until = now + 10 * DAY + HORIZON
+    scheduler.schedule(2, now + 10 * DAY)
+    assert scheduler._pop_due(now + 11 * DAY) == {2: EXPIRED}
+
+
+def test_subscription_cut_short_expires_immediately(scheduler):
+    now = datetime.now()
+    scheduler.schedule(1, now + 3 * DAY)
+    scheduler.schedule(1, now - timedelta(hours=1))
+    # already expired users that were not scheduled are left to the watchdog
+    scheduler.schedule(2, now - timedelta(hours=1))
+    assert scheduler._pop_due(datetime.now()) == {1: EXPIRED}
+    assert scheduler._end_dates == {}
+    # events of the cancelled end date do not fire later
+    assert scheduler._pop_due(now + 4 * DAY) == {}
+
+
+def test_due_events_of_user_collapse_to_nearest(scheduler):
+    now = datetime.now()
+    scheduler.schedule(1, now + 3 * DAY)
+    scheduler.schedule(2, now + 5 * DAY)
+    # runner woke up late, all events of user 1 are due together
+    assert scheduler._pop_due(now + 3 * DAY + timedelta(minutes=1)) == {1: EXPIRED, 2: 2}
+    assert list(scheduler._end_dates) == [2]
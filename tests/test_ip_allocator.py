@@ -0,0 +1,47 @@
+from ipaddress import IPv4Address
+
+import pytest
+
+from utils.ip_allocator import AddressAllocator, AddressPool
+
+
+def test_allocate_skips_reserved_and_used():
+    pool = AddressPool("10.0.0.0/29", reserved=["10.0.0.1"])
+    pool.reserve("10.0.0.3")
+    assert [str(pool.allocate()) for _ in range(4)] == [
+        "10.0.0.2",
+        "10.0.0.4",
+        "10.0.0.5",
+        "10.0.0.6",
+    ]
+    assert pool.allocate() is None
+
+
+def test_released_address_is_reused():
+    pool = AddressPool("10.0.0.0/29", reserved=["10.0.0.1"])
+    first = pool.allocate()
+    pool.allocate()
+    assert pool.release(first)
+    assert not pool.release(first)
+    assert pool.allocate() == first
+
+
+def test_reserved_address_is_never_released():
+    pool = AddressPool("10.0.0.0/29", reserved=["10.0.0.1"])
+    assert not pool.release("10.0.0.1")
+    assert pool.is_used("10.0.0.1")
+
+
+def test_allocator_moves_to_next_pool():
+    allocator = AddressAllocator(["10.0.0.0/30", "10.0.1.0/30"])
+    assert [allocator.allocate() for _ in range(3)] == [
+        IPv4Address("10.0.0.1"),
+        IPv4Address("10.0.0.2"),
+        IPv4Address("10.0.1.1"),
+    ]
+    assert not allocator.release("192.168.0.1")
+
+
+def test_too_small_pool():
+    with pytest.raises(ValueError):
+        AddressPool("10.0.0.0/31")
@@ -0,0 +1,27 @@
+import base64
+
+import pytest
+
+from utils import keygen
+
+
+def test_public_key_matches_rfc7748_vector():
+    private_key = base64.b64encode(
+        bytes.fromhex("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+    ).decode("ascii")
+    public_key = bytes.fromhex("8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a")
+    assert base64.b64decode(keygen.get_public_key(private_key)) == public_key
+
+
+def test_private_key_is_clamped():
+    for _ in range(100):
+        raw = base64.b64decode(keygen.generate_private_key())
+        assert len(raw) == keygen.KEY_SIZE
+        assert raw[0] & 7 == 0
+        assert raw[31] & 128 == 0
+        assert raw[31] & 64 == 64
+
+
+def test_invalid_private_key():
+    with pytest.raises(ValueError):
+        keygen.get_public_key(base64.b64encode(b"short").decode("ascii"))
@@ -0,0 +1,52 @@
+from conftest import SERVER_CONFIG
+from utils.peer_registry import Peer, PeerRegistry
+
+
+def test_parse_render_round_trip():
+    registry = PeerRegistry.parse(SERVER_CONFIG)
+    assert registry.render() == SERVER_CONFIG
+    assert len(registry) == 3
+    assert [peer.name for peer in registry] == ["alice_PC", "bob_PHONE", "alice_PHONE"]
+
+
+def test_indexes():
+    registry = PeerRegistry.parse(SERVER_CONFIG)
+    assert [peer.name for peer in registry.peers_of("alice")] == ["alice_PC", "alice_PHONE"]
+    assert registry.by_address("10.0.0.3").name == "bob_PHONE"
+    assert registry.get("bob_PHONE").disabled
+    assert registry.get("alice_PHONE").fields["Endpoint"] == "192.0.2.10:51820"
+    assert [str(address) for address in registry.interface_addresses()] == ["10.0.0.1/24"]
+
+
+def test_disable_enable():
+    registry = PeerRegistry.parse(SERVER_CONFIG)
+    assert registry.disable("alice_PC")
+    assert not registry.disable("alice_PC")
+    text = registry.render()
+    assert "#DISCONNECTED_alice_PC\n#[Peer]\n#PublicKey = " in text
+    # disabled peer is parsed back as disabled
+    assert PeerRegistry.parse(text).get("alice_PC").disabled
+
+    assert registry.enable("alice_PC")
+    assert registry.enable("bob_PHONE")
+    assert not registry.enable("unknown_PC")
+    assert "#bob_PHONE\n[Peer]\nPublicKey = " in registry.render()
+
+
+def test_add_remove():
+    registry = PeerRegistry.parse(SERVER_CONFIG)
+    registry.add(Peer("carol_PC", public_key="carol-key", allowed_ips="10.0.0.5/32"))
+    assert registry.render().endswith(
+        "#carol_PC\n[Peer]\nPublicKey = carol-key\nAllowedIPs = 10.0.0.5/32\n\n"
+    )
+    assert registry.remove("carol_PC").address == "10.0.0.5"
+    assert registry.by_address("10.0.0.5") is None
+    assert registry.remove("carol_PC") is None
+
+
+def test_render_stripped_skips_comments_and_disabled_peers():
+    stripped = PeerRegistry.parse(SERVER_CONFIG).render_stripped()
+    assert "Address" not in stripped
+    assert "PostUp" not in stripped
+    assert "#" not in stripped
+    assert stripped.count("[Peer]") == 2
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from utils.process import CommandError, ProcessRunner
+
+
+def test_run_returns_stdout():
+    runner = ProcessRunner()
+    output = asyncio.run(runner.run(sys.executable, "-c", "print(input().upper())", input="wg0"))
+    assert output == "WG0\n"
+
+
+def test_non_zero_exit_code():
+    runner = ProcessRunner()
+    command = (sys.executable, "-c", "import sys; sys.exit('no such device')")
+    with pytest.raises(CommandError) as error:
+        asyncio.run(runner.run(*command))
+    assert error.value.returncode == 1
+    assert error.value.stderr == "no such device"
+    assert runner.stats()[f"{os.path.basename(sys.executable)} -c"]["failures"] == 1
+
+
+def test_timeout_kills_command():
+    runner = ProcessRunner(timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(CommandError) as error:
+        asyncio.run(runner.run("sleep", "10"))
+    assert error.value.returncode is None
+    assert time.monotonic() - started < 5
+    assert runner.stats()["sleep 10"]["timeouts"] == 1
+
+
+def test_cancel_kills_command(monkeypatch):
+    runner = ProcessRunner()
+    processes = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def recording_exec(*args, **kwargs):
+        process = await create_subprocess_exec(*args, **kwargs)
+        processes.append(process)
+        return process
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", recording_exec)
+
+    async def main():
+        task = asyncio.create_task(runner.run("sleep", "10"))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert processes[0].returncode is not None
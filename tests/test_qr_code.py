@@ -0,0 +1,53 @@
+import os
+import stat
+
+from utils.qr_code import QRCodeCache
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_directory_and_files_are_private(tmp_path):
+    directory = tmp_path / "qr"
+    directory.mkdir(mode=0o755)
+    cache = QRCodeCache(max_bytes=1024, directory=str(directory))
+    cache.set("a", b"image")
+    assert mode(directory) == 0o700
+    assert mode(directory / "a.png") == 0o600
+
+
+def test_disk_budget_evicts_least_recently_used(tmp_path):
+    cache = QRCodeCache(max_bytes=0, directory=str(tmp_path), disk_max_bytes=25, disk_max_files=10)
+    for key in "abc":
+        cache.set(key, b"x" * 10)
+    assert sorted(os.listdir(tmp_path)) == ["b.png", "c.png"]
+
+    # read from disk, so "c" is evicted next
+    assert cache.get("b") == b"x" * 10
+    cache.set("d", b"x" * 10)
+    assert sorted(os.listdir(tmp_path)) == ["b.png", "d.png"]
+    assert cache.stats()["disk_evictions"] == 2
+
+    files_limited = QRCodeCache(max_bytes=0, directory=str(tmp_path), disk_max_files=1)
+    assert files_limited.stats()["disk_files"] == 1
+
+
+def test_discard_removes_image_from_memory_and_disk(tmp_path):
+    cache = QRCodeCache(max_bytes=1024, directory=str(tmp_path))
+    cache.set("a", b"image")
+    cache.discard("a")
+    cache.discard("unknown")
+    assert cache.get("a") is None
+    assert os.listdir(tmp_path) == []
+    assert cache.stats()["disk_bytes"] == 0
+
+
+def test_directory_is_loaded_on_start(tmp_path):
+    QRCodeCache(max_bytes=1024, directory=str(tmp_path)).set("a", b"image")
+    (tmp_path / "leftover.tmp").write_bytes(b"partial")
+
+    cache = QRCodeCache(max_bytes=1024, directory=str(tmp_path))
+    assert os.listdir(tmp_path) == ["a.png"]
+    assert cache.get("a") == b"image"
+    assert cache.stats()["disk_hits"] == 1
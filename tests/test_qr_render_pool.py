@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from utils.qr_code import QRQueueFull, QRRenderPool, render_qr_code
+
+
+def test_render_in_worker_process():
+    pool = QRRenderPool(workers=1, max_queue=4)
+
+    async def main():
+        try:
+            return await asyncio.gather(
+                pool.render("key", "[Interface]"), pool.render("key", "[Interface]")
+            )
+        finally:
+            pool.shutdown()
+
+    first, second = asyncio.run(main())
+    assert first == second == render_qr_code("[Interface]")
+    assert first.startswith(b"\x89PNG")
+    # same key requested while rendering is rendered once
+    assert pool.stats()["renders"] == 1
+
+
+def test_queue_limit():
+    pool = QRRenderPool(workers=1, max_queue=1)
+
+    async def main():
+        try:
+            first = asyncio.create_task(pool.render("a", "[Interface]"))
+            await asyncio.sleep(0)
+            with pytest.raises(QRQueueFull):
+                await pool.render("b", "[Peer]")
+            await first
+        finally:
+            pool.shutdown()
+
+    asyncio.run(main())
+    assert pool.stats()["rejected"] == 1
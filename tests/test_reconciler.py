@@ -0,0 +1,104 @@
+import asyncio
+
+from conftest import SERVER_CONFIG
+from database import aio
+from utils.peer_registry import Peer, PeerRegistry
+from utils.reconciler import compute_drift, reconcile
+from utils.wg_backends import LivePeer
+from utils.wg_batch import ADD
+
+
+def owner(config_name: str, is_banned: bool = False, is_expired: bool = False) -> dict:
+    return {
+        "config_name": config_name,
+        "is_banned": is_banned,
+        "is_expired": is_expired,
+    }
+
+
+def use_owners(monkeypatch, *states: list[dict]):
+    """every get_config_owners call returns the next state, filtered by names"""
+    calls = []
+
+    async def get_config_owners(config_names=None):
+        rows = states[min(len(calls), len(states) - 1)]
+        calls.append(config_names)
+        return [row for row in rows if config_names is None or row["config_name"] in config_names]
+
+    async def get_archived_peers(usernames=None):
+        return []
+
+    monkeypatch.setattr(aio.selector, "get_config_owners", get_config_owners)
+    monkeypatch.setattr(aio.selector, "get_archived_peers", get_archived_peers)
+    return calls
+
+
+def test_compute_drift():
+    registry = PeerRegistry.parse(SERVER_CONFIG)
+    alice_pc = registry.get("alice_PC")
+    live = {
+        alice_pc.public_key: LivePeer(alice_pc.public_key, "10.0.0.9/32"),
+        "unknown-key": LivePeer("unknown-key", "10.0.0.8/32"),
+    }
+    drift = compute_drift(
+        [owner("alice_PC"), owner("alice_PHONE", is_expired=True), owner("carol_PC")],
+        set(),
+        registry,
+        live,
+    )
+    assert drift.missing_in_config == ["carol_PC"]
+    assert drift.orphaned_in_config == ["bob_PHONE"]
+    assert drift.enabled_without_access == ["alice_PHONE"]
+    assert drift.missing_on_interface == ["alice_PHONE"]
+    assert drift.allowed_ips_mismatch == ["alice_PC"]
+    assert drift.unknown_on_interface == ["unknown-key"]
+    assert drift.interface_drift
+
+
+def test_apply_disables_expired_peers_and_syncs(wireguard, monkeypatch):
+    state = [owner("alice_PC", is_expired=True), owner("alice_PHONE"), owner("bob_PHONE")]
+    use_owners(monkeypatch, state)
+
+    drift = asyncio.run(reconcile(wireguard, apply=True))
+
+    assert drift.enabled_without_access == ["alice_PC"]
+    registry = PeerRegistry.parse(open(wireguard.cfg_path).read())
+    assert registry.get("alice_PC").disabled
+    assert not registry.get("alice_PHONE").disabled
+    # interface was empty, so it is synced with the saved config
+    assert wireguard.backend.calls["sync"] == 1
+    assert list(wireguard.backend.peers) == [registry.get("alice_PHONE").public_key]
+
+
+def test_apply_keeps_peer_of_user_who_paid_meanwhile(wireguard, monkeypatch):
+    before = [owner("alice_PC", is_expired=True), owner("alice_PHONE"), owner("bob_PHONE")]
+    after = [owner("alice_PC"), owner("alice_PHONE"), owner("bob_PHONE")]
+    calls = use_owners(monkeypatch, before, after)
+
+    drift = asyncio.run(reconcile(wireguard, apply=True))
+
+    assert drift.enabled_without_access == ["alice_PC"]
+    assert calls == [None, ["alice_PC"]]
+    assert not PeerRegistry.parse(open(wireguard.cfg_path).read()).get("alice_PC").disabled
+
+
+def test_orphans_are_disabled_only_on_request_and_never_when_just_added(wireguard, monkeypatch):
+    wireguard.changes.debounce = 0.01
+    # bob_PHONE is disabled already, alice_PHONE has no config in database (added by hand)
+    use_owners(monkeypatch, [owner("alice_PC"), owner("bob_PHONE")])
+
+    async def main():
+        # config row of carol_PC is not inserted yet
+        await wireguard.changes.submit(
+            ADD, "carol_PC", Peer("carol_PC", public_key="carol-key", allowed_ips="10.0.0.5/32")
+        )
+        kept = await reconcile(wireguard, apply=True)
+        assert kept.orphaned_in_config == ["alice_PHONE", "carol_PC"]
+        assert not (await wireguard.get_registry()).get("alice_PHONE").disabled
+
+        await reconcile(wireguard, apply=True, disable_orphans=True)
+
+    asyncio.run(main())
+    registry = PeerRegistry.parse(open(wireguard.cfg_path).read())
+    assert registry.get("alice_PHONE").disabled
+    assert not registry.get("carol_PC").disabled
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from database.models import UserSnapshot
+from utils import watchdog
+
+END_DATE = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def notify(monkeypatch):
+    """runs Watchdog.notify_users with database, Telegram and wg0.conf replaced,
+    returns what was sent, disconnected and released"""
+    calls = {"sent": [], "disconnected": [], "released": []}
+    delivered = {}
+
+    async def get_user_snapshots(user_ids):
+        return {
+            user_id: UserSnapshot(
+                user_id=user_id, exists=True, subscription_end_date=END_DATE
+            )
+            for user_id in user_ids
+        }
+
+    async def claim_notifications(notifications):
+        return {(user_id, days) for user_id, days, _ in notifications}
+
+    async def release_notifications(notifications):
+        calls["released"].extend(notifications)
+
+    async def safe_send_message(bot, user_id, text, limiter=None, **kwargs):
+        calls["sent"].append(user_id)
+        return delivered.get(user_id, True)
+
+    async def free_user_kb(snapshot):
+        return None
+
+    async def disconnect_peers(user_ids):
+        if calls.get("disconnect_error"):
+            raise OSError("disk full")
+        calls["disconnected"].extend(user_ids)
+        return []
+
+    monkeypatch.setattr(watchdog, "get_user_snapshots", get_user_snapshots)
+    monkeypatch.setattr(watchdog, "claim_notifications", claim_notifications)
+    monkeypatch.setattr(watchdog, "release_notifications", release_notifications)
+    monkeypatch.setattr(watchdog, "safe_send_message", safe_send_message)
+    monkeypatch.setattr(watchdog.kb.reply, "free_user_kb", free_user_kb)
+    monkeypatch.setattr(watchdog.vpn_config, "disconnect_peers", disconnect_peers)
+
+    def run(days_by_user, undelivered=(), disconnect_error=False):
+        delivered.update({user_id: False for user_id in undelivered})
+        calls["disconnect_error"] = disconnect_error
+        asyncio.run(watchdog.Watchdog().notify_users(days_by_user))
+        return calls
+
+    return run
+
+
+def test_expired_user_is_disconnected_even_if_message_failed(notify):
+    calls = notify({1: -1, 2: -1, 3: 2}, undelivered=[2])
+    assert sorted(calls["sent"]) == [1, 2, 3]
+    assert sorted(calls["disconnected"]) == [1, 2]
+    # message is sent again by the next check
+    assert calls["released"] == [(2, -1, END_DATE)]
+
+
+def test_failed_disconnect_releases_expiry_claims(notify):
+    calls = notify({1: -1, 2: -1, 3: 2}, undelivered=[2], disconnect_error=True)
+    assert calls["disconnected"] == []
+    assert sorted(calls["released"]) == [(1, -1, END_DATE), (2, -1, END_DATE)]
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from conftest import SERVER_CONFIG
+from utils.peer_registry import Peer, PeerRegistry
+from utils.process import ProcessRunner
+from utils.wg_backends import (
+    FakeBackend,
+    LiveBackend,
+    WgQuickBackend,
+    WireguardBackend,
+    create_backend,
+)
+
+PARAMETERS = {"interface": "wg0", "binary": "wg", "sudo": False, "timeout": 1}
+
+
+class RecordingRunner(ProcessRunner):
+    """commands are recorded instead of being run"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.commands = []
+
+    async def run(self, *command, input=None, timeout=None) -> str:
+        self.commands.append((command, input))
+        return ""
+
+
+def test_base_backend_is_abstract():
+    with pytest.raises(TypeError):
+        WireguardBackend(ProcessRunner(), PARAMETERS)
+    with pytest.raises(ValueError):
+        create_backend("unknown", ProcessRunner(), PARAMETERS)
+
+
+def test_fake_backend_apply_sync_restart(wireguard):
+    backend = wireguard.backend
+    assert isinstance(backend, FakeBackend)
+
+    async def main():
+        registry = await wireguard.get_registry()
+        await backend.sync(registry)
+        assert len(await backend.show()) == 2
+
+        registry.disable("alice_PC")
+        await wireguard.apply_peer_changes(registry, changed=[registry.get("alice_PC")])
+        removed = registry.remove("alice_PHONE")
+        await wireguard.apply_peer_changes(registry, removed=[removed])
+        assert await backend.show() == {}
+
+        registry.enable("bob_PHONE")
+        await wireguard.apply_peer_changes(registry, changed=[registry.get("bob_PHONE")])
+        assert list(await backend.show()) == [registry.get("bob_PHONE").public_key]
+
+        await wireguard.restart_service()
+
+    asyncio.run(main())
+    assert backend.calls == {
+        "sync": 1,
+        "show": 3,
+        "remove_peer": 2,
+        "add_peer": 1,
+        "restart": 1,
+    }
+
+
+@pytest.mark.parametrize("sudo", [False, True])
+def test_wg_quick_restart_respects_sudo(sudo):
+    runner = RecordingRunner()
+    backend = WgQuickBackend(runner, {**PARAMETERS, "sudo": sudo})
+    asyncio.run(backend.restart())
+    command = ("systemctl", "restart", "wg-quick@wg0.service")
+    assert runner.commands == [(("sudo", *command) if sudo else command, None)]
+
+
+def test_live_backend_syncs_batches_and_sets_single_peers():
+    runner = RecordingRunner()
+    backend = LiveBackend(runner, PARAMETERS)
+    registry = PeerRegistry.parse(SERVER_CONFIG)
+    carol = registry.add(Peer("carol_PC", public_key="carol-key", allowed_ips="10.0.0.5/32"))
+
+    asyncio.run(backend.apply(registry, changed=[carol]))
+    asyncio.run(backend.apply(registry, changed=[carol], removed=[registry.get("alice_PC")]))
+
+    single, batch = runner.commands
+    assert single == (("wg", "set", "wg0", "peer", "carol-key", "allowed-ips", "10.0.0.5/32"), None)
+    assert batch == (("wg", "syncconf", "wg0", "/dev/stdin"), registry.render_stripped())
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.peer_registry import Peer, PeerRegistry
+from utils.wg_batch import ADD, DISABLE, ENABLE, REMOVE
+
+
+def new_peer(name: str, address: str) -> Peer:
+    return Peer(name, public_key=f"{name}-public-key", allowed_ips=f"{address}/32")
+
+
+def test_write_failure_fails_futures_and_keeps_file(wireguard, monkeypatch):
+    wireguard.changes.debounce = 0.01
+    before = open(wireguard.cfg_path).read()
+
+    def broken_write(text):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(wireguard.writer, "_write_file", broken_write)
+
+    async def main():
+        await wireguard.get_registry()
+        with pytest.raises(OSError):
+            await wireguard.changes.submit(ADD, "carol_PC", new_peer("carol_PC", "10.0.0.5"))
+        registry = await wireguard.get_registry()
+        assert "carol_PC" not in registry
+        assert wireguard.backend.peers == {}
+
+    asyncio.run(main())
+    assert open(wireguard.cfg_path).read() == before
+
+
+def test_apply_failure_after_write_resolves_and_syncs(wireguard, monkeypatch):
+    wireguard.changes.debounce = 0.01
+
+    async def broken_apply(registry, changed=(), removed=()):
+        raise RuntimeError("interface is down")
+
+    monkeypatch.setattr(wireguard, "apply_peer_changes", broken_apply)
+
+    async def main():
+        assert await wireguard.changes.submit(DISABLE, "alice_PC") is True
+        # interface catches up with the written file by a full sync
+        await wireguard.changes._sync_task
+
+    asyncio.run(main())
+    assert "#DISCONNECTED_alice_PC" in open(wireguard.cfg_path).read()
+    assert wireguard.backend.calls["sync"] == 1
+    assert set(wireguard.backend.peers) == {"YWxpY2UtcGhvbmUtcHVibGljLWtleS1hbGljZS1waG8="}
+    assert wireguard.changes.stats()["syncs"] == 1
+
+
+def test_concurrent_submits_are_written_in_one_batch(wireguard):
+    wireguard.changes.debounce = 0.05
+
+    async def main():
+        return await asyncio.gather(
+            wireguard.changes.submit(ADD, "carol_PC", new_peer("carol_PC", "10.0.0.5")),
+            wireguard.changes.submit(DISABLE, "alice_PC"),
+            wireguard.changes.submit(ENABLE, "bob_PHONE"),
+            # merged with the change above, last one wins
+            wireguard.changes.submit(DISABLE, "alice_PHONE"),
+            wireguard.changes.submit(ENABLE, "alice_PHONE"),
+        )
+
+    added, disabled, enabled, *_ = asyncio.run(main())
+    assert added.name == "carol_PC"
+    assert disabled is True and enabled is True
+    assert wireguard.writer.stats()["writes"] == 1
+    assert wireguard.changes.stats()["batches"] == 1
+
+    registry = PeerRegistry.parse(open(wireguard.cfg_path).read())
+    assert registry.get("alice_PC").disabled
+    assert not registry.get("bob_PHONE").disabled
+    assert not registry.get("alice_PHONE").disabled
+    assert registry.get("carol_PC").address == "10.0.0.5"
+    assert wireguard.backend.calls == {"add_peer": 2, "remove_peer": 1}
+
+
+def test_address_is_not_reused_before_removal_is_written(wireguard, monkeypatch):
+    wireguard.changes.debounce = 0.01
+    write_file = wireguard.writer._write_file
+    writing = threading.Event()
+    proceed = threading.Event()
+
+    def slow_write(text):
+        writing.set()
+        proceed.wait(5)
+        return write_file(text)
+
+    monkeypatch.setattr(wireguard.writer, "_write_file", slow_write)
+
+    async def main():
+        await wireguard.get_registry()
+        removal = wireguard.changes.submit(REMOVE, "alice_PC")
+        await asyncio.get_running_loop().run_in_executor(None, writing.wait, 5)
+        # file still has alice_PC, the address must stay taken
+        assert wireguard._allocator.is_used("10.0.0.2")
+        proceed.set()
+        assert await removal is True
+        assert not wireguard._allocator.is_used("10.0.0.2")
+        return await wireguard.allocate_address("carol_PC")
+
+    assert asyncio.run(main()) == "10.0.0.2"
+    assert "alice_PC" not in open(wireguard.cfg_path).read()
+
+
+def test_failed_add_releases_address(wireguard, monkeypatch):
+    wireguard.changes.debounce = 0.01
+    write_file = wireguard.writer._write_file
+    failures = [OSError("disk full")]
+
+    def flaky_write(text):
+        if failures:
+            raise failures.pop()
+        return write_file(text)
+
+    monkeypatch.setattr(wireguard.writer, "_write_file", flaky_write)
+
+    async def main():
+        assert await wireguard.add_new_peer("carol_PC", "carol-public-key") is None
+        return await wireguard.add_new_peer("carol_PC", "carol-public-key")
+
+    # first free address is handed out again after the failed write
+    assert asyncio.run(main()) == "10.0.0.5"
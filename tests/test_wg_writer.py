@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+import pytest
+
+from utils.wg_writer import ConfigWriter
+
+
+def test_write_replaces_file_and_keeps_backups(tmp_path):
+    path = tmp_path / "wg0.conf"
+    path.write_text("v0")
+    os.chmod(path, 0o640)
+    writer = ConfigWriter(str(path), backups=2)
+
+    async def main():
+        for version in ("v1", "v2", "v3"):
+            await writer.write(version)
+        await writer.close()
+
+    asyncio.run(main())
+    assert path.read_text() == "v3"
+    assert (tmp_path / "wg0.conf.bak.1").read_text() == "v2"
+    assert (tmp_path / "wg0.conf.bak.2").read_text() == "v1"
+    assert not (tmp_path / "wg0.conf.bak.3").exists()
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+
+def test_queued_writes_are_coalesced(tmp_path):
+    path = tmp_path / "wg0.conf"
+    writer = ConfigWriter(str(path), backups=0)
+
+    async def main():
+        await asyncio.gather(*(writer.write(f"v{version}") for version in range(10)))
+        await writer.close()
+
+    asyncio.run(main())
+    assert path.read_text() == "v9"
+    assert writer.stats()["requests"] == 10
+    assert writer.stats()["writes"] < 10
+
+
+def test_failed_write_keeps_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "wg0.conf"
+    path.write_text("old")
+    writer = ConfigWriter(str(path), backups=1)
+
+    def broken_replace(src, dst):
+        raise OSError("no space left on device")
+
+    async def main():
+        with pytest.raises(OSError):
+            await writer.write("new")
+        await writer.close()
+
+    monkeypatch.setattr(os, "replace", broken_replace)
+    asyncio.run(main())
+    assert path.read_text() == "old"
+    # temp file is removed, only config, lock and backup are left
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == [
+        "wg0.conf",
+        "wg0.conf.bak.1",
+        "wg0.conf.lock",
+    ]
@@ -3,10 +3,9 @@ Bot error handling utilities for WireGuard bot
 Handles cases when users block the bot
 """
 
-from aiogram.utils.exceptions import BotBlocked, ChatNotFound, UserDeactivated
+from aiogram.utils.exceptions import BotBlocked, ChatNotFound, RetryAfter, UserDeactivated
 from loguru import logger
-import database.selector
-import database.update
+from database import aio
 from loader import vpn_config
 
 
@@ -22,7 +21,7 @@ async def handle_bot_blocked_error(user_id: int, error: Exception):
         logger.warning(f"[!] Bot blocked by user {user_id}: {error}")
         
         # Check if user exists in database
-        if database.selector.is_exist_user(user_id):
+        if await aio.selector.is_exist_user(user_id):
             # Completely ban the user (remove configs and mark as banned)
             await vpn_config.ban_user_completely(user_id)
             logger.warning(f"[!] User {user_id} has been permanently banned due to bot blocking")
@@ -33,7 +32,9 @@ async def handle_bot_blocked_error(user_id: int, error: Exception):
         raise error
 
 
-async def safe_send_message(bot, user_id: int, text: str, **kwargs):
+async def safe_send_message(
+    bot, user_id: int, text: str, limiter=None, ban_on_block=True, **kwargs
+):
     """
     Safely send message to user with automatic blocking protection
     
@@ -41,17 +42,35 @@ async def safe_send_message(bot, user_id: int, text: str, **kwargs):
         bot: Bot instance
         user_id (int): User ID to send message to
         text (str): Message text
+        limiter (TelegramLimiter, optional): paces the message and resends it
+            after Telegram flood control (RetryAfter)
+        ban_on_block (bool, optional): ban user that blocked the bot, admins are
+            notified with False so they are never banned
         **kwargs: Additional arguments for send_message
         
     Returns:
         bool: True if message sent successfully, False if user blocked bot
     """
-    try:
-        await bot.send_message(user_id, text, **kwargs)
-        return True
-    except (BotBlocked, ChatNotFound, UserDeactivated) as e:
-        await handle_bot_blocked_error(user_id, e)
-        return False
-    except Exception as e:
-        logger.error(f"[-] Unexpected error sending message to {user_id}: {e}")
-        return False
+    retries = limiter.retries if limiter is not None else 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire(user_id)
+        try:
+            await bot.send_message(user_id, text, **kwargs)
+            return True
+        except RetryAfter as e:
+            if retries <= 0:
+                logger.error(f"[-] Flood control on message to {user_id}, retry after {e.timeout}s")
+                return False
+            retries -= 1
+            logger.warning(f"[!] Flood control on message to {user_id}, retry after {e.timeout}s")
+            limiter.retry_after(e.timeout)
+        except (BotBlocked, ChatNotFound, UserDeactivated) as e:
+            if ban_on_block:
+                await handle_bot_blocked_error(user_id, e)
+            else:
+                logger.warning(f"[!] Message to {user_id} was not delivered: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"[-] Unexpected error sending message to {user_id}: {e}")
+            return False
@@ -0,0 +1,214 @@
+"""Messages to many users at once
+
+Broadcast is stored in table broadcasts with a row per recipient in
+broadcast_recipients. Workers take recipients from a shared queue and send
+through safe_send_message paced by telegram_limiter, results are written
+in batches. A broadcast interrupted by restart continues from the
+recipients that are still pending.
+"""
+
+import asyncio
+import time
+
+from aiogram import types
+from loguru import logger
+
+from data import configuration
+from database import aio
+from loader import bot
+from utils.bot_error_handler import safe_send_message
+from utils.telegram_limiter import TelegramLimiter, telegram_limiter
+
+SENT = "sent"
+FAILED = "failed"
+# results are written to database by batches of this size
+RESULTS_BATCH = 100
+
+
+class Broadcast:
+    def __init__(
+        self,
+        broadcast_id: int,
+        text: str,
+        limiter: TelegramLimiter,
+        workers: int,
+    ) -> None:
+        self.id = broadcast_id
+        self.text = text
+        self.limiter = limiter
+        self.workers = workers
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.status = "running"
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._results: list[tuple[int, str]] = []
+        self._resumed_at = 0
+        self._started = 0.0
+        self._finished: float | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        workers = []
+        try:
+            counts = await aio.selector.get_broadcast_counts(self.id)
+            pending = await aio.selector.get_broadcast_pending_user_ids(self.id)
+            if counts is None or pending is None:
+                # status stays running in database, so broadcast is resumed on next start
+                self.status = "failed"
+                logger.error(f"[-] broadcast {self.id}: recipients were not loaded")
+                return
+            self.sent = counts.get(SENT, 0)
+            self.failed = counts.get(FAILED, 0)
+            self.total = self.sent + self.failed + len(pending)
+            self._resumed_at = self.sent + self.failed
+            for user_id in pending:
+                self._queue.put_nowait(user_id)
+
+            self._started = time.monotonic()
+            logger.info(f"[+] broadcast {self.id}: {len(pending)} of {self.total} recipients left")
+            workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            await asyncio.gather(*workers)
+            self.status = "done"
+        except asyncio.CancelledError:
+            for worker in workers:
+                worker.cancel()
+            # shutdown keeps status running, so broadcast is resumed on next start
+            if self.status != "cancelled":
+                raise
+        finally:
+            self._finished = time.monotonic()
+            await asyncio.shield(self._flush())
+            if self.status in ("done", "cancelled"):
+                await aio.update.set_broadcast_status(self.id, self.status)
+            logger.info(f"[+] broadcast {self.id} {self.status}: {self.stats()}")
+
+    async def _worker(self) -> None:
+        while not self._queue.empty():
+            user_id = self._queue.get_nowait()
+            success = await safe_send_message(
+                bot,
+                user_id,
+                self.text,
+                limiter=self.limiter,
+                parse_mode=types.ParseMode.HTML,
+            )
+            if success:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self._results.append((user_id, SENT if success else FAILED))
+            if len(self._results) >= RESULTS_BATCH:
+                await self._flush()
+
+    async def _flush(self) -> None:
+        results, self._results = self._results, []
+        if results and not await aio.update.save_broadcast_results(self.id, results):
+            # recipients stay pending and get the message again after restart
+            logger.error(f"[-] broadcast {self.id}: {len(results)} results were not saved")
+
+    def stats(self) -> dict:
+        done = self.sent + self.failed
+        elapsed = ((self._finished or time.monotonic()) - self._started) if self._started else 0
+        # throughput of this run, recipients reached before restart are not counted
+        rate = (done - self._resumed_at) / elapsed if elapsed else 0
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pending": self.total - done,
+            "elapsed_s": round(elapsed, 1),
+            "per_second": round(rate, 1),
+            "eta_s": round((self.total - done) / rate) if rate else None,
+        }
+
+
+class BroadcastManager:
+    def __init__(self, limiter: TelegramLimiter, workers: int) -> None:
+        self.limiter = limiter
+        self.workers = workers
+        self._broadcasts: dict[int, Broadcast] = {}
+
+    async def start(self, text: str, audience: str, created_by: int) -> Broadcast:
+        """Raises RuntimeError if broadcast could not be created"""
+        broadcast_id = await aio.insert.create_broadcast(text, audience, created_by)
+        if broadcast_id is None:
+            raise RuntimeError("broadcast could not be created")
+        return self._start(broadcast_id, text)
+
+    async def resume(self) -> None:
+        """continue broadcasts interrupted by restart"""
+        for record in await aio.selector.get_unfinished_broadcasts():
+            self._start(record["id"], record["text"])
+
+    def _start(self, broadcast_id: int, text: str) -> Broadcast:
+        broadcast = Broadcast(broadcast_id, text, self.limiter, self.workers)
+        self._broadcasts[broadcast_id] = broadcast
+        broadcast.start()
+        return broadcast
+
+    def cancel(self, broadcast_id: int) -> bool:
+        broadcast = self._broadcasts.get(broadcast_id)
+        if broadcast is None or broadcast.status != "running":
+            return False
+        broadcast.status = "cancelled"
+        broadcast.cancel()
+        return True
+
+    def get(self, broadcast_id: int | None = None) -> Broadcast | None:
+        """broadcast by id, the latest one if id is None"""
+        if broadcast_id is None:
+            return self._broadcasts[max(self._broadcasts)] if self._broadcasts else None
+        return self._broadcasts.get(broadcast_id)
+
+    async def shutdown(self) -> None:
+        broadcasts = [b for b in self._broadcasts.values() if b.status == "running"]
+        for broadcast in broadcasts:
+            broadcast.cancel()
+        await asyncio.gather(
+            *(b._task for b in broadcasts if b._task is not None), return_exceptions=True
+        )
+
+
+broadcasts = BroadcastManager(telegram_limiter, configuration.broadcast_workers)
+
+
+async def notify_admins(
+    text: str,
+    exclude: int | None = None,
+    forward: types.Message | None = None,
+    **kwargs,
+) -> int:
+    """Send text to all admins concurrently
+
+    Args:
+        exclude (int, optional): admin that should not be notified
+        forward (types.Message, optional): message forwarded to every admin before text
+
+    Returns:
+        int: count of admins that got the text
+    """
+
+    async def notify(admin: int) -> bool:
+        if forward is not None:
+            await telegram_limiter.acquire(admin)
+            await forward.forward(admin)
+        return await safe_send_message(
+            bot, admin, text, limiter=telegram_limiter, ban_on_block=False, **kwargs
+        )
+
+    admins = [admin for admin in configuration.admins if admin != exclude]
+    results = await asyncio.gather(*(notify(admin) for admin in admins), return_exceptions=True)
+    for admin, result in zip(admins, results):
+        if isinstance(result, Exception):
+            logger.error(f"[-] admin {admin} was not notified: {result}")
+    return sum(result is True for result in results)
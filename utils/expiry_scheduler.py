@@ -0,0 +1,158 @@
+"""Subscription reminders and disconnects at their exact time
+
+Upcoming events of users whose subscription ends within HORIZON are kept in
+a min-heap ordered by fire time, the runner sleeps until the earliest one.
+Writers of subscription_end_date notify the scheduler through
+database.events, so a payment or an admin change reschedules the user
+immediately. Heap entries are not removed on reschedule, an entry whose end
+date differs from the current one of the user is skipped when it is popped.
+"""
+
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from database import aio
+from database.events import add_end_date_listener, remove_end_date_listener
+
+# days before the end (as in watchdog messages) -> how long before the end it is sent
+REMINDERS = {
+    2: timedelta(days=2),
+    1: timedelta(days=1),
+    0: timedelta(hours=3),
+}
+# subscription ended: user is notified and disconnected
+EXPIRED = -1
+# users whose subscription ends within horizon are kept in the heap, horizon
+# minus the longest reminder has to be longer than the reload interval
+HORIZON = timedelta(days=7)
+RELOAD_INTERVAL = timedelta(days=1)
+
+# handler gets days (key of REMINDERS or EXPIRED) by user id of events due together
+EventsHandler = Callable[[dict[int, int]], Awaitable[None]]
+
+
+class ExpiryScheduler:
+    def __init__(self, handler: EventsHandler) -> None:
+        self.handler = handler
+        # (fire_at, user_id, days, end_date)
+        self._heap: list[tuple[datetime, int, int, datetime]] = []
+        self._end_dates: dict[int, datetime] = {}
+        self._loaded_until = datetime.min
+        self._wakeup = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._handlers: set[asyncio.Task] = set()
+        self._fired = 0
+        self._stale = 0
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        add_end_date_listener(self.on_end_date_changed)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        remove_end_date_listener(self.on_end_date_changed)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def on_end_date_changed(self, user_id: int, end_date: datetime) -> None:
+        """end date listener, safe to call from any thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.schedule, user_id, end_date)
+
+    def schedule(self, user_id: int, end_date: datetime) -> None:
+        """(re)schedule events of user, previous events of user are dropped"""
+        now = datetime.now()
+        previous = self._end_dates.get(user_id)
+        if previous == end_date:
+            return
+        if end_date <= now:
+            # subscription was cut short while it was active
+            if previous is not None and previous > now:
+                self._end_dates[user_id] = end_date
+                heapq.heappush(self._heap, (now, user_id, EXPIRED, end_date))
+                self._wakeup.set()
+            return
+        if end_date > self._loaded_until:
+            # picked up again by the reload that reaches it
+            self._end_dates.pop(user_id, None)
+            return
+
+        self._end_dates[user_id] = end_date
+        for days, before in REMINDERS.items():
+            if end_date - before > now:
+                heapq.heappush(self._heap, (end_date - before, user_id, days, end_date))
+        heapq.heappush(self._heap, (end_date, user_id, EXPIRED, end_date))
+        self._wakeup.set()
+
+    async def reload(self) -> None:
+        """schedule users whose subscription ends within horizon"""
+        now = datetime.now()
+        self._loaded_until = now + HORIZON
+        for user_id, end_date in await aio.selector.get_user_end_dates_between(
+            now, self._loaded_until
+        ):
+            self.schedule(user_id, end_date)
+        logger.info(
+            f"[+] expiry scheduler: {len(self._end_dates)} users, {len(self._heap)} events"
+        )
+
+    def _pop_due(self, now: datetime) -> dict[int, int]:
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, user_id, days, end_date = heapq.heappop(self._heap)
+            if self._end_dates.get(user_id) != end_date:
+                self._stale += 1
+                continue
+            if days == EXPIRED:
+                del self._end_dates[user_id]
+            # nearest to the end wins if several events of user are due at once
+            due[user_id] = min(days, due.get(user_id, days))
+        return due
+
+    async def _run(self) -> None:
+        next_reload = datetime.min
+        while True:
+            now = datetime.now()
+            if now >= next_reload:
+                await self.reload()
+                next_reload = now + RELOAD_INTERVAL
+                now = datetime.now()
+
+            self._wakeup.clear()
+            due = self._pop_due(now)
+            if due:
+                self._fired += len(due)
+                task = asyncio.create_task(self._handle(due))
+                self._handlers.add(task)
+                task.add_done_callback(self._handlers.discard)
+
+            wake_at = min(self._heap[0][0], next_reload) if self._heap else next_reload
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), max((wake_at - datetime.now()).total_seconds(), 0)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _handle(self, due: dict[int, int]) -> None:
+        try:
+            await self.handler(due)
+        except Exception as e:
+            logger.error(f"[-] expiry events of {len(due)} users failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._end_dates),
+            "events": len(self._heap),
+            "next": self._heap[0][0] if self._heap else None,
+            "loaded_until": self._loaded_until,
+            "fired": self._fired,
+            "stale_skipped": self._stale,
+        }
@@ -0,0 +1,141 @@
+"""Peer address allocation over one or several CIDR pools
+
+Every pool keeps a bitmap of used host addresses, a free list of released
+addresses and a cursor over never used ones, so allocate() and release()
+are O(1) (amortized) even for large subnets.
+"""
+
+from ipaddress import IPv4Address, IPv4Network
+from typing import Iterable
+
+
+class AddressPool:
+    """Host addresses of a single subnet, network and broadcast are never handed out"""
+
+    def __init__(
+        self, network: IPv4Network | str, reserved: Iterable[IPv4Address | str] = ()
+    ) -> None:
+        self.network = IPv4Network(network, strict=False)
+        if self.network.prefixlen > 30:
+            raise ValueError(f"address pool {self.network} is too small for peers")
+
+        self._first = int(self.network.network_address) + 1
+        self._size = self.network.num_addresses - 2
+        self._bitmap = bytearray((self._size + 7) // 8)
+        self._reserved: set[int] = set()
+        self._free: list[int] = []
+        self._cursor = 0
+        self._used = 0
+
+        for address in reserved:
+            if self.reserve(address):
+                self._reserved.add(self._offset(IPv4Address(address)))
+
+    def _offset(self, address: IPv4Address) -> int | None:
+        offset = int(address) - self._first
+        if 0 <= offset < self._size:
+            return offset
+        return None
+
+    def _is_used(self, offset: int) -> bool:
+        return bool(self._bitmap[offset >> 3] & (1 << (offset & 7)))
+
+    def _set(self, offset: int) -> None:
+        self._bitmap[offset >> 3] |= 1 << (offset & 7)
+        self._used += 1
+
+    def _clear(self, offset: int) -> None:
+        self._bitmap[offset >> 3] &= ~(1 << (offset & 7)) & 0xFF
+        self._used -= 1
+
+    def __contains__(self, address: IPv4Address | str) -> bool:
+        return self._offset(IPv4Address(address)) is not None
+
+    def is_used(self, address: IPv4Address | str) -> bool:
+        offset = self._offset(IPv4Address(address))
+        return offset is not None and self._is_used(offset)
+
+    def reserve(self, address: IPv4Address | str) -> bool:
+        """Mark address as used, returns False if it is outside the pool or already used"""
+        offset = self._offset(IPv4Address(address))
+        if offset is None or self._is_used(offset):
+            return False
+        self._set(offset)
+        return True
+
+    def allocate(self) -> IPv4Address | None:
+        """Take free address, released ones are reused first"""
+        while self._free:
+            offset = self._free.pop()
+            # released address could be reserved again before it was reused
+            if not self._is_used(offset):
+                self._set(offset)
+                return IPv4Address(self._first + offset)
+        while self._cursor < self._size:
+            offset = self._cursor
+            self._cursor += 1
+            if not self._is_used(offset):
+                self._set(offset)
+                return IPv4Address(self._first + offset)
+        return None
+
+    def release(self, address: IPv4Address | str) -> bool:
+        """Return address to the pool, returns False if it was not allocated here"""
+        offset = self._offset(IPv4Address(address))
+        if offset is None or offset in self._reserved or not self._is_used(offset):
+            return False
+        self._clear(offset)
+        if offset < self._cursor:
+            self._free.append(offset)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "network": str(self.network),
+            "size": self._size,
+            "used": self._used,
+            "free": self._size - self._used,
+        }
+
+
+class AddressAllocator:
+    """Hands out addresses from several pools in the given order"""
+
+    def __init__(
+        self,
+        networks: Iterable[IPv4Network | str],
+        reserved: Iterable[IPv4Address | str] = (),
+    ) -> None:
+        reserved = [IPv4Address(address) for address in reserved]
+        self.pools = [AddressPool(network, reserved) for network in networks]
+        if not self.pools:
+            raise ValueError("at least one address pool is required")
+
+    def _pool_of(self, address: IPv4Address | str) -> AddressPool | None:
+        for pool in self.pools:
+            if address in pool:
+                return pool
+        return None
+
+    def allocate(self) -> IPv4Address | None:
+        """Returns free address or None if all pools are exhausted"""
+        for pool in self.pools:
+            address = pool.allocate()
+            if address is not None:
+                return address
+        return None
+
+    def reserve(self, address: IPv4Address | str) -> bool:
+        pool = self._pool_of(address)
+        return pool is not None and pool.reserve(address)
+
+    def release(self, address: IPv4Address | str) -> bool:
+        pool = self._pool_of(address)
+        return pool is not None and pool.release(address)
+
+    def is_used(self, address: IPv4Address | str) -> bool:
+        pool = self._pool_of(address)
+        return pool is not None and pool.is_used(address)
+
+    def stats(self) -> list[dict]:
+        return [pool.stats() for pool in self.pools]
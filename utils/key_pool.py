@@ -0,0 +1,97 @@
+"""Pool of pre-generated WireGuard key pairs
+
+A background task keeps up to `size` key pairs ready, refilling when the pool
+drops to `low_watermark`, so config creation never waits for key generation.
+If the pool is empty (burst of new users) a pair is generated directly.
+"""
+
+import asyncio
+from collections import deque
+from typing import NamedTuple
+
+from loguru import logger
+from utils import keygen
+
+
+class KeyPair(NamedTuple):
+    private_key: str
+    public_key: str
+    preshared_key: str | None = None
+
+
+class KeyPairPool:
+    # pairs generated per executor call, keeps the event loop responsive
+    REFILL_CHUNK = 16
+
+    def __init__(self, size: int, low_watermark: int, with_preshared: bool = False) -> None:
+        self.size = size
+        self.low_watermark = min(low_watermark, size)
+        self.with_preshared = with_preshared
+        self._pairs: deque[KeyPair] = deque()
+        self._refill = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._hits = 0
+        self._misses = 0
+        self._generated = 0
+
+    def _generate(self, count: int) -> list[KeyPair]:
+        pairs = []
+        for _ in range(count):
+            private_key, public_key = keygen.generate_key_pair()
+            preshared_key = keygen.generate_preshared_key() if self.with_preshared else None
+            pairs.append(KeyPair(private_key, public_key, preshared_key))
+        return pairs
+
+    def start(self) -> None:
+        """Start background refill task, pool is filled right away"""
+        if self.size <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        self._refill.set()
+        logger.success(f"[+] key pair pool started, size {self.size}")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            try:
+                while len(self._pairs) < self.size:
+                    count = min(self.REFILL_CHUNK, self.size - len(self._pairs))
+                    pairs = await loop.run_in_executor(None, self._generate, count)
+                    self._pairs.extend(pairs)
+                    self._generated += count
+            except Exception as e:
+                logger.error(f"[-] key pair pool refill failed: {e}")
+
+    def take(self) -> KeyPair:
+        """Get ready key pair, generates one in place if pool is empty"""
+        try:
+            pair = self._pairs.popleft()
+            self._hits += 1
+        except IndexError:
+            pair = self._generate(1)[0]
+            self._misses += 1
+        if self._task is not None and len(self._pairs) <= self.low_watermark:
+            self._refill.set()
+        return pair
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._pairs),
+            "size": self.size,
+            "low_watermark": self.low_watermark,
+            "hits": self._hits,
+            "misses": self._misses,
+            "generated": self._generated,
+        }
@@ -0,0 +1,349 @@
+"""Parsed, indexed model of the wireguard server config (wg0.conf)
+
+Peer blocks written by the bot look like:
+
+    #username_DEVICE
+    [Peer]
+    PublicKey = ...
+    PresharedKey = ...
+    AllowedIPs = 10.0.0.2/32
+
+disconnected peers have every line commented and DISCONNECTED_ name prefix:
+
+    #DISCONNECTED_username_DEVICE
+    #[Peer]
+    #PublicKey = ...
+    ...
+
+Everything that is not a peer block ([Interface] section, blank lines, other
+comments) is kept as is, so render() gives back the same file.
+"""
+
+from ipaddress import IPv4Address, IPv4Interface
+
+DISCONNECTED_PREFIX = "DISCONNECTED_"
+
+# keys understood only by wg-quick, `wg syncconf` rejects them (same list as `wg-quick strip`)
+WG_QUICK_KEYS = frozenset(
+    ("Address", "DNS", "MTU", "Table", "PreUp", "PostUp", "PreDown", "PostDown", "SaveConfig")
+)
+
+
+class Peer:
+    """Single [Peer] block of the server config"""
+
+    __slots__ = ("name", "fields", "disabled", "trailer")
+
+    def __init__(
+        self,
+        name: str | None,
+        public_key: str = "",
+        preshared_key: str = "",
+        allowed_ips: str = "",
+        disabled: bool = False,
+    ) -> None:
+        self.name = name
+        self.disabled = disabled
+        # blank line that separates the block from the next one
+        self.trailer = "\n"
+        # keeps order of lines inside the block, unknown keys (Endpoint, ...) too
+        self.fields: dict[str, str] = {}
+        if public_key:
+            self.fields["PublicKey"] = public_key
+        if preshared_key:
+            self.fields["PresharedKey"] = preshared_key
+        if allowed_ips:
+            self.fields["AllowedIPs"] = allowed_ips
+
+    @property
+    def public_key(self) -> str:
+        return self.fields.get("PublicKey", "")
+
+    @property
+    def preshared_key(self) -> str:
+        return self.fields.get("PresharedKey", "")
+
+    @property
+    def allowed_ips(self) -> str:
+        return self.fields.get("AllowedIPs", "")
+
+    @property
+    def address(self) -> str:
+        """peer address without mask, e.g. 10.0.0.2"""
+        return self.allowed_ips.split(",")[0].split("/")[0].strip()
+
+    @property
+    def username(self) -> str | None:
+        """username part of name username_DEVICE"""
+        if not self.name or "_" not in self.name:
+            return self.name
+        return self.name.rsplit("_", 1)[0]
+
+    @property
+    def device(self) -> str | None:
+        if not self.name or "_" not in self.name:
+            return None
+        return self.name.rsplit("_", 1)[1]
+
+    def render(self) -> str:
+        comment = "#" if self.disabled else ""
+        lines = []
+        if self.name is not None:
+            prefix = DISCONNECTED_PREFIX if self.disabled else ""
+            lines.append(f"#{prefix}{self.name}")
+        lines.append(f"{comment}[Peer]")
+        lines.extend(f"{comment}{key} = {value}" for key, value in self.fields.items())
+        return "\n".join(lines) + "\n" + self.trailer
+
+    def __repr__(self) -> str:
+        state = "disabled" if self.disabled else "enabled"
+        return f"Peer({self.name!r}, {self.allowed_ips!r}, {state})"
+
+
+def _split_field(line: str) -> tuple[str, str] | None:
+    """'#AllowedIPs = 10.0.0.2/32' -> ('AllowedIPs', '10.0.0.2/32')"""
+    line = line.lstrip("#").strip()
+    if "=" not in line:
+        return None
+    key, value = line.split("=", 1)
+    key = key.strip()
+    if not key or " " in key:
+        return None
+    return key, value.strip()
+
+
+def _is_peer_header(line: str) -> bool:
+    return line.strip() in ("[Peer]", "#[Peer]")
+
+
+class PeerRegistry:
+    """Peers of the server config indexed by name, user, public key and address"""
+
+    def __init__(self) -> None:
+        # file as ordered raw text chunks and Peer objects, dict keeps order
+        # and allows to drop a peer block in O(1)
+        self._segments: dict[int, str | Peer] = {}
+        self._segment_ids: dict[int, int] = {}
+        self._next_segment_id = 0
+        self._by_name: dict[str, Peer] = {}
+        self._by_user: dict[str, list[Peer]] = {}
+        self._by_public_key: dict[str, Peer] = {}
+        self._by_address: dict[str, Peer] = {}
+
+    @classmethod
+    def parse(cls, text: str) -> "PeerRegistry":
+        registry = cls()
+        lines = text.splitlines(keepends=True)
+        raw: list[str] = []
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            stripped = line.strip()
+            next_line = lines[index + 1] if index + 1 < len(lines) else ""
+
+            name = None
+            if (
+                stripped.startswith("#")
+                and not _is_peer_header(stripped)
+                and _split_field(stripped) is None
+                and _is_peer_header(next_line)
+            ):
+                name = stripped[1:]
+                index += 1
+                line = next_line
+                stripped = line.strip()
+
+            if not _is_peer_header(stripped):
+                raw.append(line)
+                index += 1
+                continue
+
+            if raw:
+                registry._append_segment("".join(raw))
+                raw = []
+
+            disabled = stripped.startswith("#")
+            if name is not None and name.startswith(DISCONNECTED_PREFIX):
+                name = name[len(DISCONNECTED_PREFIX):]
+                disabled = True
+            peer = Peer(name, disabled=disabled)
+
+            index += 1
+            while index < len(lines):
+                field = lines[index].strip()
+                if not field or _is_peer_header(field):
+                    break
+                key_value = _split_field(field)
+                if key_value is None:
+                    break
+                peer.fields[key_value[0]] = key_value[1]
+                index += 1
+
+            if index < len(lines) and not lines[index].strip():
+                peer.trailer = lines[index]
+                index += 1
+            else:
+                peer.trailer = ""
+            registry._append_segment(peer)
+            registry._index(peer)
+
+        if raw:
+            registry._append_segment("".join(raw))
+        return registry
+
+    def render(self) -> str:
+        return "".join(
+            segment.render() if isinstance(segment, Peer) else segment
+            for segment in self._segments.values()
+        )
+
+    def render_stripped(self) -> str:
+        """Config for `wg syncconf`: no comments, wg-quick keys and disabled peers"""
+        lines = []
+        for segment in self._segments.values():
+            if isinstance(segment, Peer):
+                if not segment.disabled:
+                    lines.append("[Peer]")
+                    lines.extend(f"{key} = {value}" for key, value in segment.fields.items())
+                continue
+            for line in segment.splitlines():
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                key_value = _split_field(line)
+                if key_value is not None and key_value[0] in WG_QUICK_KEYS:
+                    continue
+                lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    def _append_segment(self, segment: str | Peer) -> None:
+        self._segments[self._next_segment_id] = segment
+        if isinstance(segment, Peer):
+            self._segment_ids[id(segment)] = self._next_segment_id
+        self._next_segment_id += 1
+
+    def _index(self, peer: Peer) -> None:
+        if peer.name is not None:
+            self._by_name[peer.name] = peer
+            self._by_user.setdefault(peer.username, []).append(peer)
+        if peer.public_key:
+            self._by_public_key[peer.public_key] = peer
+        if peer.address:
+            self._by_address[peer.address] = peer
+
+    def _unindex(self, peer: Peer) -> None:
+        if peer.name is not None and self._by_name.get(peer.name) is peer:
+            del self._by_name[peer.name]
+            user_peers = self._by_user.get(peer.username, [])
+            if peer in user_peers:
+                user_peers.remove(peer)
+            if not user_peers:
+                self._by_user.pop(peer.username, None)
+        if self._by_public_key.get(peer.public_key) is peer:
+            del self._by_public_key[peer.public_key]
+        if self._by_address.get(peer.address) is peer:
+            del self._by_address[peer.address]
+
+    def __iter__(self):
+        return (
+            segment for segment in self._segments.values() if isinstance(segment, Peer)
+        )
+
+    def __len__(self) -> int:
+        return len(self._segment_ids)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def get(self, name: str) -> Peer | None:
+        """Get peer by name, e.g. username_PC"""
+        return self._by_name.get(name)
+
+    def peers_of(self, username: str) -> list[Peer]:
+        """Get all peers (devices) of the user"""
+        return list(self._by_user.get(username, ()))
+
+    def by_public_key(self, public_key: str) -> Peer | None:
+        return self._by_public_key.get(public_key)
+
+    def by_address(self, address: str) -> Peer | None:
+        """Get peer by address without mask, e.g. 10.0.0.2"""
+        return self._by_address.get(address)
+
+    def addresses(self) -> list[IPv4Address]:
+        """Addresses of all peers, disconnected too, they still own them"""
+        return [IPv4Address(address) for address in self._by_address]
+
+    def interface_addresses(self) -> list[IPv4Interface]:
+        """Address values of [Interface] section, e.g. [10.0.0.1/24]"""
+        addresses = []
+        for segment in self._segments.values():
+            if isinstance(segment, Peer):
+                break
+            for line in segment.splitlines():
+                key_value = _split_field(line) if not line.startswith("#") else None
+                if key_value is None or key_value[0] != "Address":
+                    continue
+                for address in key_value[1].split(","):
+                    address = address.strip()
+                    if address and ":" not in address:
+                        addresses.append(IPv4Interface(address))
+        return addresses
+
+    def last_address(self) -> str | None:
+        """Address of the last peer block in the file"""
+        for segment in reversed(self._segments.values()):
+            if isinstance(segment, Peer) and segment.address:
+                return segment.address
+        return None
+
+    def add(self, peer: Peer) -> Peer:
+        """Append peer block to the end of the config
+
+        Raises:
+            ValueError: if peer name, public key or address is already taken
+        """
+        if peer.name is not None and peer.name in self._by_name:
+            raise ValueError(f"peer {peer.name} already exists")
+        if peer.public_key and peer.public_key in self._by_public_key:
+            raise ValueError(f"public key of peer {peer.name} already used")
+        if peer.address and peer.address in self._by_address:
+            raise ValueError(f"address {peer.address} already used")
+
+        if self._segments:
+            last_id = next(reversed(self._segments))
+            last = self._segments[last_id]
+            if isinstance(last, Peer):
+                if not last.trailer:
+                    last.trailer = "\n"
+            elif not last.endswith("\n"):
+                self._segments[last_id] = f"{last}\n"
+        peer.trailer = "\n"
+        self._append_segment(peer)
+        self._index(peer)
+        return peer
+
+    def remove(self, name: str) -> Peer | None:
+        """Remove peer block and blank line after it"""
+        peer = self._by_name.get(name)
+        if peer is None:
+            return None
+        del self._segments[self._segment_ids.pop(id(peer))]
+        self._unindex(peer)
+        return peer
+
+    def disable(self, name: str) -> bool:
+        """Comment out peer block, returns False if peer not found or already disabled"""
+        peer = self._by_name.get(name)
+        if peer is None or peer.disabled:
+            return False
+        peer.disabled = True
+        return True
+
+    def enable(self, name: str) -> bool:
+        """Uncomment peer block, returns False if peer not found or already enabled"""
+        peer = self._by_name.get(name)
+        if peer is None or not peer.disabled:
+            return False
+        peer.disabled = False
+        return True
@@ -0,0 +1,42 @@
+"""Client config template
+
+Only per-peer fields are stored in vpn_config. Server settings (public key,
+preshared key, endpoint, DNS) are filled in at render time, so changing them
+in .env takes effect for every config without touching the database.
+"""
+
+from functools import lru_cache
+from string import Template
+
+PEER_CONFIG_TEMPLATE = Template(
+    "[Interface]\n"
+    "PrivateKey = $private_key\n"
+    "Address = $address\n"
+    "DNS = $dns\n\n"
+    "[Peer]\n"
+    "PublicKey = $server_public_key\n"
+    "PresharedKey = $preshared_key\n"
+    "AllowedIPs = 0.0.0.0/0\n"
+    "Endpoint = $endpoint\n"
+    "PersistentKeepalive = 20"
+)
+
+
+@lru_cache(maxsize=1024)
+def render_peer_config(
+    private_key: str,
+    address: str,
+    dns: str,
+    server_public_key: str,
+    preshared_key: str,
+    endpoint: str,
+) -> str:
+    """Client config text, server settings are part of the cache key"""
+    return PEER_CONFIG_TEMPLATE.substitute(
+        private_key=private_key,
+        address=address,
+        dns=dns,
+        server_public_key=server_public_key,
+        preshared_key=preshared_key,
+        endpoint=endpoint,
+    )
@@ -0,0 +1,116 @@
+"""Non-blocking runner for external commands (wg, systemctl)
+
+Commands run with asyncio subprocesses, so the dispatcher keeps serving
+other users while WireGuard is being updated or restarted.
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+from loguru import logger
+
+
+class CommandError(RuntimeError):
+    """Command exited with non-zero code or timed out"""
+
+    def __init__(self, name: str, returncode: int | None, stderr: str) -> None:
+        self.name = name
+        self.returncode = returncode
+        self.stderr = stderr
+        if returncode is None:
+            super().__init__(f"{name} timed out")
+        else:
+            super().__init__(f"{name} exited with code {returncode}: {stderr}")
+
+
+class _CommandStats:
+    __slots__ = ("calls", "failures", "timeouts", "total", "max")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "avg_ms": round(self.total / self.calls * 1000, 2) if self.calls else 0,
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+def _command_name(command: tuple[str, ...]) -> str:
+    """metrics key: 'sudo /usr/bin/wg set wg0 ...' -> 'wg set'"""
+    if command and command[0] == "sudo":
+        command = command[1:]
+    if not command:
+        return ""
+    return " ".join((os.path.basename(command[0]), *command[1:2]))
+
+
+class ProcessRunner:
+    def __init__(self, concurrency: int = 4, timeout: float = 10) -> None:
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._stats: dict[str, _CommandStats] = defaultdict(_CommandStats)
+
+    async def run(
+        self, *command: str, input: str | None = None, timeout: float | None = None
+    ) -> str:
+        """Run command and return its stdout
+
+        Raises:
+            CommandError: on non-zero exit code or timeout, stderr is included
+        """
+        name = _command_name(command)
+        stats = self._stats[name]
+        timeout = self.timeout if timeout is None else timeout
+        async with self._semaphore:
+            started = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(input.encode("utf-8") if input is not None else None),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                raise CommandError(name, None, "")
+            finally:
+                if process.returncode is None:
+                    # timed out or the caller was cancelled, the command must not outlive it
+                    await self._kill(process)
+                elapsed = time.perf_counter() - started
+                stats.calls += 1
+                stats.total += elapsed
+                stats.max = max(stats.max, elapsed)
+
+        logger.debug(f"[+] {name} finished in {elapsed * 1000:.1f} ms")
+        if process.returncode != 0:
+            stats.failures += 1
+            raise CommandError(
+                name, process.returncode, stderr.decode("utf-8", "replace").strip()
+            )
+        return stdout.decode("utf-8")
+
+    @staticmethod
+    async def _kill(process: asyncio.subprocess.Process) -> None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    def stats(self) -> dict:
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
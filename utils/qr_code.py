@@ -1,19 +1,250 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import qrcode
 
 from qrcode.image.styledpil import StyledPilImage
 from qrcode.image.styles.moduledrawers.pil import RoundedModuleDrawer
 from qrcode.image.styles.colormasks import HorizontalGradiantColorMask
 from io import BytesIO
+from loguru import logger
 
+from data import configuration
 
-def create_qr_code_from_peer_data(peer_data: str) -> BytesIO:
-    """creates qr code from peer data
+# part of the cache key, change it together with the rendering code below
+QR_RENDER_OPTIONS = "v1:ecl=L:box=10:border=2:rounded:horizontal-gradient"
 
-    Args:
-        peer_data (str): peer data (config file), which will be encoded in qr code
+
+class QRCodeCache:
+    """PNG images by content hash: in-memory LRU limited by total size of images
+    and optional directory, that survives restarts and has its own budget
+
+    Images contain private keys of peers, so the directory is readable by the
+    bot user only and images of removed configs are deleted with discard().
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        directory: str | None = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+        disk_max_files: int = 20000,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_files = disk_max_files
+        self._images: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        # files of directory, least recently used first: key -> size
+        self._files: OrderedDict[str, int] = OrderedDict()
+        self._disk_size = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._disk_evictions = 0
+        if directory:
+            try:
+                self._load_directory()
+            except OSError as e:
+                logger.error(f"[-] qr cache directory disabled: {e}")
+                self.directory = None
+
+    def _load_directory(self) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # mode of makedirs is masked by umask and ignored for existing directory
+        os.chmod(self.directory, 0o700)
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".tmp"):
+                    # left by interrupted write
+                    os.unlink(entry.path)
+                elif entry.name.endswith(".png"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[: -len(".png")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._files[key] = size
+            self._disk_size += size
+        self._evict_files()
+
+    @staticmethod
+    def key(peer_data: str) -> str:
+        """any change of the config or of render options gives a new key"""
+        return hashlib.sha256(f"{QR_RENDER_OPTIONS}\n{peer_data}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key: str) -> bytes | None:
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            self._hits += 1
+            return image
+        if self.directory and key in self._files:
+            try:
+                with open(self._path(key), "rb") as file:
+                    image = file.read()
+                # mtime keeps the order of use for the next start
+                os.utime(self._path(key))
+                self._files.move_to_end(key)
+                self._disk_hits += 1
+                self._remember(key, image)
+                return image
+            except FileNotFoundError:
+                self._disk_size -= self._files.pop(key)
+            except OSError as e:
+                logger.error(f"[-] {e}")
+        self._misses += 1
+        return None
+
+    def set(self, key: str, image: bytes) -> None:
+        self._remember(key, image)
+        if self.directory:
+            try:
+                # mkstemp creates the file with mode 0600
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as file:
+                    file.write(image)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                logger.error(f"[-] {e}")
+                return
+            self._disk_size += len(image) - self._files.pop(key, 0)
+            self._files[key] = len(image)
+            self._evict_files()
+
+    def discard(self, key: str) -> None:
+        """forget image of a removed config, on disk too"""
+        image = self._images.pop(key, None)
+        if image is not None:
+            self._size -= len(image)
+        if self.directory and key in self._files:
+            self._disk_size -= self._files.pop(key)
+            self._unlink(key)
+
+    def _remember(self, key: str, image: bytes) -> None:
+        if len(image) > self.max_bytes:
+            return
+        old = self._images.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._images[key] = image
+        self._size += len(image)
+        while self._size > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _evict_files(self) -> None:
+        while self._files and (
+            len(self._files) > self.disk_max_files or self._disk_size > self.disk_max_bytes
+        ):
+            key, size = self._files.popitem(last=False)
+            self._disk_size -= size
+            self._disk_evictions += 1
+            self._unlink(key)
+
+    def _unlink(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"[-] {e}")
+
+    def stats(self) -> dict:
+        return {
+            "images": len(self._images),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "disk_files": len(self._files),
+            "disk_bytes": self._disk_size,
+            "disk_evictions": self._disk_evictions,
+        }
+
+
+class QRQueueFull(RuntimeError):
+    """Too many QR codes are being rendered, try later"""
+
+
+class QRRenderPool:
+    """Renders QR codes in worker processes, so PIL work never blocks the event loop"""
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: ProcessPoolExecutor | None = None
+        # same config requested twice while rendering is rendered once
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._renders = 0
+        self._rejected = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    async def render(self, key: str, peer_data: str) -> bytes:
+        """Raises QRQueueFull if max_queue renders are already waiting"""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        if len(self._inflight) >= self.max_queue:
+            self._rejected += 1
+            raise QRQueueFull(f"{len(self._inflight)} qr codes are already being rendered")
+
+        if self._executor is None:
+            # fork would copy the event loop, db pools and locks held by other threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+            )
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, render_qr_code, peer_data
+        )
+        self._inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._inflight.pop(key, None)
+            elapsed = time.perf_counter() - started
+            self._renders += 1
+            self._total += elapsed
+            self._max = max(self._max, elapsed)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue": len(self._inflight),
+            "max_queue": self.max_queue,
+            "renders": self._renders,
+            "rejected": self._rejected,
+            "avg_ms": round(self._total / self._renders * 1000, 1) if self._renders else 0,
+            "max_ms": round(self._max * 1000, 1),
+        }
+
+
+qr_cache = QRCodeCache(**configuration.qr_cache_parameters)
+qr_render_pool = QRRenderPool(**configuration.qr_render_parameters)
+
+
+def render_qr_code(peer_data: str) -> bytes:
+    """renders styled qr code, slow: gradient mask is drawn in pure python
 
     Returns:
-        BytesIO: qr code image
+        bytes: PNG image
     """
     qr = qrcode.QRCode(
         version=1,
@@ -33,8 +264,39 @@ def create_qr_code_from_peer_data(peer_data: str) -> BytesIO:
 
     img_io = BytesIO()
     img.save(img_io, "PNG")
-    img_io.seek(0)
-    return img_io
+    return img_io.getvalue()
+
+
+def create_qr_code_from_peer_data(peer_data: str) -> BytesIO:
+    """creates qr code from peer data, cached by content
+
+    Args:
+        peer_data (str): peer data (config file), which will be encoded in qr code
+
+    Returns:
+        BytesIO: qr code image
+    """
+    key = qr_cache.key(peer_data)
+    image = qr_cache.get(key)
+    if image is None:
+        image = render_qr_code(peer_data)
+        qr_cache.set(key, image)
+    return BytesIO(image)
+
+
+async def get_qr_code(peer_data: str) -> BytesIO:
+    """async version of create_qr_code_from_peer_data, cache misses are
+    rendered in worker processes
+
+    Raises:
+        QRQueueFull: if render queue is full
+    """
+    key = qr_cache.key(peer_data)
+    image = qr_cache.get(key)
+    if image is None:
+        image = await qr_render_pool.render(key, peer_data)
+        qr_cache.set(key, image)
+    return BytesIO(image)
 
 
 if __name__ == "__main__":
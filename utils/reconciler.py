@@ -0,0 +1,180 @@
+"""Finds and fixes drift between database, server config and running interface
+
+Views that are compared:
+- database: vpn_config rows with state of their owners, archived peers
+- config: peer blocks of wg0.conf (PeerRegistry)
+- interface: peers reported by the backend (`wg show <iface> dump`)
+
+Everything is indexed in dicts/sets, so the comparison is linear in the
+number of peers, the slow parts are the database query and `wg show`.
+"""
+
+from collections import defaultdict
+from typing import NamedTuple
+
+from loguru import logger
+from database import aio
+from utils.peer_registry import PeerRegistry
+from utils.wg_backends import LivePeer
+
+# configs are inserted into database after their peer is written to wg0.conf,
+# peers added by the bot more recently than this are never treated as orphaned
+NEW_PEER_GRACE = 300
+
+
+class Drift(NamedTuple):
+    # configs in database without peer block in wg0.conf and not archived, can't be
+    # recreated without keys, reported only
+    missing_in_config: list[str]
+    # peer blocks without config in database, disabled on apply with disable_orphans
+    orphaned_in_config: list[str]
+    # enabled peers of banned or expired users, disabled on apply
+    enabled_without_access: list[str]
+    # enabled peers that are not on the interface, synced on apply
+    missing_on_interface: list[str]
+    # disabled peers still on the interface, synced on apply
+    disabled_but_live: list[str]
+    # public keys on the interface that are not in wg0.conf, synced on apply
+    unknown_on_interface: list[str]
+    # peers whose allowed ips on the interface differ from wg0.conf, synced on apply
+    allowed_ips_mismatch: list[str]
+    # address -> peers sharing it, reported only
+    address_conflicts: dict[str, list[str]]
+
+    @property
+    def total(self) -> int:
+        return sum(len(value) for value in self)
+
+    @property
+    def interface_drift(self) -> bool:
+        return bool(
+            self.missing_on_interface
+            or self.disabled_but_live
+            or self.unknown_on_interface
+            or self.allowed_ips_mismatch
+        )
+
+    def summary(self, limit: int = 5) -> dict:
+        """counts and first names of every kind of drift"""
+        return {
+            kind: {"count": len(items), "examples": list(items)[:limit]}
+            for kind, items in self._asdict().items()
+            if items
+        }
+
+
+def compute_drift(
+    owners: list,
+    archived_names: set[str],
+    registry: PeerRegistry,
+    live: dict[str, LivePeer] | None,
+) -> Drift:
+    """Compare the three views, live=None skips interface checks"""
+    owners_by_name = {owner["config_name"]: owner for owner in owners}
+    drift = Drift([], [], [], [], [], [], [], {})
+    by_address = defaultdict(list)
+
+    for peer in registry:
+        if peer.address:
+            by_address[peer.address].append(peer.name)
+        if peer.name is None:
+            continue
+        owner = owners_by_name.get(peer.name)
+        if owner is None:
+            drift.orphaned_in_config.append(peer.name)
+        elif not peer.disabled and (owner["is_banned"] or owner["is_expired"]):
+            drift.enabled_without_access.append(peer.name)
+
+        if live is None:
+            continue
+        live_peer = live.get(peer.public_key)
+        if peer.disabled:
+            if live_peer is not None:
+                drift.disabled_but_live.append(peer.name)
+        elif live_peer is None:
+            drift.missing_on_interface.append(peer.name)
+        elif _normalize_ips(live_peer.allowed_ips) != _normalize_ips(peer.allowed_ips):
+            drift.allowed_ips_mismatch.append(peer.name)
+
+    for name in owners_by_name:
+        if name not in registry and name not in archived_names:
+            drift.missing_in_config.append(name)
+    if live is not None:
+        drift.unknown_on_interface.extend(
+            public_key for public_key in live if registry.by_public_key(public_key) is None
+        )
+    drift.address_conflicts.update(
+        (address, names) for address, names in by_address.items() if len(names) > 1
+    )
+    return drift
+
+
+def _normalize_ips(allowed_ips: str) -> set[str]:
+    return {ip.strip() for ip in allowed_ips.split(",") if ip.strip()}
+
+
+async def reconcile(wireguard, apply: bool = False, disable_orphans: bool = False) -> Drift:
+    """Find drift and, if apply, fix what can be fixed in one batch:
+    peers without access (and without owner if disable_orphans) are disabled
+    with one config write, then interface is synced with the saved config once
+
+    Raises:
+        RuntimeError: if database state could not be loaded
+    """
+    owners = await aio.selector.get_config_owners()
+    if owners is None:
+        raise RuntimeError("configs could not be loaded from database")
+    archived_names = {peer["name"] for peer in await aio.selector.get_archived_peers()}
+
+    try:
+        live = await wireguard.backend.show()
+    except Exception as e:
+        logger.error(f"[-] interface peers could not be loaded: {e}")
+        live = None
+
+    async with wireguard._registry_lock:
+        registry = await wireguard.get_registry()
+        drift = compute_drift(owners, archived_names, registry, live)
+
+    logger.info(f"[+] reconcile ({'apply' if apply else 'dry run'}): {drift.summary()}")
+    if not apply or not drift.total:
+        return drift
+
+    candidates = drift.enabled_without_access
+    if disable_orphans:
+        candidates = candidates + drift.orphaned_in_config
+    # no other change is written while the lock is held, so candidates are
+    # checked again against the current config and database
+    async with wireguard._registry_lock:
+        registry = await wireguard.get_registry()
+        young = wireguard.changes.added_within(NEW_PEER_GRACE)
+        candidates = [
+            name
+            for name in candidates
+            if name not in young and name in registry and not registry.get(name).disabled
+        ]
+        disabled = []
+        if candidates:
+            current = await aio.selector.get_config_owners(candidates)
+            if current is None:
+                raise RuntimeError("configs could not be loaded from database")
+            owners_by_name = {owner["config_name"]: owner for owner in current}
+            for name in candidates:
+                owner = owners_by_name.get(name)
+                if owner is None and not disable_orphans:
+                    continue
+                if owner is None or owner["is_banned"] or owner["is_expired"]:
+                    registry.disable(name)
+                    disabled.append(registry.get(name))
+        if disabled:
+            await wireguard.save_registry()
+        if drift.interface_drift:
+            await wireguard.backend.sync(registry)
+        elif disabled:
+            await wireguard.apply_peer_changes(registry, changed=disabled)
+
+    logger.warning(
+        f"[!] reconcile applied: {len(disabled)} peers disabled, "
+        f"interface {'synced' if drift.interface_drift else 'unchanged'}"
+    )
+    return drift
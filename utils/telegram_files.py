@@ -0,0 +1,103 @@
+"""Reuse of files already uploaded to Telegram
+
+Telegram returns file_id for every sent document or photo, the same file can be
+sent again by file_id without uploading its bytes. file_id is stored in
+telegram_files table by hash of the file content, so a changed config gets a
+new upload, and is also kept in memory for hot configs.
+
+Photos and documents can't be mixed in one media group, and media groups can't
+have reply markup, so config file and QR code are still sent as two messages.
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from aiogram import types
+from aiogram.utils.exceptions import BadRequest
+from loguru import logger
+
+from database import aio
+
+DOCUMENT = "document"
+PHOTO = "photo"
+
+
+def content_hash(*parts: str) -> str:
+    """sha256 of file name and content, any change gives a new upload"""
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class TelegramFileCache:
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._file_ids: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._hits = 0
+        self._uploads = 0
+        self._rejected = 0
+
+    async def get(self, key: str, kind: str) -> str | None:
+        file_id = self._file_ids.get((key, kind))
+        if file_id is not None:
+            self._file_ids.move_to_end((key, kind))
+            return file_id
+        file_id = await aio.selector.get_telegram_file_id(key, kind)
+        if file_id is not None:
+            self._remember(key, kind, file_id)
+        return file_id
+
+    async def set(self, key: str, kind: str, file_id: str) -> None:
+        self._remember(key, kind, file_id)
+        await aio.insert.save_telegram_file_id(key, kind, file_id)
+
+    async def forget(self, key: str, kind: str) -> None:
+        self._file_ids.pop((key, kind), None)
+        await aio.update.delete_telegram_file_id(key, kind)
+
+    def _remember(self, key: str, kind: str, file_id: str) -> None:
+        self._file_ids[(key, kind)] = file_id
+        self._file_ids.move_to_end((key, kind))
+        while len(self._file_ids) > self.max_size:
+            self._file_ids.popitem(last=False)
+
+    async def send(
+        self,
+        message: types.Message,
+        kind: str,
+        key: str,
+        make_file: Callable[[], Awaitable[types.InputFile]],
+        **kwargs,
+    ) -> types.Message:
+        """Send document or photo to the chat of message by cached file_id,
+        upload file from make_file if there is no file_id or it was rejected
+
+        make_file is awaited only for uploads, exceptions raised by it are propagated
+        """
+        answer = message.answer_document if kind == DOCUMENT else message.answer_photo
+        file_id = await self.get(key, kind)
+        if file_id is not None:
+            try:
+                sent = await answer(file_id, **kwargs)
+                self._hits += 1
+                return sent
+            except BadRequest as e:
+                logger.warning(f"[!] file_id of {kind} {key[:12]} rejected: {e}, uploading again")
+                self._rejected += 1
+                await self.forget(key, kind)
+
+        sent = await answer(await make_file(), **kwargs)
+        self._uploads += 1
+        file_id = sent.document.file_id if kind == DOCUMENT else sent.photo[-1].file_id
+        await self.set(key, kind, file_id)
+        return sent
+
+    def stats(self) -> dict:
+        return {
+            "file_ids": len(self._file_ids),
+            "hits": self._hits,
+            "uploads": self._uploads,
+            "rejected": self._rejected,
+        }
+
+
+telegram_files = TelegramFileCache()
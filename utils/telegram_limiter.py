@@ -0,0 +1,82 @@
+"""Pacing of outgoing messages to stay within Telegram limits
+
+Global token bucket limits messages per second to all chats, every chat also
+gets at most one message per chat_interval. RetryAfter from Telegram pauses
+the whole bucket, because flood control is applied to the bot, not to a chat.
+"""
+
+import asyncio
+import time
+
+from data import configuration
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # waiters are served one by one in arrival order
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """no tokens are given out for the next seconds"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class TelegramLimiter:
+    def __init__(self, rate: float, chat_interval: float, retries: int) -> None:
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        # how many times safe_send_message resends after RetryAfter
+        self.retries = retries
+        self._next_send: dict[int, float] = {}
+        self._sent = 0
+        self._retry_after = 0
+        self._paused = 0.0
+
+    async def acquire(self, chat_id: int) -> None:
+        """wait for a free slot of the chat, then for a global token"""
+        now = time.monotonic()
+        next_send = self._next_send.get(chat_id, 0.0)
+        self._next_send[chat_id] = max(now, next_send) + self.chat_interval
+        if len(self._next_send) > 10000:
+            self._next_send = {chat: at for chat, at in self._next_send.items() if at > now}
+        if next_send > now:
+            await asyncio.sleep(next_send - now)
+        await self.bucket.acquire()
+        self._sent += 1
+
+    def retry_after(self, seconds: float) -> None:
+        self._retry_after += 1
+        self._paused += seconds
+        self.bucket.pause(seconds)
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.bucket.rate,
+            "chat_interval": self.chat_interval,
+            "acquired": self._sent,
+            "retry_after": self._retry_after,
+            "paused_seconds": self._paused,
+        }
+
+
+telegram_limiter = TelegramLimiter(**configuration.telegram_rate_parameters)
@@ -1,10 +1,23 @@
+import asyncio
+import hashlib
+import os
 from loguru import logger
 from os import getenv
-import database
-import subprocess
-from ipaddress import IPv4Address
+from database import aio
+from database.models import StoredPeer
+from ipaddress import IPv4Address, IPv4Network
 from data import configuration
 import aiofiles
+from utils.peer_registry import Peer, PeerRegistry
+from utils.ip_allocator import AddressAllocator
+from utils import keygen
+from utils.key_pool import KeyPairPool
+from utils.peer_template import render_peer_config
+from utils.qr_code import qr_cache
+from utils.wg_writer import ConfigWriter
+from utils.process import ProcessRunner
+from utils.wg_backends import create_backend
+from utils.wg_batch import ChangeQueue, ADD, DISABLE, ENABLE, REMOVE
 
 
 class WireguardConfig:
@@ -15,8 +28,32 @@ class WireguardConfig:
         self.server_port = getenv("WG_SERVER_PORT")
         self.server_public_key = getenv("WG_SERVER_PUBLIC_KEY")
         self.server_preshared_key = getenv("WG_SERVER_PRESHARED_KEY")
+        self.apply_parameters = configuration.wg_apply_parameters
+        # every external command (wg, systemctl) goes through it
+        self.process = ProcessRunner(
+            concurrency=self.apply_parameters["concurrency"],
+            timeout=self.apply_parameters["timeout"],
+        )
+        self.backend = create_backend(
+            self.apply_parameters["backend"], self.process, self.apply_parameters
+        )
 
         self.config = self.get_config()
+        # the only place where server config file is written
+        self.writer = ConfigWriter(self.cfg_path, backups=configuration.wg_config_backups)
+
+        # parsed server config, reloaded only if file was changed outside the bot
+        self._registry: PeerRegistry | None = None
+        self._registry_stamp: tuple[int, int] | None = None
+        self._registry_digest: str | None = None
+        self._registry_lock = asyncio.Lock()
+        self._allocator: AddressAllocator | None = None
+        # addresses of peers compacted to table archived_peers, they stay reserved
+        self._archived_addresses: set[str] | None = None
+        # peer changes are written and applied in debounced batches
+        self.changes = ChangeQueue(self, debounce=self.apply_parameters["debounce"])
+        # ready key pairs for new configs, started in on_startup
+        self.key_pool = KeyPairPool(**configuration.key_pool_parameters)
 
     def generate_private_key(self, username: str, save: bool = True) -> str:
         """Generate wireguard peer PRIVATE key
@@ -25,16 +62,12 @@ class WireguardConfig:
             str: peer private key
         """
         try:
-            private_key = (
-                subprocess.check_output("wg genkey", shell=True).decode("utf-8").strip()
-            )
+            private_key = keygen.generate_private_key()
             logger.success("[+] private key generated")
 
             if save:
                 # TODO maybe better save private key to database?
-                logger.info(
-                    f'[+] private key "{private_key}" for user {username} saved to database'
-                )
+                logger.info(f"[+] private key for user {username} generated")
 
             return private_key
         except Exception as e:
@@ -53,11 +86,7 @@ class WireguardConfig:
             str: peer PUBLIC key
         """
         try:
-            public_key = (
-                subprocess.check_output(f"echo '{private_key}' | wg pubkey", shell=True)
-                .decode("utf-8")
-                .strip()
-            )
+            public_key = keygen.get_public_key(private_key)
             logger.success("[+] public key generated")
 
             if save:
@@ -75,13 +104,18 @@ class WireguardConfig:
         public_key = self.generate_public_key(private_key, username=username)
         return private_key, public_key
 
-    def restart_service(self) -> None:
+    async def restart_service(self) -> None:
         """restart wireguard service"""
-        try:
-            subprocess.run(["sudo", "systemctl", "restart", "wg-quick@wg0.service"])
-            logger.success("[+] wireguard service restarted")
-        except Exception as e:
-            logger.error(f"[-] {e}")
+        await self.backend.restart()
+
+    async def apply_peer_changes(
+        self,
+        registry: PeerRegistry,
+        changed: list[Peer] = (),
+        removed: list[Peer] = (),
+    ) -> None:
+        """applies changes of saved config to the running interface with selected backend"""
+        await self.backend.apply(registry, changed=changed, removed=removed)
 
     async def get_config(self) -> str:
         try:
@@ -90,239 +124,369 @@ class WireguardConfig:
         except Exception as e:
             logger.error(f"[-] {e}")
 
+    async def get_registry(self) -> PeerRegistry:
+        """returns parsed server config
+        file is re-read only if its mtime/size changed and content hash differs"""
+        stat = os.stat(self.cfg_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self._registry is not None and stamp == self._registry_stamp:
+            return self._registry
+
+        async with aiofiles.open(self.cfg_path, "r") as cfg:
+            config = await cfg.read()
+        digest = hashlib.sha256(config.encode("utf-8")).hexdigest()
+        if self._archived_addresses is None:
+            self._archived_addresses = {
+                peer["address"]
+                for peer in await aio.selector.get_archived_peers()
+                if peer["address"]
+            }
+        if self._registry is None or digest != self._registry_digest:
+            self._registry = PeerRegistry.parse(config)
+            self._allocator = self._create_allocator(self._registry)
+            logger.info(
+                f"[+] server config loaded: {len(self._registry)} peers from {self.cfg_path}"
+            )
+        self._registry_stamp = stamp
+        self._registry_digest = digest
+        return self._registry
+
+    async def save_registry(self) -> None:
+        """writes registry back to config file atomically"""
+        config = self._registry.render()
+        try:
+            stat = await self.writer.write(config)
+        except Exception:
+            # in-memory state is ahead of the file now, reload it next time
+            self._registry = None
+            raise
+        self._registry_stamp = (stat.st_mtime_ns, stat.st_size)
+        self._registry_digest = hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+    def _create_allocator(self, registry: PeerRegistry) -> AddressAllocator:
+        """address pools from WG_ADDRESS_POOLS or subnet of [Interface] Address,
+        server addresses and addresses of all existing peers are marked as used"""
+        interface_addresses = registry.interface_addresses()
+        if configuration.wg_address_pools:
+            networks = [IPv4Network(pool, strict=False) for pool in configuration.wg_address_pools]
+        elif interface_addresses:
+            networks = [address.network for address in interface_addresses]
+        else:
+            logger.warning("[!] [Interface] Address not found, using default pool 10.0.0.0/24")
+            networks = [IPv4Network("10.0.0.0/24")]
+            interface_addresses = [IPv4Address("10.0.0.1")]
+
+        allocator = AddressAllocator(
+            networks,
+            reserved=[getattr(address, "ip", address) for address in interface_addresses],
+        )
+        for address in registry.addresses():
+            allocator.reserve(address)
+        for address in self._archived_addresses or ():
+            allocator.reserve(address)
+        logger.info(f"[+] peer address pools: {allocator.stats()}")
+        return allocator
+
     async def get_last_peer_adress(self) -> str:
         """returns last peer adress from config file
-        exactly, the last string in config file, that starts with 'AllowedIPs'"""
-        try:
-            for line in (await self.get_config()).splitlines():
-                if line.startswith("AllowedIPs"):
-                    last_peer_adress = line[13:-3]
-                elif line.startswith("#AllowedIPs"):
-                    last_peer_adress = line[14:-3]
-            # delete 'AllowedIPs = ' and '/32' from string
-            return last_peer_adress
-
-        except UnboundLocalError as e:
+        exactly, the address of the last peer block in config file"""
+        last_peer_adress = (await self.get_registry()).last_address()
+        if last_peer_adress is None:
             logger.error(
-                f"[-] String 'AllowedIPs' not found in config file. Returning default adress '10.0.0.2'. Error: {e.__repr__()}"
+                "[-] String 'AllowedIPs' not found in config file. Returning default adress '10.0.0.2'."
             )
             return "10.0.0.2"
+        return last_peer_adress
 
-    async def add_byte_to_adress(self, username: str) -> str | None:
-        """adds 1 byte to adress"""
-        adress = IPv4Address(await self.get_last_peer_adress())
-        if adress == IPv4Address("255.255.255.255"):
-            logger.error("[-] no free ip adresses")
-            return None
+    async def allocate_address(self, username: str) -> str:
+        """takes free address from the pools, addresses of removed peers are reused
 
-        new_adress = str(adress + 1)
-        logger.info(f"[+] new peer adress is {new_adress} for user {username}")
+        Raises:
+            RuntimeError: if all address pools are exhausted
+        """
+        await self.get_registry()
+        adress = self._allocator.allocate()
+        if adress is None:
+            logger.error("[-] no free ip adresses")
+            raise RuntimeError("no free ip adresses in peer address pools")
 
-        return new_adress
+        logger.info(f"[+] new peer adress is {adress} for user {username}")
+        return str(adress)
 
     async def add_new_peer(
-        self, username_and_device: str, peer_public_key: str
-    ) -> None:
-        """adds new peer to config file"""
+        self,
+        username_and_device: str,
+        peer_public_key: str,
+        peer_preshared_key: str | None = None,
+    ) -> str | None:
+        """adds new peer to config file and applies it to the interface
+
+        Returns:
+            str: address of the new peer, None if peer was not added
+        """
+        adress = None
         try:
-            async with aiofiles.open(self.cfg_path, "a") as cfg:
-                await cfg.write(
-                    f"#{username_and_device}\n"
-                    f"[Peer]\n"
-                    f"PublicKey = {peer_public_key}\n"
-                    f"PresharedKey = {self.server_preshared_key}\n"
-                    f"AllowedIPs = {await self.add_byte_to_adress(username_and_device)}/32\n\n"
-                )
-                logger.info(f"[+] new peer {username_and_device} added")
+            async with self._registry_lock:
+                adress = await self.allocate_address(username_and_device)
+            peer = await self.changes.submit(
+                ADD,
+                username_and_device,
+                Peer(
+                    username_and_device,
+                    public_key=peer_public_key,
+                    preshared_key=peer_preshared_key or self.server_preshared_key,
+                    allowed_ips=f"{adress}/32",
+                ),
+            )
+            if not isinstance(peer, Peer):
+                raise RuntimeError(f"peer {username_and_device} was removed before it was added")
+            logger.info(f"[+] new peer {username_and_device} added")
+            return adress
         except Exception as e:
+            if adress is not None and self._allocator is not None:
+                self._allocator.release(adress)
             logger.error(f"[-] {e}")
+            return None
 
-    async def get_peer_address(self, username: str) -> str:
-        """Returns peer address by username"""
-        for line in (await self.get_config()).splitlines():
-            if line.startswith("#") and line.endswith(username):
-                for line2 in (await self.get_config()).splitlines():
-                    if line2.startswith("AllowedIPs") or line2.startswith(
-                        "#AllowedIPs"
-                    ):
-                        peer_address = line2
-                # Remove 'AllowedIPs = ' from the string
-                logger.info(
-                    f"[+] Peer address for user {username} is {peer_address[13:]}"
-                )
-                return (
-                    peer_address[13:]
-                    if line2.startswith("#AllowedIPs")
-                    else peer_address[14:]
-                )
-        logger.error("[-] Peer address not found")
-        return ""
+    async def _peer_names(self, usernames: list[str]) -> list[str]:
+        async with self._registry_lock:
+            registry = await self.get_registry()
+            return [
+                peer.name for username in usernames for peer in registry.peers_of(username)
+            ]
+
+    async def _submit_for_users(self, action: str, usernames: list[str]) -> list[str]:
+        """queues change for all devices of the users, returns names of changed peers
+        submitted at once, so all of them are applied in one batch"""
+        names = await self._peer_names(usernames)
+        results = await asyncio.gather(
+            *(self.changes.submit(action, name) for name in names)
+        )
+        return [name for name, is_changed in zip(names, results) if is_changed]
 
-    async def create_peer_config(self, peer_private_key: str) -> str:
+    async def get_peer_address(self, username: str) -> str:
+        """Returns peer address by username or username_DEVICE"""
+        registry = await self.get_registry()
+        peer = registry.get(username) or next(iter(registry.peers_of(username)), None)
+        if peer is None:
+            logger.error("[-] Peer address not found")
+            return ""
+        logger.info(f"[+] Peer address for user {username} is {peer.allowed_ips}")
+        return peer.allowed_ips
+
+    async def create_peer_config(
+        self,
+        peer_private_key: str,
+        peer_address: str | None = None,
+        peer_preshared_key: str | None = None,
+    ) -> str:
         """creates config for client and returns it as string"""
-        cfg = (
-            f"[Interface]\n"
-            f"PrivateKey = {peer_private_key}\n"
-            f"Address = {await self.get_last_peer_adress()}\n"
-            f"DNS = {configuration.peer_dns}\n\n"
-            f"[Peer]\n"
-            f"PublicKey = {self.server_public_key}\n"
-            f"PresharedKey = {self.server_preshared_key}\n"
-            f"AllowedIPs = 0.0.0.0/0\n"
-            f"Endpoint = {self.server_ip}:{self.server_port}\n"
-            f"PersistentKeepalive = 20"
+        if peer_address is None:
+            peer_address = await self.get_last_peer_adress()
+        return render_peer_config(
+            peer_private_key,
+            peer_address,
+            configuration.peer_dns,
+            self.server_public_key,
+            peer_preshared_key or self.server_preshared_key,
+            f"{self.server_ip}:{self.server_port}",
+        )
+
+    def render_config(self, peer: StoredPeer) -> str:
+        """client config of stored peer with current server settings"""
+        if not peer.private_key or not peer.address:
+            # row that was stored before per-peer fields and could not be migrated
+            return peer.config
+        return render_peer_config(
+            peer.private_key,
+            peer.address,
+            configuration.peer_dns,
+            self.server_public_key,
+            peer.preshared_key or self.server_preshared_key,
+            f"{self.server_ip}:{self.server_port}",
         )
-        return cfg
 
-    async def update_server_config(self, username: str, device: str) -> str:
-        """adds new peer to config file and restarts wg-quick
+    async def update_server_config(self, username: str, device: str) -> StoredPeer:
+        """adds new peer to config file and applies it to the interface
 
         Args:
             username (str): username of new peer
             device (str): device of new peer
 
         Returns:
-            str: config for new peer
+            StoredPeer: fields of new peer, config is rendered with render_config()
         """
-        user_priv_key, user_pub_key = self.generate_key_pair(username=username)
-
-        await self.add_new_peer(f"{username}_{device}", user_pub_key)
-        # restart wg-quick
-        self.restart_service()
+        key_pair = self.key_pool.take()
 
-        return await self.create_peer_config(user_priv_key)
+        peer_address = await self.add_new_peer(
+            f"{username}_{device}", key_pair.public_key, key_pair.preshared_key
+        )
+        if peer_address is None:
+            raise RuntimeError(f"peer {username}_{device} was not added to server config")
+
+        return StoredPeer(
+            config_name=f"{username}_{device}",
+            device=device,
+            private_key=key_pair.private_key,
+            public_key=key_pair.public_key,
+            address=peer_address,
+            preshared_key=key_pair.preshared_key,
+        )
 
     async def disconnect_peer(self, user_id: int):
         """Disconnects peer by user ID."""
-        username = database.selector.get_username_by_id(user_id)
-        await self.comment_lines_under_username(username)
+        await self.disconnect_peers([user_id])
 
-        # Restart wg-quick.
-        self.restart_service()
-        logger.info(f"[+] Peer {username} disconnected")
+    async def disconnect_peers(self, user_ids: list[int]) -> list[str]:
+        """Disconnects all devices of the users with one config write and one apply
+
+        Returns:
+            list[str]: names of disconnected peers
+        """
+        usernames = await aio.selector.get_usernames_by_ids(user_ids)
+        disabled = await self._submit_for_users(DISABLE, list(usernames.values()))
+        if disabled:
+            logger.info(f"[+] {len(disabled)} peers of {len(usernames)} users disconnected")
+        return disabled
 
     async def comment_lines_under_username(self, username: str):
-        """Comments the 3 lines under the given username."""
-        async with aiofiles.open(self.cfg_path, "r+") as cfg:
-            config = await cfg.readlines()
-            for line_index, line in enumerate(config):
-                if line.strip() in (f"#{username}_PC", f"#{username}_PHONE"):
-                    disconnected_username = f"DISCONNECTED_{line[1:]}"
-                    config[line_index] = f"#{disconnected_username}"
-                    for line_under_username_index in range(
-                        line_index + 1, line_index + 5
-                    ):
-                        if line_under_username_index < len(config) and not config[
-                            line_under_username_index
-                        ].startswith("#"):
-                            config[
-                                line_under_username_index
-                            ] = f"#{config[line_under_username_index]}"
-            await cfg.seek(0)
-            await cfg.write("".join(config))
+        """Comments peer blocks of all user devices."""
+        disabled = await self._submit_for_users(DISABLE, [username])
+        if disabled:
+            logger.info(f"[+] peers {', '.join(disabled)} commented")
 
     async def reconnect_payed_user(self, user_id: int):
         """reconnects payed user by user_id"""
-        username = database.selector.get_username_by_id(user_id)
-
         try:
-            async with aiofiles.open(self.cfg_path, "r") as cfg:
-                config = await cfg.read()
-                for line in config.splitlines():
-                    if line.startswith(f"#DISCONNECTED_{username}"):
-                        config = config.replace(f"{line}\n", f"#{line[14:]}\n")
+            await self.reconnect_peers([user_id])
+        except Exception as e:
+            logger.error(f"[-] {e}")
 
-            async with aiofiles.open(self.cfg_path, "w") as cfg:
-                await cfg.write(config)
+    async def reconnect_peers(self, user_ids: list[int]) -> list[str]:
+        """Reconnects all devices of the users with one config write and one apply,
+        compacted peers are restored from table archived_peers
 
-            async with aiofiles.open(self.cfg_path, "r") as cfg:
-                config = await cfg.read()
-                config_as_list = config.splitlines()
-                for line in config_as_list:
-                    if line.startswith(f"#{username}"):
-                        # get index of line with username
-                        line_index = config.splitlines().index(line)
-                        if config_as_list[line_index + 1].startswith("#[Peer]"):
-                            for _ in range(4):
-                                line_index += 1
-                                config_as_list[line_index] = config_as_list[line_index][
-                                    1:
-                                ]
-
-                config = "".join([f"{line}\n" for line in config_as_list])
-
-            async with aiofiles.open(self.cfg_path, "w") as cfg:
-                await cfg.write(config)
-            # restart wg-quick
-            self.restart_service()
-            logger.info(f"[+] peer {username} reconnected")
+        Returns:
+            list[str]: names of reconnected peers
+        """
+        usernames = list((await aio.selector.get_usernames_by_ids(user_ids)).values())
+        archived = [
+            peer
+            for row in await aio.selector.get_archived_peers(usernames)
+            for peer in PeerRegistry.parse(row["block"])
+        ]
+        for peer in archived:
+            peer.disabled = False
+        names = await self._peer_names(usernames)
+
+        # submitted at once, restored and enabled peers are applied in one batch
+        results = await asyncio.gather(
+            *(self.changes.submit(ADD, peer.name, peer) for peer in archived),
+            *(self.changes.submit(ENABLE, name) for name in names),
+            return_exceptions=True,
+        )
+        restored = [
+            peer for peer, result in zip(archived, results) if isinstance(result, Peer)
+        ]
+        enabled = [
+            name for name, result in zip(names, results[len(archived):]) if result is True
+        ]
+        if restored:
+            await aio.update.delete_archived_peers([peer.name for peer in restored])
+            self._archived_addresses.difference_update(peer.address for peer in restored)
+            logger.info(f"[+] {len(restored)} peers restored from archive")
+        if enabled or restored:
+            logger.info(
+                f"[+] {len(enabled) + len(restored)} peers of {len(usernames)} users reconnected"
+            )
+        return enabled + [peer.name for peer in restored]
 
-        except Exception as e:
-            logger.error(f"[-] {e}")
+    async def compact_disconnected_peers(self, days: int) -> dict:
+        """Moves disconnected peers of users whose subscription ended more than
+        N days ago from server config to table archived_peers.
+        Keys and addresses are kept, reconnect_peers restores them.
+
+        Returns:
+            dict: count of archived peers and config size before/after in bytes
+        """
+        user_ids = {
+            username: user_id
+            for user_id, username in (await aio.selector.get_usernames_expired_before(days)).items()
+        }
+        async with self._registry_lock:
+            registry = await self.get_registry()
+            size_before = len(registry.render().encode("utf-8"))
+            peers = [
+                peer
+                for username in user_ids
+                for peer in registry.peers_of(username)
+                if peer.disabled
+            ]
+            if peers:
+                archived = await aio.insert.archive_peers(
+                    [
+                        (
+                            peer.name,
+                            user_ids[peer.username],
+                            peer.username,
+                            peer.public_key,
+                            peer.address,
+                            peer.render(),
+                        )
+                        for peer in peers
+                    ]
+                )
+                if not archived:
+                    raise RuntimeError("peers were not archived, config is not compacted")
+                for peer in peers:
+                    registry.remove(peer.name)
+                    if peer.address:
+                        self._archived_addresses.add(peer.address)
+                await self.save_registry()
+            size_after = len(registry.render().encode("utf-8"))
+
+        report = {
+            "archived": len(peers),
+            "bytes_before": size_before,
+            "bytes_after": size_after,
+            "bytes_saved": size_before - size_after,
+        }
+        logger.warning(f"[!] server config compacted: {report}")
+        return report
 
     async def permanently_remove_peer(self, user_id: int):
         """Permanently removes peer configuration from WireGuard config file."""
-        username = database.selector.get_username_by_id(user_id)
+        username = await aio.selector.get_username_by_id(user_id)
         if not username:
             logger.error(f"[-] Username not found for user_id {user_id}")
             return
 
         try:
-            async with aiofiles.open(self.cfg_path, "r") as cfg:
-                config_lines = await cfg.readlines()
-
-            new_config_lines = []
-            skip_lines = 0
-            
-            for i, line in enumerate(config_lines):
-                if skip_lines > 0:
-                    skip_lines -= 1
-                    continue
-                    
-                # Check if this line contains the username we want to remove
-                if (line.strip() == f"#{username}_PC" or 
-                    line.strip() == f"#{username}_PHONE" or
-                    line.strip() == f"#DISCONNECTED_{username}_PC" or
-                    line.strip() == f"#DISCONNECTED_{username}_PHONE"):
-                    
-                    # Skip this line and the next 4 lines (peer configuration)
-                    skip_lines = 4
-                    logger.info(f"[+] Removing peer configuration for {line.strip()}")
-                    continue
-                
-                new_config_lines.append(line)
-
-            # Write the new configuration back to file
-            async with aiofiles.open(self.cfg_path, "w") as cfg:
-                await cfg.writelines(new_config_lines)
-
-            # Restart WireGuard service
-            self.restart_service()
+            for name in await self._submit_for_users(REMOVE, [username]):
+                logger.info(f"[+] Removed peer configuration for {name}")
+
+            archived = await aio.selector.get_archived_peers([username])
+            if archived:
+                await aio.update.delete_archived_peers([peer["name"] for peer in archived])
+                for peer in archived:
+                    if peer["address"]:
+                        self._archived_addresses.discard(peer["address"])
+                        self._allocator.release(peer["address"])
+                logger.info(f"[+] Removed {len(archived)} archived peers of {username}")
             logger.warning(f"[!] Peer {username} permanently removed from WireGuard config")
 
         except Exception as e:
             logger.error(f"[-] Error removing peer {username}: {e}")
 
     async def remove_user_configs_from_db(self, user_id: int):
-        """Remove all user configurations from database."""
-        try:
-            import psycopg2 as pg
-            conn = pg.connect(**configuration.db_connection_parameters)
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """--sql
-                    DELETE FROM vpn_config WHERE user_id = %s
-                    """,
-                    (user_id,),
-                )
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                username = database.selector.get_username_by_id(user_id)
-                logger.warning(f"[!] Removed {deleted_count} config(s) from database for user {user_id}::{username}")
-                
-        except Exception as e:
-            logger.error(f"[-] Error removing configs from database for user {user_id}: {e}")
+        """Remove all user configurations from database, cached QR codes of them too."""
+        for record in await aio.selector.all_user_configs(user_id) or ():
+            peer = await aio.selector.get_user_peer(user_id, record["config_name"])
+            if peer is not None:
+                qr_cache.discard(qr_cache.key(self.render_config(peer)))
+        deleted_count = await aio.update.delete_user_configs(user_id)
+        username = await aio.selector.get_username_by_id(user_id)
+        logger.warning(f"[!] Removed {deleted_count} config(s) from database for user {user_id}::{username}")
 
     async def ban_user_completely(self, user_id: int):
         """Completely ban user: remove configs from WireGuard and database, mark as banned."""
@@ -334,9 +498,9 @@ class WireguardConfig:
             await self.remove_user_configs_from_db(user_id)
             
             # Mark user as banned in database
-            database.update.ban_user(user_id)
+            await aio.update.ban_user(user_id)
             
-            username = database.selector.get_username_by_id(user_id)
+            username = await aio.selector.get_username_by_id(user_id)
             logger.warning(f"[!] User {user_id}::{username} completely banned and removed")
             
         except Exception as e:
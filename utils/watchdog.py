@@ -1,61 +1,200 @@
 # ASYNC daemon that watches for users who have a subscription end date and sends them a message
+# at exact times scheduled by ExpiryScheduler:
 # first time : 2 days before end date
 # second time : 1 day before end date
-# third time : end date
-# fourth time : 1 day after end date send kb free user
+# third time : 3 hours before end date
+# fourth time : at end date, send kb free user and disconnect peers
+# check_end_date runs every few minutes and sends what the scheduler missed,
+# sent notifications are recorded in table subscription_notifications
 
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pprint import pformat
+
+from aiogram import types
+from aiogram.utils.markdown import hpre
 from loguru import logger
-from database.selector import get_user_ids_enddate_n_days
+from database.aio.insert import claim_notifications
+from database.aio.selector import get_due_notifications, get_user_snapshots
+from database.aio.update import release_notifications
 import keyboards as kb
 from loader import bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from loader import vpn_config
 from utils.bot_error_handler import safe_send_message
+from utils.broadcast import notify_admins
+from utils.telegram_limiter import telegram_limiter
+from data import configuration
+from utils.reconciler import reconcile
+from utils.expiry_scheduler import ExpiryScheduler, REMINDERS
+
+# users expired this long ago still get the expiry notification from the check
+EXPIRED_WITHIN = timedelta(days=1)
 
 
 class Watchdog:
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
+        self.expiry = ExpiryScheduler(self.notify_users)
+        # counts since the last daily report to admins
+        self._notified = Counter()
+        self._failed = Counter()
+        self._disconnected = 0
 
     def run(self):
-        """start watchdog coroutine every day at 02:00"""
-        self.scheduler.add_job(self.check_end_date, "cron", hour=2, minute=0)
-        # self.scheduler.add_job(self.check_end_date, 'interval', seconds=5)
+        """start expiry scheduler and periodic jobs, report to admins every day at 02:00"""
+        self.expiry.start()
+        self.scheduler.add_job(self.report_notifications, "cron", hour=2, minute=0)
+        if configuration.watchdog_sweep_minutes > 0:
+            # first run on start catches up on notifications missed while the bot was stopped
+            self.scheduler.add_job(
+                self.check_end_date,
+                "interval",
+                minutes=configuration.watchdog_sweep_minutes,
+                next_run_time=datetime.now(),
+            )
+        if configuration.wg_compact_after_days > 0:
+            self.scheduler.add_job(self.compact_server_config, "cron", hour=3, minute=0)
+        if configuration.reconcile_parameters["interval_minutes"] > 0:
+            self.scheduler.add_job(
+                self.reconcile_peers,
+                "interval",
+                minutes=configuration.reconcile_parameters["interval_minutes"],
+            )
         self.scheduler.start()
         logger.success("[+] Watchdog coroutine created and started successfully")
 
+    async def notify_users(self, days_by_user: dict[int, int]):
+        """send reminders (days until the end) and disconnect users with days == -1,
+        called by expiry scheduler with events that are due together and by check_end_date"""
+        started = time.monotonic()
+        # keyboard depends only on whether user has configs, so it is built
+        # at most twice from snapshots loaded with one query
+        snapshots = await get_user_snapshots(list(days_by_user))
+        keyboards = {}
+        for snapshot in snapshots.values():
+            has_configs = bool(snapshot.config_names)
+            if has_configs not in keyboards:
+                keyboards[has_configs] = await kb.reply.free_user_kb(snapshot)
+
+        semaphore = asyncio.Semaphore(configuration.watchdog_concurrency)
+
+        async def notify(user_id: int, days: int) -> bool:
+            kwargs = {}
+            if days == -1:
+                kwargs["reply_markup"] = keyboards[bool(snapshots[user_id].config_names)]
+            async with semaphore:
+                return await safe_send_message(
+                    bot,
+                    user_id,
+                    self.get_message_text(days),
+                    limiter=telegram_limiter,
+                    **kwargs,
+                )
+
+        notifications = [
+            (user_id, days, snapshots[user_id].subscription_end_date)
+            for user_id, days in days_by_user.items()
+            if user_id in snapshots and not snapshots[user_id].is_banned
+        ]
+        # ledger entry is claimed before sending, so scheduler and sweep never
+        # send the same notification twice, without ledger everything is sent
+        claimed = await claim_notifications(notifications) if notifications else set()
+        if claimed is not None:
+            notifications = [n for n in notifications if (n[0], n[1]) in claimed]
+        users = [(user_id, days) for user_id, days, _ in notifications]
+        results = await asyncio.gather(
+            *(notify(user_id, days) for user_id, days in users), return_exceptions=True
+        )
+
+        notified = Counter()
+        failed = Counter()
+        for (user_id, days), success in zip(users, results):
+            if success is True:
+                notified[days] += 1
+            else:
+                failed[days] += 1
+                if isinstance(success, Exception):
+                    logger.error(f"[-] user {user_id} was not notified: {success}")
+
+        # undelivered notifications are sent again by the next check
+        release = [
+            notification
+            for notification, success in zip(notifications, results)
+            if success is not True
+        ]
+
+        # expired users lose access whether the message reached them or not,
+        # one query, one config write and one apply for all of them
+        expired = [notification for notification in notifications if notification[1] == -1]
+        expired_users = [user_id for user_id, _, _ in expired]
+        if expired_users:
+            try:
+                await vpn_config.disconnect_peers(expired_users)
+            except Exception as e:
+                logger.error(f"[-] {len(expired_users)} expired users were not disconnected: {e}")
+                # the next check notifies and disconnects them again
+                undelivered = set(release)
+                release.extend(n for n in expired if n not in undelivered)
+                expired_users = []
+
+        if release:
+            await release_notifications(release)
+
+        self._notified.update(notified)
+        self._failed.update(failed)
+        self._disconnected += len(expired_users)
+        report = {
+            "notified": dict(sorted(notified.items())),
+            "failed": dict(sorted(failed.items())),
+            "disconnected": len(expired_users),
+            "seconds": round(time.monotonic() - started, 1),
+        }
+        logger.info(f"[+] Users notified about end date: {report}")
+
     async def check_end_date(self):
-        logger.info("[+] Checking for users with end date")
-        notified_users = []
-        user_ids_by_day = {}
-        for days in range(-1, 3):
-            user_ids_by_day[days] = get_user_ids_enddate_n_days(days)
-            for user_id in user_ids_by_day[days]:
-                if user_id not in notified_users:
-                    message_text = self.get_message_text(days)
-                    if days == -1:
-                        success = await safe_send_message(
-                            bot,
-                            user_id,
-                            message_text,
-                            reply_markup=await kb.reply.free_user_kb(user_id=user_id),
-                        )
-                        if success:
-                            vpn_config.disconnect_peer(user_id)
-                    else:
-                        success = await safe_send_message(bot, user_id, message_text)
-                    
-                    if success:
-                        notified_users.append(user_id)
-                        logger.warning(
-                            f"[+] user {user_id} notified about end date {days} days"
-                        )
-                    else:
-                        logger.warning(
-                            f"[!] Failed to notify user {user_id} (possibly banned due to bot blocking)"
-                        )
-
-        logger.info("Finished checking for users with end date")
+        """notify users whose reminder or expiry is due but not in the ledger yet,
+        cheap and idempotent, so it runs every few minutes next to the scheduler"""
+        due = await get_due_notifications(REMINDERS, EXPIRED_WITHIN)
+        if due:
+            await self.notify_users({user_id: bucket for user_id, bucket, _ in due})
+
+    async def report_notifications(self):
+        """send admins counts of notifications since the last report"""
+        report = {
+            "notified": dict(sorted(self._notified.items())),
+            "failed": dict(sorted(self._failed.items())),
+            "disconnected": self._disconnected,
+            "scheduler": self.expiry.stats(),
+        }
+        self._notified.clear()
+        self._failed.clear()
+        self._disconnected = 0
+        await notify_admins(
+            f"Уведомления о подписке за сутки (дней до окончания: количество)\n"
+            f"{hpre(pformat(report))}",
+            parse_mode=types.ParseMode.HTML,
+        )
+
+    async def compact_server_config(self):
+        """move long disconnected peers out of wg0.conf"""
+        try:
+            await vpn_config.compact_disconnected_peers(configuration.wg_compact_after_days)
+        except Exception as e:
+            logger.error(f"[-] {e}")
+
+    async def reconcile_peers(self):
+        """compare database, wg0.conf and interface, fix drift if enabled"""
+        try:
+            await reconcile(
+                vpn_config,
+                apply=configuration.reconcile_parameters["apply"],
+                disable_orphans=configuration.reconcile_parameters["disable_orphans"],
+            )
+        except Exception as e:
+            logger.error(f"[-] {e}")
 
     def get_message_text(self, days: int) -> str:
         if days == -1:
@@ -67,5 +206,6 @@ class Watchdog:
         elif days == 2:
             return "Ваша подписка заканчивается через 2 дня, не забудьте продлить ее =)"
 
-    def stop(self):
+    async def stop(self):
         self.scheduler.shutdown()
+        await self.expiry.stop()
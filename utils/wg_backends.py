@@ -0,0 +1,251 @@
+"""How peer changes of the server config reach WireGuard
+
+Backend is selected with WG_BACKEND:
+- wg-quick: every change restarts wg-quick service (drops all connected peers)
+- live: single peers are set/removed with `wg set`, batches use `wg syncconf`,
+  restart is the last resort
+- fake: in-memory interface, no root and no real interface needed, for
+  benchmarks and load tests of peer operations
+"""
+
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+from loguru import logger
+from utils.peer_registry import Peer, PeerRegistry
+from utils.process import ProcessRunner
+
+
+class LivePeer(NamedTuple):
+    """Peer as seen on the running interface"""
+
+    public_key: str
+    allowed_ips: str
+    endpoint: str | None = None
+    latest_handshake: int = 0
+    transfer_rx: int = 0
+    transfer_tx: int = 0
+
+
+class WireguardBackend(ABC):
+    name = ""
+
+    def __init__(self, process: ProcessRunner, parameters: dict) -> None:
+        self.process = process
+        self.interface = parameters["interface"]
+        self.binary = parameters["binary"]
+        self.sudo = parameters["sudo"]
+        self.timeout = parameters["timeout"]
+
+    @abstractmethod
+    async def add_peer(self, peer: Peer) -> None:
+        """Add or update peer on the running interface"""
+
+    @abstractmethod
+    async def remove_peer(self, peer: Peer) -> None:
+        """Remove peer from the running interface"""
+
+    async def disable_peer(self, peer: Peer) -> None:
+        await self.remove_peer(peer)
+
+    async def enable_peer(self, peer: Peer) -> None:
+        await self.add_peer(peer)
+
+    @abstractmethod
+    async def sync(self, registry: PeerRegistry) -> None:
+        """Make interface match the whole saved config"""
+
+    @abstractmethod
+    async def restart(self) -> None:
+        """Restart the interface from the saved config"""
+
+    async def apply(
+        self,
+        registry: PeerRegistry,
+        changed: list[Peer] = (),
+        removed: list[Peer] = (),
+    ) -> None:
+        """Apply changes of saved config, peers one by one, whole config on failure
+
+        Args:
+            registry (PeerRegistry): registry already saved to config file
+            changed (list[Peer]): added, enabled or disabled peers
+            removed (list[Peer]): peers removed from registry
+        """
+        if not changed and not removed:
+            return
+        try:
+            for peer in removed:
+                if peer.public_key:
+                    await self.remove_peer(peer)
+            for peer in changed:
+                if peer.disabled:
+                    await self.disable_peer(peer)
+                else:
+                    await self.enable_peer(peer)
+            return
+        except Exception as e:
+            logger.error(f"[-] peer update on {self.interface} failed: {e}, syncing whole config")
+        await self.sync(registry)
+
+    @abstractmethod
+    async def show(self) -> dict[str, LivePeer]:
+        """Peers of the running interface by public key"""
+
+    async def run_wg(self, *args: str, input: str | None = None) -> str:
+        """runs wg tool (WG_BINARY) and returns its stdout
+
+        Raises:
+            CommandError: if command exited with non-zero code or timed out
+        """
+        return await self.run_privileged(self.binary, *args, input=input)
+
+    async def run_privileged(
+        self, *command: str, input: str | None = None, timeout: float | None = None
+    ) -> str:
+        """runs command with sudo if WG_USE_SUDO is set"""
+        if self.sudo:
+            command = ("sudo", *command)
+        return await self.process.run(*command, input=input, timeout=timeout)
+
+
+class WgQuickBackend(WireguardBackend):
+    name = "wg-quick"
+
+    async def restart(self) -> None:
+        """restart wireguard service"""
+        try:
+            service = f"wg-quick@{self.interface}.service"
+            # restart takes longer than a single wg command
+            await self.run_privileged("systemctl", "restart", service, timeout=self.timeout * 3)
+            logger.success("[+] wireguard service restarted")
+        except Exception as e:
+            logger.error(f"[-] {e}")
+
+    async def add_peer(self, peer: Peer) -> None:
+        # wg-quick reads peers only from the config file
+        await self.restart()
+
+    async def remove_peer(self, peer: Peer) -> None:
+        await self.restart()
+
+    async def sync(self, registry: PeerRegistry) -> None:
+        await self.restart()
+
+    async def apply(
+        self,
+        registry: PeerRegistry,
+        changed: list[Peer] = (),
+        removed: list[Peer] = (),
+    ) -> None:
+        if changed or removed:
+            await self.restart()
+
+    async def show(self) -> dict[str, LivePeer]:
+        # public-key preshared-key endpoint allowed-ips latest-handshake rx tx keepalive,
+        # the first line describes the interface itself
+        dump = await self.run_wg("show", self.interface, "dump")
+        peers = {}
+        for line in dump.splitlines()[1:]:
+            fields = line.split("\t")
+            if len(fields) < 7:
+                continue
+            peers[fields[0]] = LivePeer(
+                public_key=fields[0],
+                allowed_ips=fields[3] if fields[3] != "(none)" else "",
+                endpoint=fields[2] if fields[2] != "(none)" else None,
+                latest_handshake=int(fields[4]),
+                transfer_rx=int(fields[5]),
+                transfer_tx=int(fields[6]),
+            )
+        return peers
+
+
+class LiveBackend(WgQuickBackend):
+    name = "live"
+
+    async def add_peer(self, peer: Peer) -> None:
+        """adds or updates peer on the running interface, other peers are not touched"""
+        args = ["set", self.interface, "peer", peer.public_key]
+        if peer.preshared_key:
+            # key is passed through stdin to keep it out of process list
+            args += ["preshared-key", "/dev/stdin"]
+        args += ["allowed-ips", peer.allowed_ips]
+        await self.run_wg(*args, input=peer.preshared_key or None)
+
+    async def remove_peer(self, peer: Peer) -> None:
+        """removes peer from the running interface, config file is not touched"""
+        await self.run_wg("set", self.interface, "peer", peer.public_key, "remove")
+
+    async def sync(self, registry: PeerRegistry) -> None:
+        """`wg syncconf` keeps sessions of unchanged peers, restart if it fails"""
+        try:
+            await self.run_wg(
+                "syncconf", self.interface, "/dev/stdin", input=registry.render_stripped()
+            )
+            logger.success(f"[+] interface {self.interface} synced")
+        except Exception as e:
+            logger.error(f"[-] config sync failed: {e}, restarting service")
+            await self.restart()
+
+    async def apply(
+        self,
+        registry: PeerRegistry,
+        changed: list[Peer] = (),
+        removed: list[Peer] = (),
+    ) -> None:
+        # one syncconf is cheaper than a wg call per peer
+        if len(changed) + len(removed) > 1:
+            await self.sync(registry)
+        else:
+            await WireguardBackend.apply(self, registry, changed, removed)
+
+
+class FakeBackend(WireguardBackend):
+    """Interface kept in memory, every operation is counted"""
+
+    name = "fake"
+
+    def __init__(self, process: ProcessRunner, parameters: dict) -> None:
+        super().__init__(process, parameters)
+        self.peers: dict[str, LivePeer] = {}
+        self.calls: dict[str, int] = {}
+
+    def _count(self, operation: str) -> None:
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    async def add_peer(self, peer: Peer) -> None:
+        self._count("add_peer")
+        self.peers[peer.public_key] = LivePeer(peer.public_key, peer.allowed_ips)
+
+    async def remove_peer(self, peer: Peer) -> None:
+        self._count("remove_peer")
+        self.peers.pop(peer.public_key, None)
+
+    async def sync(self, registry: PeerRegistry) -> None:
+        self._count("sync")
+        self.peers = {
+            peer.public_key: LivePeer(peer.public_key, peer.allowed_ips)
+            for peer in registry
+            if not peer.disabled and peer.public_key
+        }
+
+    async def restart(self) -> None:
+        self._count("restart")
+
+    async def show(self) -> dict[str, LivePeer]:
+        self._count("show")
+        return dict(self.peers)
+
+
+BACKENDS: dict[str, type[WireguardBackend]] = {
+    backend.name: backend for backend in (WgQuickBackend, LiveBackend, FakeBackend)
+}
+
+
+def create_backend(name: str, process: ProcessRunner, parameters: dict) -> WireguardBackend:
+    """Raises ValueError for unknown backend name"""
+    try:
+        return BACKENDS[name](process, parameters)
+    except KeyError:
+        raise ValueError(f"unknown wireguard backend '{name}', use one of {list(BACKENDS)}")
@@ -0,0 +1,219 @@
+"""Debounced queue of peer changes for the server config
+
+Changes submitted within WG_APPLY_DEBOUNCE_MS are merged per peer and applied
+together: one config file write and one interface update per batch. Every
+caller gets a future that resolves when its change is written to the config.
+If the interface update fails after that, the whole config is synced later.
+"""
+
+import asyncio
+import time
+from loguru import logger
+from utils.peer_registry import Peer, PeerRegistry
+
+ADD = "add"
+ENABLE = "enable"
+DISABLE = "disable"
+REMOVE = "remove"
+
+
+class PeerChange:
+    """Pending change of a single peer, futures of all merged submits"""
+
+    __slots__ = ("name", "action", "peer", "futures")
+
+    def __init__(self, name: str, action: str, peer: Peer | None = None) -> None:
+        self.name = name
+        self.action = action
+        self.peer = peer
+        self.futures: list[asyncio.Future] = []
+
+    def merge(self, action: str, peer: Peer | None = None) -> None:
+        """last change wins, but a not yet written peer is added in its final state"""
+        if self.action == ADD and action in (ENABLE, DISABLE):
+            self.peer.disabled = action == DISABLE
+            return
+        if self.action == ADD and action == REMOVE:
+            # keep the peer, so its address is released after the batch
+            self.action = REMOVE
+            return
+        self.action = action
+        self.peer = peer if peer is not None else self.peer
+
+    def resolve(self, result) -> None:
+        for future in self.futures:
+            if not future.done():
+                future.set_result(result)
+
+    def fail(self, error: Exception) -> None:
+        for future in self.futures:
+            if not future.done():
+                future.set_exception(error)
+
+
+class ChangeQueue:
+    """Coalesces peer changes of WireguardConfig and applies them in batches"""
+
+    # how long times of added peers are kept for added_within()
+    ADDED_TTL = 3600
+
+    def __init__(self, wireguard, debounce: float) -> None:
+        self._wireguard = wireguard
+        self.debounce = debounce
+        self._pending: dict[str, PeerChange] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._sync_task: asyncio.Task | None = None
+        # name -> monotonic time the peer was written by an ADD batch
+        self._added_at: dict[str, float] = {}
+        self._batches = 0
+        self._submitted = 0
+        self._applied = 0
+        self._syncs = 0
+
+    def submit(self, action: str, name: str, peer: Peer | None = None) -> asyncio.Future:
+        """Queue change of peer `name`, peer is required for ADD
+
+        Returns:
+            asyncio.Future: resolves with the added Peer for ADD, with bool
+            "peer was changed" for other actions, or with the error of the change
+        """
+        future = asyncio.get_running_loop().create_future()
+        change = self._pending.get(name)
+        if change is None:
+            change = self._pending[name] = PeerChange(name, action, peer)
+        else:
+            change.merge(action, peer)
+        change.futures.append(future)
+        self._submitted += 1
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.debounce)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Apply all pending changes now"""
+        changes, self._pending = self._pending, {}
+        if not changes:
+            return
+
+        wireguard = self._wireguard
+        results = {}
+        changed: list[Peer] = []
+        removed: list[Peer] = []
+        async with wireguard._registry_lock:
+            try:
+                registry = await wireguard.get_registry()
+                for change in changes.values():
+                    try:
+                        results[change.name] = self._apply(registry, change, changed, removed)
+                    except Exception as e:
+                        logger.error(f"[-] change {change.action} of peer {change.name} failed: {e}")
+                        change.fail(e)
+                if changed or removed:
+                    await wireguard.save_registry()
+            except Exception as e:
+                # registry was changed in memory but not written, it is reloaded from file
+                wireguard._registry = None
+                logger.error(f"[-] batch of {len(changes)} peer changes failed: {e}")
+                for change in changes.values():
+                    change.fail(e)
+                return
+
+            # released only after the file no longer references them
+            for peer in removed:
+                if peer.address:
+                    wireguard._allocator.release(peer.address)
+            written_at = time.monotonic()
+            for change in changes.values():
+                if change.action == ADD and isinstance(results.get(change.name), Peer):
+                    self._added_at[change.name] = written_at
+            if len(self._added_at) > 1000:
+                self._forget_added(written_at - self.ADDED_TTL)
+
+            if changed or removed:
+                try:
+                    await wireguard.apply_peer_changes(registry, changed=changed, removed=removed)
+                except Exception as e:
+                    # changes are saved, the interface catches up with the file later
+                    logger.error(f"[-] peer changes batch not applied to interface: {e}")
+                    self._schedule_sync()
+
+        for change in changes.values():
+            if change.name in results:
+                change.resolve(results[change.name])
+        self._batches += 1
+        self._applied += len(changed) + len(removed)
+        logger.info(
+            f"[+] peer changes batch applied: {len(changed)} changed, {len(removed)} removed"
+        )
+
+    def added_within(self, seconds: float) -> set[str]:
+        """names of peers added by the bot during the last seconds (at most ADDED_TTL)"""
+        since = time.monotonic() - seconds
+        return {name for name, at in self._added_at.items() if at >= since}
+
+    def _forget_added(self, before: float) -> None:
+        self._added_at = {name: at for name, at in self._added_at.items() if at >= before}
+
+    def _schedule_sync(self) -> None:
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_later())
+
+    async def _sync_later(self) -> None:
+        """syncs the whole saved config to the interface, retried until it succeeds"""
+        delay = self.debounce
+        while True:
+            await asyncio.sleep(delay)
+            wireguard = self._wireguard
+            try:
+                async with wireguard._registry_lock:
+                    await wireguard.backend.sync(await wireguard.get_registry())
+                self._syncs += 1
+                logger.info("[+] interface synced with server config after failed apply")
+                break
+            except Exception as e:
+                delay = min(max(delay * 2, 1), 60)
+                logger.error(f"[-] interface sync failed: {e}, retrying in {delay}s")
+        self._sync_task = None
+
+    def _apply(
+        self,
+        registry: PeerRegistry,
+        change: PeerChange,
+        changed: list[Peer],
+        removed: list[Peer],
+    ):
+        if change.action == ADD:
+            changed.append(registry.add(change.peer))
+            return change.peer
+        if change.action == REMOVE:
+            peer = registry.remove(change.name)
+            if peer is not None:
+                removed.append(peer)
+            elif change.peer is not None:
+                # added and removed in the same batch, only the address must be freed
+                removed_address = change.peer.address
+                if removed_address:
+                    self._wireguard._allocator.release(removed_address)
+            return peer is not None
+        if change.action == DISABLE:
+            is_changed = registry.disable(change.name)
+        else:
+            is_changed = registry.enable(change.name)
+        if is_changed:
+            changed.append(registry.get(change.name))
+        return is_changed
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self._batches,
+            "submitted": self._submitted,
+            "applied": self._applied,
+            "syncs": self._syncs,
+        }
@@ -0,0 +1,142 @@
+"""Single writer of the server config file (wg0.conf)
+
+All writes go through one task, so two handlers can never interleave. Each write:
+- takes an exclusive flock on `wg0.conf.lock` (other processes, e.g. update scripts)
+- writes a temp file in the same directory and fsyncs it
+- keeps the previous file as `wg0.conf.bak.1` .. `wg0.conf.bak.N`
+- atomically replaces the config with os.replace
+"""
+
+import asyncio
+import fcntl
+import os
+import shutil
+import stat
+import tempfile
+
+from loguru import logger
+
+
+class ConfigWriter:
+    def __init__(self, path: str, backups: int = 3) -> None:
+        self.path = path
+        self.backups = backups
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._writes = 0
+        self._requests = 0
+
+    async def write(self, text: str) -> os.stat_result:
+        """Queue full config text, returns stat of the written file
+
+        Raises:
+            OSError: if the file could not be written, old file stays untouched
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        self._requests += 1
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            text, future = await self._queue.get()
+            futures = [future]
+            # every text is a full render of the registry, only the newest one matters
+            while not self._queue.empty():
+                text, future = self._queue.get_nowait()
+                futures.append(future)
+            try:
+                result = await loop.run_in_executor(None, self._write_file, text)
+                self._writes += 1
+            except Exception as e:
+                logger.error(f"[-] writing {self.path} failed: {e}")
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                for _ in futures:
+                    self._queue.task_done()
+
+    def _write_file(self, text: str) -> os.stat_result:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                fd, tmp_path = tempfile.mkstemp(
+                    prefix=f".{os.path.basename(self.path)}.", dir=directory
+                )
+                try:
+                    with os.fdopen(fd, "w") as tmp:
+                        tmp.write(text)
+                        tmp.flush()
+                        os.fsync(tmp.fileno())
+                    self._copy_owner_and_mode(tmp_path)
+                    self._rotate_backups()
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
+                self._fsync_directory(directory)
+                return os.stat(self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _copy_owner_and_mode(self, tmp_path: str) -> None:
+        """temp file is created with 0600, keep mode and owner of the current config"""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        os.chmod(tmp_path, stat.S_IMODE(current.st_mode))
+        try:
+            os.chown(tmp_path, current.st_uid, current.st_gid)
+        except PermissionError:
+            pass
+
+    def _rotate_backups(self) -> None:
+        if self.backups <= 0 or not os.path.exists(self.path):
+            return
+        for index in range(self.backups - 1, 0, -1):
+            backup = f"{self.path}.bak.{index}"
+            if os.path.exists(backup):
+                os.replace(backup, f"{self.path}.bak.{index + 1}")
+        first_backup = f"{self.path}.bak.1"
+        if os.path.exists(first_backup):
+            os.unlink(first_backup)
+        try:
+            # the config is replaced, not modified, so a hard link is a full copy
+            os.link(self.path, first_backup)
+        except OSError:
+            shutil.copy2(self.path, first_backup)
+
+    @staticmethod
+    def _fsync_directory(directory: str) -> None:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    async def close(self) -> None:
+        """Wait for queued writes and stop the writer task"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {"requests": self._requests, "writes": self._writes}